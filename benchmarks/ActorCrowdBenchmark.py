@@ -0,0 +1,112 @@
+"""Compares a crowd of ordinary Actors against an ActorCrowd.
+
+Usage: ActorCrowdBenchmark.py [numActors [model anim [numPhases]]]
+
+For each method it spawns numActors looping characters (1000 by
+default, using panda-model and panda-walk4), and reports the growth
+in resident memory, the construction time, and the time taken to
+animate all of them for one frame.  Each method is measured in a
+separate process, so that memory freed by one does not hide the cost
+of the other.  It checks that the crowd holds every member, in no more
+than numPhases poses."""
+
+from panda3d.core import *
+from direct.actor.Actor import Actor
+from direct.actor.ActorCrowd import ActorCrowd
+from timeit import default_timer
+import sys
+import os
+import subprocess
+
+from harness import check, runMain
+
+def run(args):
+    numActors = int((args[0:1] or [1000])[0])
+    modelName = (args[1:2] or ['panda-model'])[0]
+    animName = (args[2:3] or ['panda-walk4'])[0]
+    numPhases = int((args[3:4] or [8])[0])
+
+    if args[4:5]:
+        # We are the child process; measure one method.
+        method = args[4]
+        numFrames = 50
+
+        def getRSS():
+            try:
+                statm = open('/proc/self/statm').read().split()
+                return int(statm[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (IOError, OSError, ValueError):
+                import resource
+                return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        # Drive the clock by hand, so every frame advances the
+        # animations by the same amount.
+        clock = ClockObject.getGlobalClock()
+        clock.setMode(ClockObject.MSlave)
+        frameTime = 0.0
+        clock.setFrameTime(frameTime)
+
+        root = NodePath('root')
+
+        # Load the model and animation once before measuring, so
+        # that both methods start with them in the ModelPool.
+        Actor(modelName, {'anim' : animName}).cleanup()
+
+        baseRSS = getRSS()
+        start = default_timer()
+        if method == 'actor':
+            actors = []
+            for i in range(numActors):
+                actor = Actor(modelName, {'anim' : animName})
+                actor.reparentTo(root)
+                actor.setPos(i % 32, i // 32, 0)
+                actor.setPlayRate(1.0, 'anim')
+                actor.pose('anim', i % actor.getNumFrames('anim'))
+                actor.loop('anim', restart = 0)
+                actors.append(actor)
+            def update():
+                for actor in actors:
+                    actor.update()
+            numPoses = numActors
+        else:
+            crowd = ActorCrowd(modelName, {'anim' : animName},
+                               numPhases = numPhases)
+            for i in range(numActors):
+                member = crowd.spawn(root, 'anim',
+                                     phase = float(i % numPhases) / numPhases)
+                member.setPos(i % 32, i // 32, 0)
+            update = crowd.update
+            numPoses = crowd.getNumPoses()
+            check(crowd.getNumMembers() == numActors,
+                  'crowd has %s members' % (crowd.getNumMembers()))
+            check(numPoses <= numPhases, 'crowd has %s poses' % (numPoses))
+        constructTime = default_timer() - start
+        rss = getRSS() - baseRSS
+
+        start = default_timer()
+        for i in range(numFrames):
+            frameTime += 1.0 / 30.0
+            clock.setFrameTime(frameTime)
+            update()
+        frameCost = (default_timer() - start) / numFrames
+
+        print("%s %s %s %s" % (rss, constructTime, frameCost, numPoses))
+
+    else:
+        print("%s actors of %s looping %s" % (numActors, modelName, animName))
+        print("%-12s  %12s  %14s  %14s  %8s" % (
+            'method', 'RSS (MB)', 'construct (s)', 'frame (ms)', 'poses'))
+        for method in ('actor', 'crowd'):
+            try:
+                output = subprocess.check_output(
+                    [sys.executable, sys.argv[0], str(numActors), modelName,
+                     animName, str(numPhases), method])
+            except subprocess.CalledProcessError:
+                check(False, 'measuring %s failed' % (method))
+            rss, constructTime, frameCost, numPoses = output.split()[-4:]
+            print("%-12s  %12.1f  %14.3f  %14.3f  %8s" % (
+                method, int(rss) / 1048576.0, float(constructTime),
+                float(frameCost) * 1000.0, int(numPoses)))
+
+if __name__ == '__main__':
+    runMain(run)
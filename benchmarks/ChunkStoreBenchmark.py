@@ -0,0 +1,158 @@
+"""Compares the ways a client can update a package archive from one
+version to the next: downloading the whole compressed archive,
+applying a patch built by Patchfile, or fetching just the missing
+chunks from a ChunkStore.
+
+Usage: ChunkStoreBenchmark.py [oldArchive newArchive]
+
+The two archives are ordinarily two versions of the same package's
+multifile, e.g. as decompressed from the .pz files in two releases of
+an install directory.  If they are omitted, two versions of a
+multifile are built from the Python sources of the direct tree, with
+a few subfiles changed, one added and one removed between them.
+
+For each method it reports the bytes transferred and the time taken
+to rebuild the new archive on the client, and checks that each method
+produced a copy of the new archive."""
+
+from panda3d.core import *
+from direct.p3d.ChunkStore import ChunkStore
+from timeit import default_timer
+import os
+import shutil
+import tempfile
+
+from harness import check, runMain
+
+def run(args):
+    tempDir = tempfile.mkdtemp()
+    tempRoot = Filename.fromOsSpecific(tempDir)
+
+    def readFile(pathname):
+        f = open(pathname.toOsSpecific(), 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def makeMultifiles():
+        # Gather the source files of the direct tree, in a stable
+        # order.
+        import direct
+        topDir = os.path.dirname(os.path.abspath(direct.__file__))
+        sources = []
+        for dirpath, dirnames, filenames in os.walk(topDir, followlinks = True):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    pathname = os.path.join(dirpath, filename)
+                    sources.append((os.path.relpath(pathname, topDir).replace(os.sep, '/'), pathname))
+
+        def build(name, subfiles):
+            # The Multifile reads the subfiles when it is closed, so
+            # they have to stay on disk until then.
+            pathname = Filename(tempRoot, name)
+            stageDir = Filename(tempRoot, name + '.stage')
+            mf = Multifile()
+            mf.openWrite(pathname)
+            for i in range(len(subfiles)):
+                subfileName, data = subfiles[i]
+                stagePathname = Filename(stageDir, str(i))
+                stagePathname.setBinary()
+                stagePathname.makeDir()
+                f = open(stagePathname.toOsSpecific(), 'wb')
+                f.write(data)
+                f.close()
+                # Like the Packager, compress each subfile.
+                mf.addSubfile(subfileName, stagePathname, 6)
+            mf.close()
+            return pathname
+
+        subfiles = [(name, open(pathname, 'rb').read()) for name, pathname in sources]
+        oldPathname = build('old.mf', subfiles)
+
+        # The new version changes a few files in the middle, drops
+        # one and adds one.
+        step = len(subfiles) // 5
+        for i in range(step, len(subfiles), step):
+            name, data = subfiles[i]
+            subfiles[i] = (name, data + b'\n# changed\n')
+        del subfiles[len(subfiles) // 2]
+        subfiles.insert(len(subfiles) // 3, ('added.py', b'print("new")\n' * 1000))
+        newPathname = build('new.mf', subfiles)
+        return oldPathname, newPathname
+
+    if len(args) >= 2:
+        oldPathname = Filename.fromOsSpecific(args[0])
+        newPathname = Filename.fromOsSpecific(args[1])
+    else:
+        oldPathname, newPathname = makeMultifiles()
+
+    print("old archive: %s bytes" % (oldPathname.getFileSize()))
+    print("new archive: %s bytes" % (newPathname.getFileSize()))
+    results = []
+
+    # 1. Download the whole new archive, and uncompress it.
+    compressedPathname = Filename(tempRoot, 'new.mf.pz')
+    compressFile(newPathname, compressedPathname, 6)
+    start = default_timer()
+    decompressFile(compressedPathname, Filename(tempRoot, 'full.mf'))
+    results.append(('full', compressedPathname.getFileSize(),
+                    default_timer() - start))
+
+    # 2. Download a patch, and apply it.
+    patchPathname = Filename(tempRoot, 'new.mf.patch')
+    start = default_timer()
+    Patchfile().build(oldPathname, newPathname, patchPathname)
+    buildTime = default_timer() - start
+    compressFile(patchPathname, Filename(patchPathname + '.pz'), 9)
+    start = default_timer()
+    Patchfile().apply(patchPathname, oldPathname, Filename(tempRoot, 'patched.mf'))
+    results.append(('patch', Filename(patchPathname + '.pz').getFileSize(),
+                    default_timer() - start))
+    print("patch built in %.2f s" % (buildTime))
+
+    # 3. Fetch the missing chunks, and rebuild from those and the old
+    # archive.  The host's store has both versions; the client has
+    # the old archive and its manifest.
+    hostStore = ChunkStore(Filename(tempRoot, 'host'))
+    start = default_timer()
+    oldManifest = hostStore.addFile(oldPathname)
+    newManifest = hostStore.addFile(newPathname)
+    chunkTime = (default_timer() - start) / 2
+    print("chunked each archive in %.2f s, %s chunks in new version" % (
+        chunkTime, len(newManifest.chunks)))
+
+    manifestPathname = Filename(tempRoot, 'new.mf.chunks.xml')
+    newManifest.writeFile(manifestPathname)
+
+    clientStore = ChunkStore(Filename(tempRoot, 'client'))
+    missing = clientStore.getMissingChunks(newManifest, oldManifest.getChunkHashes())
+    transferred = manifestPathname.getFileSize()
+    for chunk in missing:
+        pathname = clientStore.getChunkPathname(chunk.hash)
+        pathname.makeDir()
+        hostStore.getChunkPathname(chunk.hash).copyTo(pathname)
+        transferred += chunk.storedSize
+
+    start = default_timer()
+    rebuiltPathname = Filename(tempRoot, 'rebuilt.mf')
+    rebuilt = clientStore.rebuildFile(newManifest, rebuiltPathname,
+                                      oldPathname, oldManifest)
+    results.append(('chunks', transferred, default_timer() - start))
+    check(rebuilt, 'could not rebuild the new archive from chunks')
+
+    newData = readFile(newPathname)
+    for name in ['full.mf', 'patched.mf', 'rebuilt.mf']:
+        check(readFile(Filename(tempRoot, name)) == newData,
+              '%s differs from the new archive' % (name))
+    print("%s of %s chunks missing" % (len(missing), len(newManifest.getUniqueChunks())))
+
+    print("%-8s  %14s  %12s" % ('method', 'transfer (KB)', 'rebuild (ms)'))
+    for method, transferred, rebuildTime in results:
+        print("%-8s  %14.1f  %12.1f" % (method, transferred / 1024.0,
+                                          rebuildTime * 1000.0))
+
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
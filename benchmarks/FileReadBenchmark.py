@@ -0,0 +1,140 @@
+"""Measures the time to read whole files through direct.stdpy.file,
+from disk and from a multifile.
+
+Usage: FileReadBenchmark.py [sizeMB ...]
+
+For each size (1, 10 and 100 megabytes by default), a file of random
+data is written to disk, and stored uncompressed in a multifile.  It
+is then read from each place with read(), with readinto() into a
+bytearray, and with readFileMapped(); the mapped buffer is also
+measured with every page of it touched, since it is only read from
+disk as it is used.  For comparison, the file on disk is also read
+with Python's own open(), and the file is read in 512-byte pieces, as
+read() used to do, for the sizes where that finishes in reasonable
+time.  Each time is the best of three.  It checks that every method
+returns the data that was written, and that readFileMapped() raises
+IOError for a file that is not there."""
+
+from panda3d.core import Filename, Multifile, VirtualFileSystem, StreamReader
+from direct.stdpy import file
+from timeit import default_timer
+import os
+import io
+import shutil
+import tempfile
+
+from harness import check, runMain
+
+def run(args):
+    sizes = [float(arg) for arg in args] or [1, 10, 100]
+
+    # The old read loop copies everything read so far for each piece,
+    # so it is skipped for files larger than this.
+    maxOldReadSize = 10 * 1024 * 1024
+
+    tempDir = tempfile.mkdtemp()
+    vfs = VirtualFileSystem.getGlobalPtr()
+
+    def oldRead(pathname):
+        stream = vfs.openReadFile(Filename.fromOsSpecific(pathname), False)
+        reader = StreamReader(stream, False)
+        result = b''
+        while not stream.eof():
+            result += reader.extractBytes(512)
+        vfs.closeReadFile(stream)
+        return result
+
+    def read(pathname):
+        f = file.open(pathname, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def readinto(pathname):
+        buffer = bytearray(vfs.getFile(Filename.fromOsSpecific(pathname)).getFileSize())
+        f = file.open(pathname, 'rb')
+        f.readinto(buffer)
+        f.close()
+        return buffer
+
+    def mapped(pathname):
+        return file.readFileMapped(pathname)
+
+    def mappedTouched(pathname):
+        view = file.readFileMapped(pathname)
+        # Reading one byte of every page brings it all in from disk.
+        bytes(view[::4096])
+        return view
+
+    def builtinRead(pathname):
+        f = io.open(pathname, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def timeRead(func, pathname, data):
+        best = None
+        for i in range(3):
+            start = default_timer()
+            result = func(pathname)
+            elapsed = default_timer() - start
+            check(len(result) == len(data), '%s returned %s bytes, expected %s' % (
+                func.__name__, len(result), len(data)))
+            best = min(best or elapsed, elapsed)
+        check(bytes(result) == data, '%s returned the wrong data' % (func.__name__))
+        del result
+        return best
+
+    try:
+        file.readFileMapped(os.path.join(tempDir, 'missing.bin'))
+    except IOError:
+        pass
+    else:
+        check(False, 'readFileMapped() did not raise IOError for a missing file')
+
+    print("%8s  %-10s  %-16s  %10s  %10s" % (
+        'size MB', 'source', 'method', 'time (ms)', 'MB/s'))
+    for sizeMB in sizes:
+        size = int(sizeMB * 1024 * 1024)
+        data = os.urandom(size)
+
+        diskPathname = os.path.join(tempDir, 'data.bin')
+        f = io.open(diskPathname, 'wb')
+        f.write(data)
+        f.close()
+
+        mfPathname = os.path.join(tempDir, 'data.mf')
+        mf = Multifile()
+        mf.openWrite(Filename.fromOsSpecific(mfPathname))
+        mf.addSubfile('data.bin', Filename.binaryFilename(Filename.fromOsSpecific(diskPathname)), 0)
+        mf.close()
+        mf = Multifile()
+        mf.openRead(Filename.fromOsSpecific(mfPathname))
+        mountPoint = Filename.fromOsSpecific(os.path.join(tempDir, 'mf'))
+        vfs.mount(mf, mountPoint, vfs.MFReadOnly)
+        mfDataPathname = os.path.join(tempDir, 'mf', 'data.bin')
+
+        methods = [('read()', read),
+                   ('readinto()', readinto),
+                   ('readFileMapped()', mapped),
+                   ('mapped, touched', mappedTouched)]
+        if size <= maxOldReadSize:
+            methods.append(('old read()', oldRead))
+
+        for source, pathname in (('disk', diskPathname), ('multifile', mfDataPathname)):
+            sourceMethods = methods
+            if source == 'disk':
+                sourceMethods = methods + [('io.open().read()', builtinRead)]
+            for name, func in sourceMethods:
+                elapsed = timeRead(func, pathname, data)
+                print("%8g  %-10s  %-16s  %10.2f  %10.1f" % (
+                    sizeMB, source, name, elapsed * 1000.0,
+                    sizeMB / max(elapsed, 1e-9)))
+
+        vfs.unmount(mf)
+        del mf
+
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
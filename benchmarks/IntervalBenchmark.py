@@ -0,0 +1,125 @@
+"""Measures the cost of playing many Python-based intervals at once.
+
+Usage: IntervalBenchmark.py [numIntervals [numActors]]
+
+It starts numIntervals looping ActorIntervals (10000 by default),
+spread over numActors Actors of panda-model playing panda-walk4 (100
+by default), and reports the average cost of starting one, the cost
+of stepping all of them for one frame, and the average cost of
+finishing one.  The intervals are played once through the ivalMgr,
+which is how Interval.start() plays them, and once with one task per
+interval, which is how they used to be played.  It checks that both
+ways advance every interval by the same amount each frame, and that
+finishing them leaves nothing playing."""
+
+from panda3d.core import *
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.task.Task import Task, TaskManager
+from direct.interval.IntervalManager import ivalMgr
+from direct.interval.ActorInterval import ActorInterval
+from direct.actor.Actor import Actor
+from timeit import default_timer
+
+from harness import check, runMain
+
+def run(args):
+    numIntervals = int((args[0:1] or [10000])[0])
+    numActors = int((args[1:2] or [100])[0])
+    numFrames = 50
+
+    # Without a ShowBase, nobody has set this up.
+    TaskManager.taskTimerVerbose = 0
+
+    # Drive the clock by hand, so every frame advances the intervals
+    # by the same amount.
+    clock = ClockObject.getGlobalClock()
+    clock.setMode(ClockObject.MSlave)
+    clockTime = [0.0]
+
+    def nextFrame():
+        clockTime[0] += 1.0 / 30.0
+        clock.setFrameTime(clockTime[0])
+
+    actors = []
+    for i in range(numActors):
+        actor = Actor('panda-model', {'walk' : 'panda-walk4'})
+        actors.append(actor)
+
+    def makeIntervals():
+        return [ActorInterval(actors[i % numActors], 'walk', loop = 1,
+                              duration = 60.0)
+                for i in range(numIntervals)]
+
+    def startManaged(ival):
+        ival.loop()
+
+    def stepManaged():
+        nextFrame()
+        # This is what the ivalLoop task does each frame.
+        ivalMgr.step()
+
+    def finishManaged(ival):
+        ival.finish()
+
+    # The old way: each playing interval has its own task.
+    def playTask(task):
+        again = task.interval.stepPlay()
+        task.interval.privPostEvent()
+        if again:
+            return task.cont
+        return task.done
+
+    def startTask(ival):
+        ival.setupPlay(0.0, -1.0, 1.0, 1)
+        task = Task(playTask)
+        task.interval = ival
+        taskMgr.add(task, ival.getName() + '-play')
+
+    def stepTask():
+        nextFrame()
+        taskMgr.step()
+
+    def finishTask(ival):
+        taskMgr.remove(ival.getName() + '-play')
+        ival.privFinalize()
+
+    def measure(start, step, finish):
+        ivals = makeIntervals()
+
+        begin = default_timer()
+        for ival in ivals:
+            start(ival)
+        startTime = default_timer() - begin
+
+        begin = default_timer()
+        for i in range(numFrames):
+            step()
+        frameTime = (default_timer() - begin) / numFrames
+
+        expected = numFrames / 30.0
+        for ival in ivals:
+            check(abs(ival.getT() - expected) < 0.001,
+                  '%s is at %s, not %s' % (ival.getName(), ival.getT(), expected))
+
+        begin = default_timer()
+        for ival in ivals:
+            finish(ival)
+        finishTime = default_timer() - begin
+        check(ivalMgr.getNumPlayingIntervals() == 0, 'intervals still playing')
+        check(not [ival for ival in ivals if ival.isPlaying()],
+              'intervals still playing')
+        return startTime, frameTime, finishTime
+
+    print("%s ActorIntervals on %s actors" % (numIntervals, numActors))
+    print("%-10s  %12s  %12s  %12s" % (
+        'method', 'start (us)', 'frame (ms)', 'finish (us)'))
+    for method, start, step, finish in (
+        ('tasks', startTask, stepTask, finishTask),
+        ('ivalMgr', startManaged, stepManaged, finishManaged)):
+        startTime, frameTime, finishTime = measure(start, step, finish)
+        print("%-10s  %12.3f  %12.3f  %12.3f" % (
+            method, startTime * 1000000.0 / numIntervals,
+            frameTime * 1000.0, finishTime * 1000000.0 / numIntervals))
+
+if __name__ == '__main__':
+    runMain(run)
@@ -0,0 +1,73 @@
+"""Measures Messenger.send() throughput with increasing numbers of
+listeners, with and without compiled dispatch and single-threaded
+mode, and prints an events/sec report.  Each listener's handler must
+be called once per event, with the event's arguments, in every mode.
+
+Usage: MessengerBenchmark.py"""
+
+from harness import check, runMain
+
+def run(args):
+    from direct.showbase.Messenger import Messenger
+    from timeit import default_timer
+
+    numListeners = (1, 10, 100, 1000)
+    minEventsPerTest = 10000
+    batchSize = 100
+
+    class Listener:
+        def __init__(self):
+            self.count = 0
+            self.lastArgs = None
+
+        def handle(self, *args):
+            self.count += 1
+            self.lastArgs = args
+
+    def runSend(msgr, numEvents):
+        send = msgr.send
+        start = default_timer()
+        for i in range(numEvents):
+            send('benchmarkEvent', [i])
+        return default_timer() - start
+
+    def runSendMany(msgr, numEvents):
+        batch = [('benchmarkEvent', [i]) for i in range(batchSize)]
+        sendMany = msgr.sendMany
+        start = default_timer()
+        for i in range(numEvents // batchSize):
+            sendMany(batch)
+        return default_timer() - start
+
+    print("%10s  %14s  %14s  %14s  %14s" % (
+        'listeners', 'send', 'compiled send', 'compiled batch',
+        'single-thread'))
+    for count in numListeners:
+        msgr = Messenger()
+        listeners = [Listener() for i in range(count)]
+        for listener in listeners:
+            msgr.accept('benchmarkEvent', listener, listener.handle, ['extra'])
+
+        # Keep the total number of handler calls per test roughly
+        # constant, so each row takes about the same amount of time.
+        numEvents = max(minEventsPerTest // count, batchSize)
+        numEvents -= numEvents % batchSize
+
+        results = []
+        msgr.setCompiledDispatch(False)
+        results.append(numEvents / runSend(msgr, numEvents))
+        msgr.setCompiledDispatch(True)
+        results.append(numEvents / runSend(msgr, numEvents))
+        results.append(numEvents / runSendMany(msgr, numEvents))
+        msgr.setSingleThreaded(True)
+        results.append(numEvents / runSend(msgr, numEvents))
+
+        for listener in listeners:
+            check(listener.count == numEvents * 4,
+                  'listener called %s times, not %s' % (listener.count, numEvents * 4))
+            check(listener.lastArgs == ('extra', numEvents - 1),
+                  'listener got %r' % (listener.lastArgs,))
+        print("%10s  %14.0f  %14.0f  %14.0f  %14.0f" % tuple([count] + results))
+
+if __name__ == '__main__':
+    runMain(run)
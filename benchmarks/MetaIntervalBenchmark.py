@@ -0,0 +1,92 @@
+"""Compares the cost of building a MetaInterval from scratch against
+instantiating it from a MetaIntervalTemplate.
+
+Usage: MetaIntervalBenchmark.py [numGroups [numBuilds]]
+
+numGroups is the number of groups of five intervals in the sequence
+(the default, 10, makes a 50-interval sequence), and numBuilds is the
+number of times to build it (1000 by default).  Both are measured up
+to the point where the C++ timeline has been built, which normally
+happens when the interval is first started.  It checks that the
+instantiated sequence has the same duration as the one built from
+scratch, and puts its target in the same state at each point."""
+
+from panda3d.core import *
+from direct.task.Task import TaskManager
+from direct.interval.IntervalGlobal import *
+from timeit import default_timer
+
+from harness import check, runMain
+
+def run(args):
+    numGroups = int((args[0:1] or [10])[0])
+    numBuilds = int((args[1:2] or [1000])[0])
+
+    # Without a ShowBase, nobody has set this up.
+    TaskManager.taskTimerVerbose = 0
+
+    def hit(target):
+        pass
+
+    def build(target):
+        groups = []
+        for i in range(numGroups):
+            groups.append(Sequence(
+                LerpPosInterval(target, 0.1, Point3(0, 0, i)),
+                LerpHprInterval(target, 0.1, Vec3(i * 10, 0, 0)),
+                Parallel(LerpScaleInterval(target, 0.2, 1.0 + i * 0.1),
+                         Func(hit, target)),
+                Wait(0.05)))
+        return Sequence(*groups)
+
+    param = TemplateParam('target')
+    wait = Wait(0.05)
+    groups = []
+    for i in range(numGroups):
+        groups.append(Sequence(
+            TemplateInterval(LerpPosInterval, param, 0.1, Point3(0, 0, i)),
+            TemplateInterval(LerpHprInterval, param, 0.1, Vec3(i * 10, 0, 0)),
+            Parallel(TemplateInterval(LerpScaleInterval, param, 0.2, 1.0 + i * 0.1),
+                     TemplateInterval(Func, hit, param)),
+            wait))
+
+    start = default_timer()
+    template = MetaIntervalTemplate(Sequence(*groups))
+    compileTime = default_timer() - start
+
+    targets = [NodePath('target-%s' % (i)) for i in range(numBuilds)]
+
+    def measure(make):
+        start = default_timer()
+        for target in targets:
+            # getDuration() builds the C++ timeline.
+            make(target).getDuration()
+        return (default_timer() - start) / numBuilds
+
+    buildTime = measure(build)
+    instantiateTime = measure(lambda target: template.instantiate(target = target))
+    durations = (build(targets[0]).getDuration(),
+                 template.instantiate(target = targets[0]).getDuration())
+    check(abs(durations[0] - durations[1]) < 0.0001,
+          'durations differ: %s' % (durations,))
+
+    builtTarget = NodePath('built')
+    templateTarget = NodePath('template')
+    built = build(builtTarget)
+    instance = template.instantiate(target = templateTarget)
+    t = 0.0
+    while t < durations[0]:
+        built.setT(t)
+        instance.setT(t)
+        check(builtTarget.getMat().almostEqual(templateTarget.getMat(), 0.0001),
+              'targets differ at %s' % (t))
+        t += 0.03
+
+    print("%s-interval sequence, %s builds; template compiled in %.3f ms" % (
+        numGroups * 5, numBuilds, compileTime * 1000.0))
+    print("%-12s  %12s" % ('method', 'build (us)'))
+    print("%-12s  %12.1f" % ('Sequence', buildTime * 1000000.0))
+    print("%-12s  %12.1f" % ('template', instantiateTime * 1000000.0))
+
+if __name__ == '__main__':
+    runMain(run)
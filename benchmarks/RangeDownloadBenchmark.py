@@ -0,0 +1,200 @@
+"""Compares downloading a package archive in one stream from one URL
+with downloading it in ranges from several mirrors at once, through a
+RangeDownloader.
+
+Usage: RangeDownloadBenchmark.py [sizeMB [rateKB]]
+
+The mirrors are local HTTP servers, each serving the same fixture file
+of sizeMB megabytes (16 by default), limited to rateKB kilobytes per
+second per connection (4096 by default) to stand in for the link to a
+real mirror.  One more server serves corrupted data, which the
+RangeDownloader should detect and stop using.  Finally, a download is
+interrupted halfway through and resumed.
+
+For each method it reports the bytes transferred, the elapsed time and
+the throughput.  It checks that each download is a copy of the
+fixture, that no data from the corrupted server was accepted, and that
+the resumed download fetched only the missing ranges."""
+
+from panda3d.core import *
+from direct.p3d.FileSpec import FileSpec
+from direct.p3d.RangeDownloader import RangeDownloader
+from timeit import default_timer
+import re
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from harness import check, runMain
+
+def run(args):
+    fileSize = int(float((args[0:1] or [16])[0]) * 1024 * 1024)
+    rate = int((args[1:2] or [4096])[0]) * 1024
+    rangeSize = 1024 * 1024
+
+    tempDir = tempfile.mkdtemp()
+    tempRoot = Filename.fromOsSpecific(tempDir)
+
+    # The fixture: incompressible data, like a compressed archive.
+    fixturePathname = Filename(tempRoot, 'fixture.mf.pz')
+    rnd = random.Random(1)
+    f = open(fixturePathname.toOsSpecific(), 'wb')
+    f.write(bytes(bytearray(rnd.getrandbits(8) for i in range(fileSize))))
+    f.close()
+    fixtureData = open(fixturePathname.toOsSpecific(), 'rb').read()
+
+    fileSpec = FileSpec()
+    fileSpec.fromFile(tempRoot, 'fixture.mf.pz')
+    fileSpec.readRangeHashes(fixturePathname, rangeSize)
+
+    class Handler(BaseHTTPRequestHandler):
+        """ Serves the fixture, honoring a Range header, at no more
+        than rate bytes per second. """
+
+        protocol_version = 'HTTP/1.1'
+        corrupt = False
+
+        def do_GET(self):
+            start, end = 0, len(fixtureData) - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+            if match:
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), end)
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, end, len(fixtureData)))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            blockSize = 16384
+            begin = time.time()
+            sent = 0
+            pos = start
+            while pos <= end:
+                data = fixtureData[pos : min(pos + blockSize, end + 1)]
+                if self.corrupt:
+                    data = data[::-1]
+                self.wfile.write(data)
+                pos += len(data)
+                sent += len(data)
+                delay = begin + float(sent) / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+        def log_message(self, *args):
+            pass
+
+    class CorruptHandler(Handler):
+        corrupt = True
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # The client hung up early; that's expected.
+            pass
+
+    def startServer(handler):
+        server = Server(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target = server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        return 'http://127.0.0.1:%s/fixture.mf.pz' % (server.server_address[1])
+
+    mirrors = [startServer(Handler) for i in range(3)]
+    badMirror = startServer(CorruptHandler)
+
+    http = HTTPClient()
+    results = []
+
+    def verify(pathname):
+        check(fileSpec.fullVerify(pathname = pathname),
+              '%s does not match its FileSpec' % (pathname))
+        f = open(pathname.toOsSpecific(), 'rb')
+        data = f.read()
+        f.close()
+        check(data == fixtureData, '%s differs from the fixture' % (pathname))
+
+    # 1. One stream from one URL, as PackageInfo used to do it.
+    pathname = Filename(tempRoot, 'single.mf.pz')
+    pathname.setBinary()
+    start = default_timer()
+    channel = http.makeChannel(False)
+    channel.beginGetDocument(DocumentSpec(mirrors[0]))
+    channel.downloadToFile(pathname)
+    while channel.run():
+        time.sleep(0.001)
+    results.append(('single', fileSize, default_timer() - start))
+    verify(pathname)
+
+    def download(name, urls, maxConnections, stopAt = None):
+        pathname = Filename(tempRoot, name + '.mf.pz')
+        downloader = RangeDownloader(http, urls, fileSpec, pathname,
+                                     maxConnections = maxConnections)
+        start = default_timer()
+        for token in downloader.downloadGenerator():
+            if token is True or token is False:
+                break
+            if stopAt is not None and downloader.bytesDone >= stopAt:
+                # Simulate a crash, leaving the partial file behind.
+                return downloader
+            time.sleep(0.001)
+        check(token is True, '%s download failed' % (name))
+        results.append((name, downloader.getBytesDownloaded(), default_timer() - start))
+        verify(pathname)
+
+        # Each range is counted once, against the source it was
+        # accepted from.
+        check(downloader.getBytesDownloaded() == fileSize - downloader.bytesResumed,
+              '%s downloaded %s bytes, expected %s' % (
+            name, downloader.getBytesDownloaded(), fileSize - downloader.bytesResumed))
+        accepted = sum([source.bytesDownloaded for source in downloader.sources])
+        check(accepted == downloader.getBytesDownloaded(),
+              '%s accepted %s bytes from its sources, but downloaded %s' % (
+            name, accepted, downloader.getBytesDownloaded()))
+        return downloader
+
+    # 2. Ranges from one URL, on four connections.
+    downloader = download('ranges-1', mirrors[:1], 4)
+    check(downloader.bytesResumed == 0, 'ranges-1 resumed a download')
+
+    # 3. Ranges from three good mirrors and one bad one.
+    downloader = download('ranges-3', [badMirror] + mirrors, 6)
+    bad = downloader.sources[0]
+    print("bad mirror: %s failures, %s bytes accepted" % (
+        bad.numFailures, bad.bytesDownloaded))
+    check(bad.bytesDownloaded == 0,
+          'accepted %s bytes from the bad mirror' % (bad.bytesDownloaded))
+    check(bad.numFailures >= RangeDownloader.maxFailures,
+          'the bad mirror was not dropped')
+
+    # 4. Interrupt a download halfway, and resume it.
+    download('resume', mirrors, 6, stopAt = fileSize // 2)
+    downloader = download('resume', mirrors, 6)
+    print("resumed after %s of %s bytes" % (downloader.bytesResumed, fileSize))
+    check(fileSize // 2 <= downloader.bytesResumed < fileSize,
+          'resumed after %s bytes, expected at least %s' % (
+        downloader.bytesResumed, fileSize // 2))
+
+    print("%s MB archive in %s ranges, %s KB/s per connection" % (
+        fileSize // (1024 * 1024), len(fileSpec.rangeHashes), rate // 1024))
+    print("%-10s  %14s  %10s  %12s" % ('method', 'transfer (KB)', 'time (s)', 'rate (KB/s)'))
+    for method, transferred, elapsed in results:
+        print("%-10s  %14.1f  %10.2f  %12.1f" % (
+            method, transferred / 1024.0, elapsed, transferred / 1024.0 / elapsed))
+
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
@@ -0,0 +1,169 @@
+"""Load test for the zone broadcast path of ServerRepository.  This
+starts a ServerRepository on a loopback port, connects a number of
+simulated clients that all have interest in the same zone, and has
+each of them send a stream of broadcast updates on an object of its
+own.  It reports the number of updates delivered per second and the
+latency of those deliveries.  If "coalesce" is given, the updates are
+sent on a field with the coalesce keyword.  It checks that each update
+reaches every other client, or with coalesce, that no more than that
+are delivered.
+
+Usage: ServerRepositoryLoadTest.py [numClients [seconds [updatesPerFrame [coalesce]]]]
+"""
+
+from panda3d.core import *
+from direct.showbase.ShowBase import ShowBase
+from direct.distributed.ServerRepository import ServerRepository
+from direct.distributed.PyDatagram import PyDatagram
+from direct.distributed.MsgTypesCMU import *
+import os
+import tempfile
+
+from harness import check, runMain
+
+def run(args):
+    numClients = int((args[0:1] or [50])[0])
+    duration = float((args[1:2] or [5.0])[0])
+    updatesPerFrame = int((args[2:3] or [1])[0])
+    keywords = 'broadcast'
+    if args[3:4] == ['coalesce']:
+        keywords = 'broadcast coalesce'
+    tcpPort = 46667
+    zoneId = 100
+
+    ShowBase(windowType = 'none')
+
+    dcText = (
+        'keyword broadcast;\n'
+        'keyword coalesce;\n'
+        'dclass LoadTestObject {\n'
+        '  setPayload(float64 timestamp, blob data) %s;\n'
+        '};\n' % (keywords))
+    dcHandle, dcPathname = tempfile.mkstemp(suffix = '.dc')
+    os.write(dcHandle, dcText.encode('ascii'))
+    os.close(dcHandle)
+
+    server = ServerRepository(tcpPort, '127.0.0.1',
+                              dcFileNames = [Filename.fromOsSpecific(dcPathname).getFullpath()])
+    os.unlink(dcPathname)
+    dclass = server.dcFile.getClassByName('LoadTestObject')
+    fieldId = dclass.getFieldByName('setPayload').getNumber()
+
+    class LoadTestClient:
+        def __init__(self, qcm, reader, writer):
+            self.writer = writer
+            self.connection = qcm.openTCPClientConnection('127.0.0.1', tcpPort, 3000)
+            check(self.connection, "could not connect to server")
+            reader.addConnection(self.connection)
+            self.doIdBase = None
+            self.doId = None
+
+        def send(self, datagram):
+            self.writer.send(datagram, self.connection)
+
+        def startUpdates(self):
+            datagram = PyDatagram()
+            datagram.addUint16(CLIENT_SET_INTEREST_CMU)
+            datagram.addUint32(zoneId)
+            self.send(datagram)
+
+            self.doId = self.doIdBase
+            datagram = PyDatagram()
+            datagram.addUint16(CLIENT_OBJECT_GENERATE_CMU)
+            datagram.addUint32(zoneId)
+            datagram.addUint16(dclass.getNumber())
+            datagram.addUint32(self.doId)
+            self.send(datagram)
+
+        def sendUpdate(self, payload):
+            datagram = PyDatagram()
+            datagram.addUint16(CLIENT_OBJECT_UPDATE_FIELD)
+            datagram.addUint32(self.doId)
+            datagram.addUint16(fieldId)
+            datagram.addFloat64(globalClock.getRealTime())
+            datagram.addBlob(payload)
+            self.send(datagram)
+
+    qcm = QueuedConnectionManager()
+    reader = QueuedConnectionReader(qcm, 0)
+    writer = ConnectionWriter(qcm, 0)
+    clients = []
+    for i in range(numClients):
+        clients.append(LoadTestClient(qcm, reader, writer))
+        # Let the server accept it, so we don't overflow its backlog.
+        taskMgr.step()
+    clientsByConnection = dict([(c.connection, c) for c in clients])
+
+    latencies = []
+    def pollClients():
+        datagram = NetDatagram()
+        while reader.dataAvailable():
+            if not reader.getData(datagram):
+                continue
+            dgi = DatagramIterator(datagram)
+            msgType = dgi.getUint16()
+            if msgType == SET_DOID_RANGE_CMU:
+                client = clientsByConnection[datagram.getConnection()]
+                client.doIdBase = dgi.getUint32()
+            elif msgType == OBJECT_UPDATE_FIELD_CMU:
+                dgi.getUint32()   # sender doIdBase
+                dgi.getUint32()   # doId
+                dgi.getUint16()   # fieldId
+                latencies.append(globalClock.getRealTime() - dgi.getFloat64())
+
+    # Wait for all of the clients to be assigned their doId ranges.
+    while [c for c in clients if c.doIdBase is None]:
+        taskMgr.step()
+        pollClients()
+
+    for client in clients:
+        client.startUpdates()
+    for i in range(10):
+        taskMgr.step()
+        pollClients()
+    del latencies[:]
+
+    payload = b'x' * 32
+    numFrames = 0
+    startTime = globalClock.getRealTime()
+    while globalClock.getRealTime() - startTime < duration:
+        for client in clients:
+            for i in range(updatesPerFrame):
+                client.sendUpdate(payload)
+        taskMgr.step()
+        pollClients()
+        numFrames += 1
+    elapsed = globalClock.getRealTime() - startTime
+    numDelivered = len(latencies)
+
+    # Let the updates still in flight arrive, and check that they all
+    # got through.
+    numSent = numClients * updatesPerFrame * numFrames
+    lastCount = -1
+    while len(latencies) != lastCount:
+        lastCount = len(latencies)
+        for i in range(10):
+            taskMgr.step()
+            pollClients()
+    expected = numSent * (numClients - 1)
+    if keywords == 'broadcast':
+        check(len(latencies) == expected,
+              '%s updates delivered, not %s' % (len(latencies), expected))
+    else:
+        check(0 < len(latencies) <= expected,
+              '%s coalesced updates delivered, of %s' % (len(latencies), expected))
+    del latencies[numDelivered:]
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))] * 1000.0
+
+    print("%s clients in one zone, %s frames in %.2f s" % (numClients, numFrames, elapsed))
+    print("updates sent:      %10.0f / s" % (numSent / elapsed))
+    print("updates delivered: %10.0f / s" % (numDelivered / elapsed))
+    if latencies:
+        print("latency:  p50 %.2f ms  p99 %.2f ms  max %.2f ms" % (
+            percentile(50), percentile(99), latencies[-1] * 1000.0))
+
+if __name__ == '__main__':
+    runMain(run)
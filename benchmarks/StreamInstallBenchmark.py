@@ -0,0 +1,204 @@
+"""Measures the time and the peak disk usage of installing a large
+package from a host, with and without streaming the download through
+decompression.
+
+Usage: StreamInstallBenchmark.py [sizeMB]
+
+A package whose archive is sizeMB megabytes (64 by default) before
+compression is built into a temporary install directory, which is
+served by a local HTTP server.  It is then installed into an empty
+host directory through HostInfo and PackageInfo, once for each
+combination of package-stream-install and package-download-connections,
+and the client's host directory is measured at every step.  It checks
+that each installed archive is correct, and that the streaming installs
+never keep the compressed and uncompressed archives on disk together."""
+
+from panda3d.core import *
+from direct.p3d.FileSpec import FileSpec
+from direct.p3d.HostInfo import HostInfo
+from direct.task.Task import TaskManager
+from timeit import default_timer
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from harness import check, runMain
+
+def run(args):
+    archiveSize = int(float((args[0:1] or [64])[0]) * 1024 * 1024)
+
+    # Without a ShowBase, nobody has set this up.
+    TaskManager.taskTimerVerbose = 0
+
+    tempDir = tempfile.mkdtemp()
+    tempRoot = Filename.fromOsSpecific(tempDir)
+    installDir = Filename(tempRoot, 'install')
+    packageDir = Filename(installDir, 'bigpkg/1.0')
+
+    def buildPackage():
+        # Half of each subfile is random, and the other half is easily
+        # compressed, so the archive shrinks by about half.
+        mfPathname = Filename(packageDir, 'bigpkg.mf')
+        mfPathname.makeDir()
+        stageDir = Filename(tempRoot, 'stage')
+        mf = Multifile()
+        mf.openWrite(mfPathname)
+        subfileSize = 1024 * 1024
+        for i in range(archiveSize // subfileSize):
+            stagePathname = Filename(stageDir, str(i))
+            stagePathname.setBinary()
+            stagePathname.makeDir()
+            f = open(stagePathname.toOsSpecific(), 'wb')
+            f.write(os.urandom(subfileSize // 2))
+            f.write((('subfile %s ' % (i)).encode('ascii') * subfileSize)[:subfileSize // 2])
+            f.close()
+            mf.addSubfile('subfile%s.bin' % (i), stagePathname, 0)
+        mf.close()
+        shutil.rmtree(stageDir.toOsSpecific())
+
+        pzPathname = Filename(packageDir, 'bigpkg.mf.pz')
+        compressFile(mfPathname, pzPathname, 6)
+
+        uncompressed = FileSpec()
+        uncompressed.fromFile(packageDir, 'bigpkg.mf')
+        compressed = FileSpec()
+        compressed.fromFile(packageDir, 'bigpkg.mf.pz')
+        compressed.readRangeHashes(pzPathname, 1024 * 1024)
+        mfPathname.unlink()
+
+        doc = TiXmlDocument(Filename(packageDir, 'bigpkg.xml').toOsSpecific())
+        xpackage = TiXmlElement('package')
+        xpackage.SetAttribute('name', 'bigpkg')
+        xpackage.SetAttribute('version', '1.0')
+        for element, spec in (('uncompressed_archive', uncompressed),
+                              ('compressed_archive', compressed)):
+            xarchive = TiXmlElement(element)
+            spec.storeXml(xarchive)
+            xpackage.InsertEndChild(xarchive)
+        doc.InsertEndChild(xpackage)
+        doc.SaveFile()
+
+        desc = FileSpec()
+        desc.fromFile(installDir, 'bigpkg/1.0/bigpkg.xml')
+        doc = TiXmlDocument(Filename(installDir, 'contents.xml').toOsSpecific())
+        xcontents = TiXmlElement('contents')
+        xpackage = TiXmlElement('package')
+        xpackage.SetAttribute('name', 'bigpkg')
+        xpackage.SetAttribute('version', '1.0')
+        desc.storeXml(xpackage)
+        xcontents.InsertEndChild(xpackage)
+        doc.InsertEndChild(xcontents)
+        doc.SaveFile()
+        return uncompressed.size, compressed.size
+
+    class Handler(BaseHTTPRequestHandler):
+        """ Serves the install directory, honoring a Range header. """
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            pathname = os.path.join(installDir.toOsSpecific(), self.path.split('?')[0].lstrip('/'))
+            if not os.path.isfile(pathname):
+                self.send_error(404)
+                return
+            size = os.path.getsize(pathname)
+            start, end = 0, size - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+            if match:
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), end)
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, end, size))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            f = open(pathname, 'rb')
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(remaining, 65536))
+                self.wfile.write(data)
+                remaining -= len(data)
+            f.close()
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # The client hung up early; that's expected.
+            pass
+
+    def getDiskUsage(dirname):
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(dirname):
+            for filename in filenames:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+        return total
+
+    def install(name, stream, connections):
+        loadPrcFileData(name, 'package-stream-install %s\npackage-download-connections %s' % (
+            int(stream), connections))
+
+        hostDir = Filename(tempRoot, 'host-' + name)
+        hostDir.makeDir()
+        http = HTTPClient()
+        host = HostInfo(hostUrl, hostDir = hostDir)
+        check(host.downloadContentsFile(http), 'could not download contents.xml')
+        package = host.getPackage('bigpkg', '1.0')
+        check(package.downloadDescFile(http), 'could not download bigpkg.xml')
+
+        start = default_timer()
+        peakUsage = 0
+        for token in package.downloadPackageGenerator(http):
+            peakUsage = max(peakUsage, getDiskUsage(hostDir.toOsSpecific()))
+            if token != package.stepContinue:
+                break
+        elapsed = default_timer() - start
+        check(token == package.stepComplete, '%s install failed' % (name))
+        check(package.uncompressedArchive.fullVerify(package.getPackageDir()),
+              '%s installed an incorrect archive' % (name))
+
+        shutil.rmtree(hostDir.toOsSpecific())
+        return elapsed, peakUsage
+
+    uncompressedSize, compressedSize = buildPackage()
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    hostUrl = 'http://127.0.0.1:%s/' % (server.server_address[1])
+
+    print("archive: %.1f MB, compressed %.1f MB" % (
+        uncompressedSize / 1048576.0, compressedSize / 1048576.0))
+    print("%-14s  %10s  %15s" % ('method', 'time (s)', 'peak disk (MB)'))
+    for name, stream, connections in (
+        ('steps', False, 1),
+        ('steps-ranges', False, 4),
+        ('stream', True, 1),
+        ('stream-ranges', True, 4)):
+        elapsed, peakUsage = install(name, stream, connections)
+        print("%-14s  %10.2f  %15.1f" % (name, elapsed, peakUsage / 1048576.0))
+        if stream:
+            check(peakUsage < uncompressedSize + compressedSize // 2,
+                  '%s used %s bytes of disk' % (name, peakUsage))
+
+    server.shutdown()
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
@@ -0,0 +1,109 @@
+"""Compares the cost of keeping many pending timeouts with
+taskMgr.doMethodLater() against taskMgr.addTimer().
+
+Usage: TimerWheelBenchmark.py [count ...]
+
+For each count of timers (by default, 10000 100000 1000000), it
+reports the average cost of adding one timer, the per-frame cost of
+keeping them all pending, and the average cost of cancelling one of
+them, measured over a sample of cancels.  It also checks that the
+cancels succeed, and that a TimerWheel fires every timer, in order and
+never early."""
+
+from harness import check, runMain
+
+def run(args):
+    from direct.task.TaskManagerGlobal import taskMgr
+    from timeit import default_timer
+    import random
+
+    counts = [int(arg) for arg in args] or [10000, 100000, 1000000]
+    numFrames = 20
+    numCancels = 200
+
+    def callback(*args):
+        pass
+
+    def taskCallback(task):
+        return task.done
+
+    def measure(count, add, cancel, cleanup):
+        # The delays are long enough that nothing comes due while we
+        # measure the per-frame overhead of keeping them pending.
+        handles = []
+        delays = [60.0 + random.random() * 600.0 for i in range(count)]
+
+        start = default_timer()
+        for i in range(count):
+            handles.append(add(delays[i], 'bench-%s' % (i % 1000)))
+        addTime = default_timer() - start
+
+        start = default_timer()
+        for i in range(numFrames):
+            taskMgr.step()
+        frameTime = (default_timer() - start) / numFrames
+
+        sample = random.sample(handles, min(numCancels, count))
+        start = default_timer()
+        for handle in sample:
+            check(cancel(handle), 'could not cancel %s' % (handle))
+        cancelTime = (default_timer() - start) / len(sample)
+
+        cleanup()
+        return addTime, frameTime, cancelTime
+
+    def checkFiring(numTimers = 10000):
+        # Fires random timers by advancing a wheel in uneven steps,
+        # across several wraps of each level but the last.
+        from direct.task.Task import TimerWheel
+        wheel = TimerWheel(0.01, 0.0, slotBits = 4)
+        fired = []
+        now = [0.0]
+        def fire(time):
+            check(time <= now[0], 'timer for %s fired early, at %s' % (time, now[0]))
+            fired.append(time)
+        times = [random.random() * 1000.0 for i in range(numTimers)]
+        cancelled = set(random.sample(range(numTimers), numTimers // 10))
+        entries = [wheel.add(time, fire, 'check', [time]) for time in times]
+        for i in cancelled:
+            check(wheel.remove(entries[i]), 'timer could not be cancelled')
+        while now[0] < 1000.0:
+            now[0] += random.random() * 5.0
+            wheel.advance(now[0])
+        expected = sorted([times[i] for i in range(numTimers) if i not in cancelled])
+        check(len(fired) == len(expected),
+              '%s of %s timers fired' % (len(fired), len(expected)))
+        # The timers fire in order of tick, so check them to within a
+        # tick of each other.
+        check(all([fired[i] < fired[i + 1] + 0.01 for i in range(len(fired) - 1)]),
+              'timers fired out of order')
+        check(wheel.getNumEntries() == 0, 'timers left on the wheel')
+
+    checkFiring()
+
+    def addDoLater(delay, name):
+        return taskMgr.doMethodLater(delay, taskCallback, name)
+
+    def addTimer(delay, name):
+        return taskMgr.addTimer(delay, callback, name)
+
+    def cleanupDoLaters():
+        # Removing the tasks one at a time would take far longer than
+        # the rest of the benchmark, so just throw them all away.
+        taskMgr.mgr.cleanup()
+
+    print("%10s  %-14s  %12s  %12s  %12s" % (
+        'timers', 'method', 'add (us)', 'frame (ms)', 'cancel (us)'))
+    for count in counts:
+        for method, add, cancel, cleanup in (
+            ('doMethodLater', addDoLater, taskMgr.remove, cleanupDoLaters),
+            ('addTimer', addTimer, taskMgr.removeTimer,
+             lambda: taskMgr.removeTimersWithPrefix('bench-'))):
+            addTime, frameTime, cancelTime = measure(count, add, cancel, cleanup)
+            check(taskMgr.getNumTimers() == 0, 'timers left after cleanup')
+            print("%10s  %-14s  %12.3f  %12.3f  %12.3f" % (
+                count, method, addTime * 1000000.0 / count,
+                frameTime * 1000.0, cancelTime * 1000000.0))
+
+if __name__ == '__main__':
+    runMain(run)
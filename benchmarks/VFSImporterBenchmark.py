@@ -0,0 +1,163 @@
+"""Measures the time to import direct.showbase.ShowBase (or another
+module) from a multifile through the VFSImporter.
+
+Usage: VFSImporterBenchmark.py [runs [module]]
+
+The direct package is compiled into a multifile of .pyc files, as
+the packager would ship it, and mounted on a directory at the head of
+sys.path; this is imported with and without the directory cache.  It
+is also stored as .py source in a second multifile, which is imported
+without a python-cache-dir, so that every module is compiled each
+time, and then again once the python-cache-dir has been filled.
+
+Each import runs in a fresh interpreter, in which the VFSImporter
+handles only the mounted directory and the ones below it, so that the
+standard library is imported the usual way and is not counted.  Each
+case is run the indicated number of times (5 by default), and the
+best and median times are reported.  It checks that the module came
+from the multifile, and that every case imported the same modules."""
+
+import sys
+import os
+
+from harness import check, runMain
+
+def run(args):
+    if args[0:1] == ['--child']:
+        # We are one of the interpreters started below.  Import the
+        # module from the multifile, and report how long it took.
+        mfPathname, mountDir, moduleName, prcData = args[1:5]
+
+        from panda3d.core import Filename, Multifile, VirtualFileSystem, loadPrcFileData
+        from timeit import default_timer
+        loadPrcFileData('', prcData)
+        from direct.showbase import VFSImporter
+
+        # Forget the direct package on disk; from here on, it must
+        # come from the multifile.
+        diskRoot = os.path.dirname(os.path.dirname(os.path.abspath(sys.modules['direct'].__file__)))
+        for name in list(sys.modules.keys()):
+            if name == 'direct' or name.startswith('direct.'):
+                del sys.modules[name]
+        sys.path = [mountDir] + [dir for dir in sys.path
+                                 if os.path.abspath(dir or '.') != diskRoot]
+
+        def hook(path):
+            if path != mountDir and not path.startswith(mountDir + os.sep):
+                raise ImportError
+            return VFSImporter.VFSImporter(path)
+        sys.path_hooks.insert(0, hook)
+        sys.path_importer_cache.clear()
+
+        mf = Multifile()
+        mf.openRead(Filename.fromOsSpecific(mfPathname))
+        VirtualFileSystem.getGlobalPtr().mount(mf, Filename.fromOsSpecific(mountDir), 0)
+
+        start = default_timer()
+        module = __import__(moduleName, fromlist = ['*'])
+        elapsed = default_timer() - start
+
+        check(module.__file__.startswith(mountDir),
+              '%s was imported from %s' % (moduleName, module.__file__))
+        numModules = len([name for name in sys.modules if name.startswith('direct.')])
+        print("%s %s" % (elapsed, numModules))
+        return
+
+    from panda3d.core import Filename, Multifile, StringStream
+    import direct
+    import imp
+    import marshal
+    import shutil
+    import subprocess
+    import tempfile
+
+    runs = int((args[0:1] or [5])[0])
+    moduleName = (args[1:2] or ['direct.showbase.ShowBase'])[0]
+
+    tempDir = tempfile.mkdtemp()
+    mountDir = os.path.join(tempDir, 'mf')
+    codeCacheDir = os.path.join(tempDir, 'pycache')
+
+    # Compiled files get the header the VFSLoader expects.
+    if sys.version_info >= (3, 0):
+        header = imp.get_magic() + b'\0' * 8
+    else:
+        header = imp.get_magic() + '\0' * 4
+
+    def makeMultifile(name, source):
+        """ Stores every module of the direct package in a multifile,
+        either as source or compiled. """
+
+        directDir = os.path.dirname(os.path.abspath(direct.__file__))
+        mfPathname = os.path.join(tempDir, name)
+        mf = Multifile()
+        mf.openWrite(Filename.fromOsSpecific(mfPathname))
+        streams = []
+        numFiles = 0
+        for dirpath, dirnames, filenames in os.walk(directDir, followlinks = True):
+            for filename in filenames:
+                if not filename.endswith('.py'):
+                    continue
+                pathname = os.path.join(dirpath, filename)
+                text = open(pathname, 'rb').read()
+                try:
+                    code = compile(text + b'\n', pathname, 'exec')
+                except SyntaxError:
+                    # Some tools are still written for Python 2 only.
+                    continue
+                name = 'direct/' + os.path.relpath(pathname, directDir).replace(os.sep, '/')
+                if source:
+                    stream = StringStream(text)
+                else:
+                    name += 'c'
+                    stream = StringStream(header + marshal.dumps(code))
+                streams.append(stream)
+                mf.addSubfile(name, stream, 0)
+                numFiles += 1
+        mf.close()
+        return mfPathname, numFiles
+
+    pycPathname, numFiles = makeMultifile('direct.mf', False)
+    sourcePathname, numFiles = makeMultifile('direct-source.mf', True)
+
+    def importModule(mfPathname, prcData):
+        try:
+            output = subprocess.check_output([
+                sys.executable, '-W', 'ignore', os.path.abspath(__file__),
+                '--child', mfPathname, mountDir, moduleName, prcData])
+        except subprocess.CalledProcessError:
+            check(False, 'importing with %s failed' % (prcData))
+        elapsed, numModules = output.split()[-2:]
+        return float(elapsed), int(numModules)
+
+    cases = [
+        ('pyc, no dir cache', pycPathname, 'vfs-importer-cache 0'),
+        ('pyc, dir cache', pycPathname, 'vfs-importer-cache 1'),
+        ('source', sourcePathname, 'python-cache-dir'),
+        ('source, pycache', sourcePathname, 'python-cache-dir %s' % (
+            Filename.fromOsSpecific(codeCacheDir))),
+        ]
+
+    # Fill the python-cache-dir.
+    expectedModules = importModule(sourcePathname, cases[-1][2])[1]
+    check(os.listdir(codeCacheDir), 'nothing was written to the python-cache-dir')
+
+    results = {}
+    for i in range(runs):
+        for name, mfPathname, prcData in cases:
+            elapsed, numModules = importModule(mfPathname, prcData)
+            check(numModules == expectedModules, '%s imported %s modules, expected %s' % (
+                name, numModules, expectedModules))
+            results.setdefault(name, []).append(elapsed)
+
+    print("%s modules in the multifile, %s imported by %s" % (numFiles, numModules, moduleName))
+    print("%-18s  %10s  %10s" % ('case', 'best (ms)', 'median (ms)'))
+    for name, mfPathname, prcData in cases:
+        times = sorted(results[name])
+        print("%-18s  %10.1f  %10.1f" % (
+            name, times[0] * 1000.0, times[len(times) // 2] * 1000.0))
+
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
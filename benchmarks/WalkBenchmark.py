@@ -0,0 +1,122 @@
+"""Measures the time to walk a large directory tree through
+direct.stdpy.file, collecting the size and modification time of every
+file.
+
+Usage: WalkBenchmark.py [numFiles [numThreads]]
+
+A synthetic tree of numFiles empty files (100000 by default) is
+written to a temporary directory, 100 files to a directory, in
+directories nested three levels deep.  It is then walked with the
+recursive walk() that file.py used to have, calling getsize() and
+getmtime() on each file, with the new walk() doing the same, and with
+walkEntries(), which returns the size and time along with the names,
+both in one thread and with numThreads threads (4 by default).  For
+comparison, the tree is also walked with os.walk() and os.stat().
+Each time is the best of three.  It checks that every method finds
+every file, with the same sizes and times as os.stat()."""
+
+from panda3d.core import Filename, VirtualFileSystem
+from direct.stdpy import file
+from timeit import default_timer
+import os
+import shutil
+import tempfile
+
+from harness import check, runMain
+
+def run(args):
+    numFiles = int((args[0:1] or [100000])[0])
+    numThreads = int((args[1:2] or [4])[0])
+    filesPerDir = 100
+
+    tempDir = tempfile.mkdtemp()
+    root = os.path.join(tempDir, 'tree')
+    vfs = VirtualFileSystem.getGlobalPtr()
+
+    def makeTree():
+        numDirs = (numFiles + filesPerDir - 1) // filesPerDir
+        count = 0
+        for i in range(numDirs):
+            dirname = os.path.join(root, 'a%s' % (i // 100), 'b%s' % (i // 10 % 10), 'c%s' % (i % 10))
+            os.makedirs(dirname)
+            for j in range(min(filesPerDir, numFiles - count)):
+                open(os.path.join(dirname, 'f%s.dat' % (j)), 'wb').close()
+                count += 1
+
+    def oldWalk(top, topdown = True):
+        # The recursive walk() as it used to be written.
+        dirnames = []
+        filenames = []
+        dirpath = Filename.fromOsSpecific(top)
+        for vfile in vfs.scanDirectory(dirpath) or []:
+            if vfile.isDirectory():
+                dirnames.append(vfile.getFilename().getBasename())
+            else:
+                filenames.append(vfile.getFilename().getBasename())
+        if topdown:
+            yield (top, dirnames, filenames)
+        for dir in dirnames:
+            for tuple in oldWalk(os.path.join(top, dir), topdown):
+                yield tuple
+        if not topdown:
+            yield (top, dirnames, filenames)
+
+    def statWalk(walk):
+        total = 0
+        count = 0
+        for dirpath, dirnames, filenames in walk(root):
+            for filename in filenames:
+                pathname = os.path.join(dirpath, filename)
+                total += file.getsize(pathname) + int(file.getmtime(pathname))
+                count += 1
+        return count, total
+
+    def entryWalk(threads):
+        total = 0
+        count = 0
+        for dirpath, dirEntries, fileEntries in file.walkEntries(root, numThreads = threads):
+            for entry in fileEntries:
+                total += entry.size + entry.mtime
+                count += 1
+        return count, total
+
+    def osWalk():
+        total = 0
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                st = os.stat(os.path.join(dirpath, filename))
+                total += st.st_size + int(st.st_mtime)
+                count += 1
+        return count, total
+
+    makeTree()
+
+    methods = [
+        ('old walk + stat', lambda: statWalk(oldWalk)),
+        ('walk + stat', lambda: statWalk(file.walk)),
+        ('walkEntries', lambda: entryWalk(0)),
+        ('walkEntries, %s threads' % (numThreads), lambda: entryWalk(numThreads)),
+        ('os.walk + os.stat', osWalk),
+        ]
+
+    expected = (numFiles, osWalk()[1])
+
+    print("%s files in %s directories" % (numFiles, (numFiles + filesPerDir - 1) // filesPerDir))
+    print("%-24s  %10s  %12s" % ('method', 'time (ms)', 'files/s'))
+    for name, func in methods:
+        best = None
+        for i in range(3):
+            start = default_timer()
+            result = func()
+            elapsed = default_timer() - start
+            check(result == expected,
+                  '%s found %s files with total %s, expected %s with total %s' % (
+                (name,) + result + expected))
+            best = min(best or elapsed, elapsed)
+        print("%-24s  %10.1f  %12.0f" % (name, best * 1000.0, numFiles / best))
+
+    shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    runMain(run)
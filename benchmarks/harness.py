@@ -0,0 +1,75 @@
+"""Runs the benchmarks in this directory.  These measure the
+performance of parts of the direct tree, and check the behavior they
+measure as they go; they are not installed with Panda3D.  Run them
+from a tree in which Panda3D has been built:
+
+    python benchmarks/harness.py [name ...]
+
+runs each named benchmark (or all of them) with its default
+parameters, each in a process of its own, and exits with a nonzero
+status if any of them failed.  A single benchmark may also be run
+directly, with parameters of its own; see each module's docstring.
+
+Each benchmark module defines run(args), which prints its report and
+calls check() to verify the results, and ends with a call to
+runMain(run)."""
+
+import sys
+import os
+import subprocess
+
+# The benchmarks run by default, in order.
+Benchmarks = [
+    'MessengerBenchmark',
+    'TimerWheelBenchmark',
+    'ServerRepositoryLoadTest',
+    'ActorCrowdBenchmark',
+    'IntervalBenchmark',
+    'MetaIntervalBenchmark',
+    'ChunkStoreBenchmark',
+    'RangeDownloadBenchmark',
+    'StreamInstallBenchmark',
+    'VFSImporterBenchmark',
+    'FileReadBenchmark',
+    'WalkBenchmark',
+    ]
+
+
+class CheckFailed(Exception):
+    pass
+
+def check(condition, message = 'check failed'):
+    """Raises CheckFailed with the indicated message if condition is
+    false.  Unlike an assert statement, this still happens when Python
+    is run with -O. """
+    if not condition:
+        raise CheckFailed(message)
+
+def runMain(run):
+    """Runs the indicated benchmark function on the command-line
+    arguments, and exits with status 1 if one of its checks failed."""
+    try:
+        run(sys.argv[1:])
+    except CheckFailed as e:
+        sys.stderr.write('FAILED: %s\n' % (e))
+        sys.exit(1)
+    sys.exit(0)
+
+def main(names):
+    benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+    failed = []
+    for name in names or Benchmarks:
+        print('== %s' % (name))
+        sys.stdout.flush()
+        status = subprocess.call([sys.executable, os.path.join(benchmarkDir, name + '.py')])
+        if status != 0:
+            failed.append(name)
+
+    if failed:
+        print('%s of %s benchmarks failed: %s' % (
+            len(failed), len(names or Benchmarks), ', '.join(failed)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -26,6 +26,7 @@ class Actor(DirectObject, NodePath):
     validateSubparts = ConfigVariableBool('validate-subparts', True)
     mergeLODBundles = ConfigVariableBool('merge-lod-bundles', True)
     allowAsyncBind = ConfigVariableBool('allow-async-bind', True)
+    useAnimScheduler = ConfigVariableBool('anim-scheduler', False)
 
     class PartDef:
 
@@ -198,6 +199,11 @@ class Actor(DirectObject, NodePath):
         self.__sortedLODNames = []
         self.__animControlDict = {}
 
+        # A cache of getAnimControls() results, keyed by (animName,
+        # partName, lodName).  Anything that changes the anims, parts,
+        # subparts or LODs must clear it.
+        self.__animControlCache = {}
+
         self.__subpartsComplete = False
 
         self.__LODNode = None
@@ -332,6 +338,10 @@ class Actor(DirectObject, NodePath):
             # object or none of it.
             self.__geomNode.node().setFinal(1)
 
+        if Actor.useAnimScheduler:
+            from direct.actor.AnimationSchedulerGlobal import animScheduler
+            animScheduler.register(self)
+
     def delete(self):
         try:
             self.Actor_deleted
@@ -376,6 +386,7 @@ class Actor(DirectObject, NodePath):
 
             # copy the anim dictionary from other
             self.__copyAnimControls(other)
+            self.__animControlCache.clear()
 
 
     def __cmp__(self, other):
@@ -495,6 +506,9 @@ class Actor(DirectObject, NodePath):
         """
         Actor cleanup function
         """
+        if Actor.useAnimScheduler:
+            from direct.actor.AnimationSchedulerGlobal import animScheduler
+            animScheduler.unregister(self)
         self.stop(None)
         self.clearPythonData()
         self.flush()
@@ -515,6 +529,7 @@ class Actor(DirectObject, NodePath):
         self.__subpartDict = {}
         self.__sortedLODNames = []
         self.__animControlDict = {}
+        self.__animControlCache = {}
 
     def flush(self):
         """
@@ -535,10 +550,13 @@ class Actor(DirectObject, NodePath):
     # accessing
 
     def getAnimControlDict(self):
+        # The caller may modify the dictionary.
+        self.__animControlCache.clear()
         return self.__animControlDict
 
     def removeAnimControlDict(self):
         self.__animControlDict = {}
+        self.__animControlCache.clear()
 
     def getPartBundleDict(self):
         return self.__partBundleDict
@@ -637,6 +655,7 @@ class Actor(DirectObject, NodePath):
             self.__LODNode = self.__geomNode.attachNewNode(node)
             self.__hasLOD = 1
             self.switches = {}
+        self.__animControlCache.clear()
 
 
     def useLOD(self, lodName):
@@ -684,6 +703,7 @@ class Actor(DirectObject, NodePath):
         of a specific LOD under.
         """
         self.__LODNode.attachNewNode(str(lodName))
+        self.__animControlCache.clear()
         # save the switch distance info
         self.switches[lodName] = [inDist, outDist]
         # add the switch distance info
@@ -1009,6 +1029,7 @@ class Actor(DirectObject, NodePath):
         if (partName in partBundleDict):
             partBundleDict[partName].partBundleNP.removeNode()
             del(partBundleDict[partName])
+        self.__animControlCache.clear()
 
         # find the corresponding anim control dict
         if self.mergeLODBundles:
@@ -1755,6 +1776,20 @@ class Actor(DirectObject, NodePath):
         If lodName is None or omitted, all LOD's are returned.
         """
 
+        # Requests for a single named animation are answered from the
+        # cache, when we have answered them before.
+        if isinstance(animName, str) and \
+           (partName is None or isinstance(partName, str)):
+            cacheKey = (animName, partName, lodName)
+            cached = self.__animControlCache.get(cacheKey)
+            if cached is not None:
+                if not allowAsyncBind:
+                    for animControl in cached:
+                        animControl.waitPending()
+                return list(cached)
+        else:
+            cacheKey = None
+
         if partName == None and self.__subpartsComplete:
             # If we have the __subpartsComplete flag, and no partName
             # is specified, it really means to play the animation on
@@ -1858,7 +1893,12 @@ class Actor(DirectObject, NodePath):
 
                             if animControl:
                                 controls.append(animControl)
+                            else:
+                                # Try again next time.
+                                cacheKey = None
 
+        if cacheKey is not None:
+            self.__animControlCache[cacheKey] = tuple(controls)
         return controls
 
     def loadModel(self, modelPath, partName="modelRoot", lodName="lodRoot",
@@ -1943,6 +1983,7 @@ class Actor(DirectObject, NodePath):
                 # make sure this lod is in anim control dict
                 if self.mergeLODBundles:
                     lodName = 'common'
+                self.__animControlCache.clear()
                 self.__animControlDict.setdefault(lodName, {})
                 self.__animControlDict[lodName].setdefault(partName, {})
 
@@ -2032,6 +2073,7 @@ class Actor(DirectObject, NodePath):
             subset.addExcludeJoint(GlobPattern(name))
 
         self.__subpartDict[partName] = Actor.SubpartDef(parent, subset)
+        self.__animControlCache.clear()
 
         if __dev__ and not overlapping and self.validateSubparts.getValue():
             # Without the overlapping flag True, we're not allowed to
@@ -2065,6 +2107,7 @@ class Actor(DirectObject, NodePath):
         """
 
         self.__subpartsComplete = flag
+        self.__animControlCache.clear()
 
         if __dev__ and self.__subpartsComplete and self.validateSubparts.getValue():
             # If we've specified any parts at all so far, make sure we've
@@ -2124,6 +2167,7 @@ class Actor(DirectObject, NodePath):
 
         assert Actor.notify.debug("in loadAnims: %s, part: %s, lod: %s" %
                                   (anims, partName, lodNames[0]))
+        self.__animControlCache.clear()
 
         firstLoad = True
         if not reload:
@@ -2166,6 +2210,7 @@ class Actor(DirectObject, NodePath):
         else:
             lodNames = self.__partBundleDict.keys()
 
+        self.__animControlCache.clear()
         for lod in lodNames:
             for part in partNames:
                 self.__animControlDict.setdefault(lod,{})
@@ -2187,6 +2232,7 @@ class Actor(DirectObject, NodePath):
         to 'lodRoot' for non-LOD actors) and dict of corresponding
         anims in the form animName:animPath{}
         """
+        self.__animControlCache.clear()
         if self.mergeLODBundles:
             lodNames = ['common']
         else:
@@ -2237,6 +2283,7 @@ class Actor(DirectObject, NodePath):
         """
         assert Actor.notify.debug("in unloadAnims: %s, part: %s, lod: %s" %
                                   (anims, partName, lodName))
+        self.__animControlCache.clear()
 
         if lodName is None or self.mergeLODBundles:
             lodNames = self.__animControlDict.keys()
@@ -2293,6 +2340,7 @@ class Actor(DirectObject, NodePath):
         holding up the render for a frame or two until the animation
         is available.
         """
+        self.__animControlCache.clear()
         self.getAnimControls(animName = animName, partName = partName,
                              lodName = lodName,
                              allowAsyncBind = allowAsyncBind)
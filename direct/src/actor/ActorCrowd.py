@@ -0,0 +1,221 @@
+"""ActorCrowd module: contains the ActorCrowd class"""
+
+__all__ = ['ActorCrowd', 'CrowdMember']
+
+from panda3d.core import *
+from direct.directnotify import DirectNotifyGlobal
+from .Actor import Actor
+import random
+
+
+class CrowdMember(NodePath):
+    """
+    One logical actor in an ActorCrowd.  This is an ordinary NodePath
+    that may be positioned, reparented and shown or hidden like any
+    other; its geometry is an instance of one of the crowd's shared
+    posed Actors.  Create these with ActorCrowd.spawn().
+    """
+
+    def __init__(self, crowd, name):
+        NodePath.__init__(self, name)
+        self.crowd = crowd
+        self.poseKey = None
+        self.poseInstance = None
+
+    def loop(self, animName, playRate = 1.0, phase = None):
+        """Loops the named animation at the indicated play rate.
+        phase is the point in the cycle to start at, from 0 to 1; if
+        it is omitted, a random phase is chosen, so that members of a
+        crowd do not all move in lockstep."""
+        self.crowd.setMemberPose(self, animName, playRate, phase)
+
+    def stop(self):
+        """Stops animating, and returns to the rest pose."""
+        self.crowd.setMemberPose(self, None)
+
+    def getCurrentAnim(self):
+        if self.poseKey is None:
+            return None
+        return self.poseKey[0]
+
+    def getPlayRate(self):
+        if self.poseKey is None:
+            return None
+        return self.poseKey[1]
+
+    def cleanup(self):
+        """Removes this member from its crowd and from the scene
+        graph."""
+        if self.crowd:
+            self.crowd.removeMember(self)
+            self.crowd = None
+        self.removeNode()
+
+
+class ActorCrowd:
+    """
+    Manages a large number of characters that all use the same
+    models and animations.
+
+    A normal Actor copies its character, and with it the PartBundle
+    that holds its animated joints, and binds its own AnimControls.
+    A crowd of Actors therefore costs memory, construction time and
+    per-frame animation time in proportion to the number of Actors.
+
+    An ActorCrowd instead loads the Actor once, as a template, and
+    keeps a small pool of posed copies of it: one for each
+    combination of animation, play rate and phase that is in use.
+    The phase is quantized to one of actor-crowd-phases evenly spaced
+    points in the animation cycle.  Each CrowdMember returned by
+    spawn() has its own root transform, and instances the posed copy
+    that matches its animation state, sharing that copy's PartBundle,
+    AnimControls and animated vertices with every other member in the
+    same state.  The cost of animating the crowd thus depends on the
+    number of distinct poses in use, not on the number of members.
+
+    The price is that members in the same state move in lockstep,
+    and per-member joint control (exposeJoint(), controlJoint() and
+    the like) is not available; use a full Actor for characters that
+    need it.
+    """
+
+    notify = DirectNotifyGlobal.directNotify.newCategory("ActorCrowd")
+
+    numPhases = ConfigVariableInt('actor-crowd-phases', 8)
+
+    class Pose:
+        """One posed copy of the template Actor, shared by all of the
+        members in the same animation state."""
+
+        def __init__(self, actor):
+            self.actor = actor
+            self.members = set()
+
+    def __init__(self, models = None, anims = None, numPhases = None, **kw):
+        """The models and anims parameters, and any further keyword
+        parameters, are passed to the Actor constructor to build the
+        template. """
+        self.template = self.__unschedule(Actor(models, anims, **kw))
+        if numPhases is None:
+            numPhases = ActorCrowd.numPhases.getValue()
+        self.numPhases = max(numPhases, 1)
+        self.__poses = {}
+        self.__members = set()
+        self.__memberIndex = 0
+
+    def cleanup(self):
+        """Removes all of the members, and frees the template and the
+        posed copies."""
+        for member in list(self.__members):
+            member.cleanup()
+        for pose in self.__poses.values():
+            pose.actor.cleanup()
+            pose.actor.removeNode()
+        self.__poses = {}
+        self.template.cleanup()
+        self.template.removeNode()
+
+    def spawn(self, parent = None, animName = None, playRate = 1.0,
+              phase = None):
+        """Creates and returns a new CrowdMember, optionally parented
+        to the indicated node and looping the named animation."""
+        member = CrowdMember(self, '%s-%s' % (self.template.getName(), self.__memberIndex))
+        self.__memberIndex += 1
+        self.__members.add(member)
+        if parent is not None:
+            member.reparentTo(parent)
+        self.setMemberPose(member, animName, playRate, phase)
+        return member
+
+    def removeMember(self, member):
+        self.__releasePose(member)
+        self.__members.discard(member)
+
+    def getNumMembers(self):
+        return len(self.__members)
+
+    def getNumPoses(self):
+        """Returns the number of posed copies of the template currently
+        in use.  This is what the crowd costs to animate each
+        frame."""
+        return len(self.__poses)
+
+    def getPoseActors(self):
+        """Returns the posed copies of the template currently in
+        use."""
+        return [pose.actor for pose in self.__poses.values()]
+
+    def update(self, force = False):
+        """Updates the joints of all of the posed copies.  This
+        normally happens automatically when the crowd is rendered; it
+        is only necessary to call this to read joint positions
+        without rendering.  Returns True if anything changed."""
+        anyChanged = False
+        for pose in self.__poses.values():
+            if pose.actor.update(force = force):
+                anyChanged = True
+        return anyChanged
+
+    def setMemberPose(self, member, animName, playRate = 1.0, phase = None):
+        """Puts the member into the indicated animation state, or into
+        the rest pose if animName is None.  This is normally called
+        via CrowdMember.loop() or stop()."""
+        if animName is None:
+            key = None
+        else:
+            if phase is None:
+                phase = random.random()
+            phaseIndex = int(round(phase * self.numPhases)) % self.numPhases
+            key = (animName, playRate, phaseIndex)
+
+        if key == member.poseKey and member.poseInstance is not None:
+            return
+
+        pose = self.__poses.get(key)
+        if pose is None:
+            pose = ActorCrowd.Pose(self.__makePoseActor(key))
+            self.__poses[key] = pose
+
+        self.__releasePose(member)
+        pose.members.add(member)
+        member.poseKey = key
+        member.poseInstance = pose.actor.instanceTo(member)
+
+    def __makePoseActor(self, key):
+        # The copy shares the template's geometry and AnimBundles;
+        # only the PartBundle and the animated vertices are its own.
+        actor = self.__unschedule(Actor(other = self.template))
+        if key is not None:
+            animName, playRate, phaseIndex = key
+            actor.setPlayRate(playRate, animName)
+            for control in actor.getAnimControls(animName):
+                control.pose(control.getNumFrames() * phaseIndex // self.numPhases)
+                control.loop(False)
+        return actor
+
+    def __unschedule(self, actor):
+        # The template and the posed copies are never in the scene
+        # themselves, only instanced under the members, so the
+        # AnimationScheduler can't tell how far away or how visible
+        # they are; keep them out of it.
+        if Actor.useAnimScheduler:
+            from direct.actor.AnimationSchedulerGlobal import animScheduler
+            animScheduler.unregister(actor)
+        return actor
+
+    def __releasePose(self, member):
+        if member.poseInstance is None:
+            return
+        member.poseInstance.detachNode()
+        member.poseInstance = None
+        key = member.poseKey
+        member.poseKey = None
+        pose = self.__poses.get(key)
+        if pose is None:
+            return
+        pose.members.discard(member)
+        if not pose.members:
+            # Nobody is in this state any more; free the copy.
+            del self.__poses[key]
+            pose.actor.cleanup()
+            pose.actor.removeNode()
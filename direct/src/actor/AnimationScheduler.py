@@ -0,0 +1,246 @@
+"""AnimationScheduler module: contains the AnimationScheduler class"""
+
+__all__ = ['AnimationScheduler']
+
+from panda3d.core import *
+from direct.directnotify.DirectNotifyGlobal import directNotify
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.task import Task
+import weakref
+
+
+class AnimationScheduler:
+    """
+    Decides, once per frame, how often each registered Actor's joints
+    are animated, so that the total animation cost of a scene with
+    many characters stays under a predictable ceiling.
+
+    Each Actor is put in one of four tiers:
+
+      full       animated every frame
+      reduced    animated every anim-reduced-interval seconds
+      frozen     not animated, except when its animation changes
+      offscreen  frozen, because it is outside the camera's view
+
+    Actors closer to the camera than anim-full-distance want the full
+    tier, and those closer than anim-reduced-distance want the reduced
+    tier; anything farther away is frozen.  If anim-joint-budget is
+    nonzero, the visible Actors are then considered nearest first, and
+    each is demoted to a lower tier if the joints animated per frame
+    would otherwise exceed that budget.
+
+    The tier is applied as a fixed update delay through
+    Actor.setLODAnimation(), which the Character honors when it is
+    rendered, so this replaces any LOD animation the registered Actors
+    had set up themselves.  Actors register
+    automatically when the anim-scheduler config variable is true;
+    see AnimationSchedulerGlobal.
+    """
+    notify = directNotify.newCategory("AnimationScheduler")
+
+    TaskName = 'animationScheduler'
+
+    # Run before the igLoop, so the delays are in place before the
+    # characters are culled.
+    TaskSort = 45
+
+    Full = 'full'
+    Reduced = 'reduced'
+    Frozen = 'frozen'
+    Offscreen = 'offscreen'
+    Tiers = (Full, Reduced, Frozen, Offscreen)
+
+    # An update delay long enough that the bundle is never updated
+    # on its own.
+    FrozenDelay = 1.0e9
+
+    # setLODAnimation() scales the delay by the distance from its near
+    # distance; with the near distance this far behind the camera, the
+    # delay is the delay factor to within a fraction of a percent at
+    # any distance that matters.
+    NearDistanceOffset = 1.0e6
+
+    fullDistance = ConfigVariableDouble('anim-full-distance', 50.0)
+    reducedDistance = ConfigVariableDouble('anim-reduced-distance', 150.0)
+    reducedInterval = ConfigVariableDouble('anim-reduced-interval', 0.1)
+    jointBudget = ConfigVariableInt('anim-joint-budget', 0)
+
+    def __init__(self, camera = None):
+        # The camera is a NodePath to a Camera node.  If it is None,
+        # base.cam is used.
+        self.camera = camera
+
+        self.fullDistance = AnimationScheduler.fullDistance.getValue()
+        self.reducedDistance = AnimationScheduler.reducedDistance.getValue()
+        self.reducedInterval = AnimationScheduler.reducedInterval.getValue()
+        self.jointBudget = AnimationScheduler.jointBudget.getValue()
+
+        # id(actor) -> [weakref to actor, number of joints, tier]
+        self.__actors = {}
+        self.__tierCounts = dict([(tier, 0) for tier in self.Tiers])
+        self.__jointsPerFrame = 0.0
+
+    def destroy(self):
+        taskMgr.remove(self.TaskName)
+        for actorId in list(self.__actors.keys()):
+            actor = self.__actors[actorId][0]()
+            if actor is not None:
+                self.unregister(actor)
+
+    def setCamera(self, camera):
+        self.camera = camera
+
+    def setJointBudget(self, jointBudget):
+        """Sets the maximum number of joints to animate per frame,
+        or 0 for no limit."""
+        self.jointBudget = jointBudget
+
+    def getJointBudget(self):
+        return self.jointBudget
+
+    def register(self, actor):
+        """Puts the indicated Actor under the control of the
+        scheduler.  It stays registered until it is unregistered, or
+        cleaned up, or garbage-collected."""
+        actorId = id(actor)
+        if actorId in self.__actors:
+            return
+
+        actor.clearLODAnimation()
+        numJoints = max(len(actor.getJoints()), 1)
+        ref = weakref.ref(actor, lambda ref, actorId = actorId: self.__forget(actorId))
+        self.__actors[actorId] = [ref, numJoints, None]
+        if not taskMgr.hasTaskNamed(self.TaskName):
+            taskMgr.add(self.__updateTask, self.TaskName, sort = self.TaskSort)
+
+    def unregister(self, actor):
+        """Returns the Actor to animating every frame."""
+        entry = self.__actors.pop(id(actor), None)
+        if entry is not None and entry[2] is not None:
+            self.__setDelay(actor, 0.0)
+        if not self.__actors:
+            taskMgr.remove(self.TaskName)
+
+    def __forget(self, actorId):
+        self.__actors.pop(actorId, None)
+
+    def getNumActors(self):
+        return len(self.__actors)
+
+    def getActorTier(self, actor):
+        """Returns the tier the Actor was put in on the last update,
+        or None if it is not registered or has not been updated
+        yet."""
+        entry = self.__actors.get(id(actor))
+        if entry is None:
+            return None
+        return entry[2]
+
+    def getTierCounts(self):
+        """Returns a dictionary of the number of Actors put in each
+        tier on the last update."""
+        return dict(self.__tierCounts)
+
+    def getJointsPerFrame(self):
+        """Returns the estimated number of joints animated per frame
+        as of the last update."""
+        return self.__jointsPerFrame
+
+    def getReport(self):
+        counts = self.__tierCounts
+        return '%s actors: %s full, %s reduced, %s frozen, %s offscreen; %.0f joints/frame (budget %s)' % (
+            len(self.__actors), counts[self.Full], counts[self.Reduced],
+            counts[self.Frozen], counts[self.Offscreen],
+            self.__jointsPerFrame, self.jointBudget or 'none')
+
+    def __updateTask(self, task):
+        self.update()
+        return Task.cont
+
+    def update(self):
+        """Reassigns every registered Actor to a tier.  This is
+        normally called each frame by the scheduler's task."""
+        camera = self.camera
+        if camera is None:
+            try:
+                camera = base.cam
+            except (NameError, AttributeError):
+                return
+            if camera is None:
+                return
+
+        lensBounds = None
+        lens = camera.node().getLens()
+        if lens is not None:
+            lensBounds = lens.makeBounds()
+
+        # Gather the visible actors and their distances.
+        candidates = []
+        newTiers = []
+        for actorId, entry in list(self.__actors.items()):
+            actor = entry[0]()
+            if actor is None or actor.isEmpty():
+                del self.__actors[actorId]
+                continue
+
+            if lensBounds is not None:
+                bounds = actor.node().getBounds().makeCopy()
+                bounds.xform(actor.getMat(camera))
+                if not lensBounds.contains(bounds):
+                    newTiers.append((actor, entry, self.Offscreen))
+                    continue
+
+            candidates.append((actor.getDistance(camera), actorId, actor, entry))
+
+        # The reduced tier costs a fraction of the full tier,
+        # according to how many frames go by between its updates.
+        dt = ClockObject.getGlobalClock().getDt()
+        reducedFraction = 1.0
+        if self.reducedInterval > 0.0:
+            reducedFraction = min(1.0, dt / self.reducedInterval)
+
+        candidates.sort()
+        budget = self.jointBudget
+        jointsPerFrame = 0.0
+        for distance, actorId, actor, entry in candidates:
+            numJoints = entry[1]
+            if distance < self.fullDistance:
+                tier = self.Full
+            elif distance < self.reducedDistance:
+                tier = self.Reduced
+            else:
+                tier = self.Frozen
+
+            if budget:
+                if tier == self.Full and jointsPerFrame + numJoints > budget:
+                    tier = self.Reduced
+                if tier == self.Reduced and \
+                   jointsPerFrame + numJoints * reducedFraction > budget:
+                    tier = self.Frozen
+
+            if tier == self.Full:
+                jointsPerFrame += numJoints
+            elif tier == self.Reduced:
+                jointsPerFrame += numJoints * reducedFraction
+            newTiers.append((actor, entry, tier))
+
+        counts = dict([(tier, 0) for tier in self.Tiers])
+        for actor, entry, tier in newTiers:
+            counts[tier] += 1
+            if entry[2] != tier:
+                entry[2] = tier
+                if tier == self.Full:
+                    self.__setDelay(actor, 0.0)
+                elif tier == self.Reduced:
+                    self.__setDelay(actor, self.reducedInterval)
+                else:
+                    self.__setDelay(actor, self.FrozenDelay)
+
+        self.__tierCounts = counts
+        self.__jointsPerFrame = jointsPerFrame
+
+    def __setDelay(self, actor, delay):
+        if delay > 0.0:
+            actor.setLODAnimation(0.0, -self.NearDistanceOffset, delay)
+        else:
+            actor.clearLODAnimation()
@@ -0,0 +1,7 @@
+"""instantiate global AnimationScheduler object"""
+
+__all__ = ['animScheduler']
+
+from . import AnimationScheduler
+
+animScheduler = AnimationScheduler.AnimationScheduler()
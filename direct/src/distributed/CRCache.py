@@ -2,18 +2,148 @@
 
 from direct.directnotify import DirectNotifyGlobal
 from . import DistributedObject
+from collections import OrderedDict
 
 class CRCache:
+    """
+    Holds recently disabled distributed objects, so that they can be
+    regenerated without being rebuilt if they come back into interest.
+
+    The cache is least-recently-used: objects are evicted oldest
+    first.  By default, all objects share a limit of maxCacheItems
+    objects.  Objects of a particular dclass may instead be given a
+    weight and a budget of their own with setClassBudget(), so that
+    cheap objects can be cached in bulk without pushing out everything
+    else.  If maxCacheWeight is given, it limits the total weight of
+    all of the objects in the cache (each object not in a budgeted
+    class weighs 1); when it is exceeded, the oldest object of the
+    class with the heaviest objects is evicted, so that heavy objects
+    go first.
+    """
     notify = DirectNotifyGlobal.directNotify.newCategory("CRCache")
 
-    def __init__(self, maxCacheItems=10):
+    def __init__(self, maxCacheItems=10, maxCacheWeight=None):
         self.maxCacheItems = maxCacheItems
         self.storedCacheItems = maxCacheItems
-        self.dict = {}
-        self.fifo = []
+        self.maxCacheWeight = maxCacheWeight
+        # doId -> distObj, ordered from least to most recently used.
+        self.dict = OrderedDict()
+        # dclassName -> (weight, maxWeight); see setClassBudget().
+        self.classBudgets = {}
+        # className -> OrderedDict of doId -> distObj, for each class
+        # of object in the cache.  Objects of unbudgeted classes are
+        # all kept together under None.
+        self.classDicts = {}
+        # className -> total weight of that class in the cache.
+        self.classWeights = {}
+        # doId -> (className, weight) of each object in the cache.
+        self.entryWeights = {}
+        self.totalWeight = 0
+        self.cacheOff = False
+
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvictions = 0
 
     def isEmpty(self):
-        return len(self.fifo) == 0
+        return len(self.dict) == 0
+
+    def setClassBudget(self, dclassName, weight, maxWeight):
+        """
+        Gives each object of the named dclass the indicated weight,
+        and allows up to maxWeight of them to be cached, independently
+        of maxCacheItems.  This only applies to objects cached after
+        the call.
+        """
+        self.classBudgets[dclassName] = (weight, maxWeight)
+
+    def clearClassBudget(self, dclassName):
+        self.classBudgets.pop(dclassName, None)
+
+    def getStats(self):
+        """
+        Returns a dictionary of the cache's hit, miss and eviction
+        counts, along with its current size and weight.
+        """
+        return {'hits': self.numHits,
+                'misses': self.numMisses,
+                'evictions': self.numEvictions,
+                'items': len(self.dict),
+                'weight': self.totalWeight,
+                }
+
+    def resetStats(self):
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvictions = 0
+
+    def __getClassName(self, distObj):
+        # Returns the key under which the object's class is budgeted,
+        # or None if it is not.
+        dclass = getattr(distObj, 'dclass', None)
+        if dclass is not None and not self.cacheOff:
+            className = dclass.getName()
+            if className in self.classBudgets:
+                return className
+        return None
+
+    def __add(self, distObj, className, weight):
+        doId = distObj.getDoId()
+        self.dict[doId] = distObj
+        self.classDicts.setdefault(className, OrderedDict())[doId] = distObj
+        self.entryWeights[doId] = (className, weight)
+        self.classWeights[className] = self.classWeights.get(className, 0) + weight
+        self.totalWeight += weight
+
+    def __remove(self, doId):
+        # Removes the object from all of the tables, and returns it.
+        distObj = self.dict.pop(doId)
+        className, weight = self.entryWeights.pop(doId)
+        classDict = self.classDicts[className]
+        del classDict[doId]
+        if not classDict:
+            del self.classDicts[className]
+        self.classWeights[className] -= weight
+        if not self.classWeights[className]:
+            del self.classWeights[className]
+        self.totalWeight -= weight
+        return distObj
+
+    def __evict(self, className):
+        # Deletes the least recently used object of the indicated
+        # class.
+        doId = next(iter(self.classDicts[className]))
+        distObj = self.__remove(doId)
+        self.numEvictions += 1
+        distObj.deleteOrDelay()
+        if distObj.getDelayDeleteCount() <= 0:
+            # make sure we're not leaking
+            distObj.detectLeaks()
+
+    def __enforceLimits(self, className):
+        # Evicts objects until the cache is within its limits again,
+        # after adding an object of the indicated class.
+        if className is None:
+            while None in self.classDicts and \
+                  len(self.classDicts[None]) > self.maxCacheItems:
+                self.__evict(None)
+        else:
+            maxWeight = self.classBudgets[className][1]
+            while className in self.classDicts and \
+                  self.classWeights[className] > maxWeight:
+                self.__evict(className)
+
+        if self.maxCacheWeight is not None:
+            while self.totalWeight > self.maxCacheWeight:
+                heaviest = max(self.classDicts.keys(),
+                               key = self.__getItemWeight)
+                self.__evict(heaviest)
+
+    def __getItemWeight(self, className):
+        # Returns the weight of the next object of the indicated class
+        # to be evicted.
+        doId = next(iter(self.classDicts[className]))
+        return self.entryWeights[doId][1]
 
     def flush(self):
         """
@@ -48,8 +178,11 @@ class CRCache:
                       (safeRepr(obj), itype(obj), obj.getDelayDeleteNames()))
             self.notify.error(s)
         # Null out all references to the objects so they will get gcd
-        self.dict = {}
-        self.fifo = []
+        self.dict = OrderedDict()
+        self.classDicts = {}
+        self.classWeights = {}
+        self.entryWeights = {}
+        self.totalWeight = 0
 
     def cache(self, distObj):
         # Only distributed objects are allowed in the cache
@@ -66,40 +199,32 @@ class CRCache:
             # Call disable on the distObj
             distObj.disableAndAnnounce()
 
-            # Put the distObj in the fifo and the dict
-            self.fifo.append(distObj)
-            self.dict[doId] = distObj
+            # Put the distObj in the cache, as the most recently used
+            className = self.__getClassName(distObj)
+            if className is None:
+                weight = 1
+            else:
+                weight = self.classBudgets[className][0]
+            self.__add(distObj, className, weight)
 
             success = True
 
-            if len(self.fifo) > self.maxCacheItems:
-                # if the cache is full, pop the oldest item
-                oldestDistObj = self.fifo.pop(0)
-                # and remove it from the dictionary
-                del(self.dict[oldestDistObj.getDoId()])
-                # and delete it
-                oldestDistObj.deleteOrDelay()
-                if oldestDistObj.getDelayDeleteCount() <= 0:
-                    # make sure we're not leaking
-                    oldestDistObj.detectLeaks()
-
-        # Make sure that the fifo and the dictionary are sane
-        assert len(self.dict) == len(self.fifo)
+            # if the cache is full, evict the oldest items
+            self.__enforceLimits(className)
+
+        # Make sure that the tables are sane
+        assert len(self.dict) == sum([len(d) for d in self.classDicts.values()])
         return success
 
     def retrieve(self, doId):
         assert self.checkCache()
         if doId in self.dict:
-            # Find the object
-            distObj = self.dict[doId]
-            # Remove it from the dictionary
-            del(self.dict[doId])
-            # Remove it from the fifo
-            self.fifo.remove(distObj)
-            # return the distObj
-            return distObj
+            self.numHits += 1
+            # Remove it from the cache and return the distObj
+            return self.__remove(doId)
         else:
             # If you can't find it, return None
+            self.numMisses += 1
             return None
 
     def contains(self, doId):
@@ -108,11 +233,8 @@ class CRCache:
     def delete(self, doId):
         assert self.checkCache()
         assert doId in self.dict
-        # Look it up
-        distObj = self.dict[doId]
-        # Remove it from the dict and fifo
-        del(self.dict[doId])
-        self.fifo.remove(distObj)
+        # Remove it from the cache
+        distObj = self.__remove(doId)
         # and delete it
         distObj.deleteOrDelay()
         if distObj.getDelayDeleteCount() <= 0:
@@ -132,6 +254,8 @@ class CRCache:
         self.flush()
         self.storedMaxCache = self.maxCacheItems
         self.maxCacheItems = 0
+        self.cacheOff = True
 
     def turnOn(self):
         self.maxCacheItems = self.storedMaxCache
+        self.cacheOff = False
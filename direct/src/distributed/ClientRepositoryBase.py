@@ -46,7 +46,7 @@ class ClientRepositoryBase(ConnectionRepository):
         self.recorder = base.recorder
 
         self.readDCFile(dcFileNames)
-        self.cache=CRCache.CRCache()
+        self.cache=CRCache.CRCache(base.config.GetInt('cr-cache-size', 10))
         self.doDataCache = CRDataCache()
         self.cacheOwner=CRCache.CRCache()
         self.serverDelta = 0
@@ -28,6 +28,23 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
 
     VisualizeGrid = ConfigVariableBool("visualize-cartesian-grid", False)
 
+    # If this is true, visibility keeps interest in every zone within
+    # viewingRadius cells of the avatar, instead of just the zone it is
+    # standing in.
+    RadiusInterest = ConfigVariableBool("cartesian-grid-radius-interest", False)
+
+    # How far, as a fraction of cellWidth, the avatar must move past the
+    # edge of its current cell before visibility moves to the new cell.
+    # This keeps an avatar jittering on a cell border from thrashing
+    # interest.  Note that the avatar's location zone, as sent with
+    # avatarZoneChanged, follows the same cell, so it may lag behind
+    # the cell the avatar is really standing in by up to this margin.
+    VisHysteresis = ConfigVariableDouble("cartesian-grid-vis-hysteresis", 0.0)
+
+    # How often, in seconds, to process visibility.  If this is 0,
+    # visibility is processed every frame.
+    VisInterval = ConfigVariableDouble("cartesian-grid-vis-interval", 0.0)
+
     RuleSeparator = ":"
 
     def __init__(self, cr):
@@ -35,6 +52,9 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
         # Let the derived classes instantiate the NodePath
         self.visAvatar = None
         self.gridVisContext = None
+        self.visZone = None
+        self.visZones = []
+        self.visCell = None
         # Do we have grid lines visualized?
         self._onOffState = False
         if __debug__:
@@ -121,9 +141,17 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
         self.acceptOnce(self.cr.StopVisibilityEvent, self.stopProcessVisibility)
         self.visAvatar = avatar
         self.visZone = None
+        self.visZones = []
+        self.visCell = None
         self.visDirty = True
-        taskMgr.add(
-            self.processVisibility, self.taskName("processVisibility"))
+        interval = self.VisInterval.getValue()
+        if interval > 0:
+            taskMgr.doMethodLater(
+                interval, self.__processVisibilityTick,
+                self.taskName("processVisibility"))
+        else:
+            taskMgr.add(
+                self.processVisibility, self.taskName("processVisibility"))
         self.processVisibility(0)
 
     @report(types = ['deltaStamp', 'avLocation', 'args'], dConfigParam = ['connector','shipboard'])
@@ -147,6 +175,8 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
                 messenger.send(event)
         self.visAvatar = None
         self.visZone = None
+        self.visZones = []
+        self.visCell = None
 
         # sometimes we also need to remove vis avatar from
         # my parent if it is also a grid
@@ -160,6 +190,46 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
             if(hasattr(self.cr.doId2do[self.parentId],"worldGrid")):
                 self.cr.doId2do[self.parentId].worldGrid.stopProcessVisibility(event=parentEvent)
 
+    def __processVisibilityTick(self, task):
+        # Runs processVisibility every cartesian-grid-vis-interval
+        # seconds instead of every frame.
+        if self.processVisibility(task) == Task.cont:
+            return Task.again
+        return Task.done
+
+    def getVisZones(self):
+        """Returns the list of zones we currently have visibility
+        interest in."""
+        return self.visZones
+
+    def getVisibleZones(self, zoneId):
+        """Returns the list of zones that should be visible from the
+        indicated zone: just the zone itself, or, with
+        cartesian-grid-radius-interest, every zone within
+        viewingRadius cells of it."""
+        if not self.RadiusInterest:
+            return [zoneId]
+        zones = []
+        for radius in range(self.viewingRadius + 1):
+            zones.extend(self.getConcentricZones(zoneId, radius))
+        return sorted(zones)
+
+    def __getVisCell(self, x, y):
+        # Returns the (row, col) of the cell visibility should be
+        # centered on, given the avatar's position relative to the
+        # lower-left corner of the grid.  The avatar stays in its
+        # current cell until it is more than the hysteresis margin
+        # beyond the cell's edge.
+        col = x // self.cellWidth
+        row = y // self.cellWidth
+        if self.visCell is not None and self.visCell != (row, col):
+            margin = self.VisHysteresis.getValue() * self.cellWidth
+            visRow, visCol = self.visCell
+            if ((visCol * self.cellWidth - margin <= x < (visCol + 1) * self.cellWidth + margin) and
+                (visRow * self.cellWidth - margin <= y < (visRow + 1) * self.cellWidth + margin)):
+                return self.visCell
+        return (row, col)
+
     def processVisibility(self, task):
         if self.visAvatar == None:
             # no avatar to process visibility for
@@ -175,8 +245,7 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
         dx = self.cellWidth * self.gridSize * .5
         x = pos[0] + dx
         y = pos[1] + dx
-        col = x // self.cellWidth
-        row = y // self.cellWidth
+        row, col = self.__getVisCell(x, y)
         assert self.notify.debug(
             "processVisibility: %s: avatar pos: %s %s" % (self.doId, x, y))
         if (row < 0) or (col < 0) or (row > self.gridSize) or (col > self.gridSize):
@@ -186,8 +255,11 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
             if self.gridVisContext:
                 self.cr.removeInterest(self.gridVisContext)
                 self.visZone = None
+                self.visZones = []
                 self.gridVisContext = None
+            self.visCell = None
             return Task.cont
+        self.visCell = (row, col)
         # Compute which zone we are in
         zoneId = int(self.startingZone + ((row * self.gridSize) + col))
         assert self.notify.debug("processVisibility: %s: row: %s col: %s zoneId: %s" %
@@ -203,22 +275,36 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
             assert self.notify.debug(
                 "processVisibility: %s: new interest" % (self.doId))
             self.visZone = zoneId
+            visZones = self.getVisibleZones(zoneId)
             if not self.gridVisContext:
+                self.visZones = visZones
                 self.gridVisContext = self.cr.addInterest(
-                    self.getDoId(), self.visZone,
+                    self.getDoId(), self.visZones,
                     self.uniqueName("visibility"),
                     event = self.uniqueName("visibility"))
             else:
-                assert self.notify.debug(
-                    "processVisibility: %s: altering interest to zoneId: %s" %
-                    (self.doId, zoneId))
-
-                event = None
-                if self.visDirty:
-                    event = self.uniqueName("visibility")
-                self.cr.alterInterest(
-                    self.gridVisContext, self.getDoId(), self.visZone,
-                    event = event)
+                if visZones != self.visZones:
+                    # The interest message always carries the whole
+                    # zone list, but the server only generates and
+                    # disables objects in the zones that were added or
+                    # removed.  With radius interest, the list is
+                    # recentered on every change of cell, so a message
+                    # is sent for each one.
+                    assert self.notify.debug(
+                        "processVisibility: %s: altering interest, added: %s removed: %s" %
+                        (self.doId,
+                         sorted(set(visZones) - set(self.visZones)),
+                         sorted(set(self.visZones) - set(visZones))))
+                    self.visZones = visZones
+
+                    event = None
+                    if self.visDirty:
+                        event = self.uniqueName("visibility")
+                    self.cr.alterInterest(
+                        self.gridVisContext, self.getDoId(), self.visZones,
+                        event = event)
+                elif self.visDirty:
+                    messenger.send(self.uniqueName("visibility"))
 
                 # If the visAvatar is parented to this grid, also do a
                 # setLocation
@@ -231,6 +317,9 @@ class DistributedCartesianGrid(DistributedNode, CartesianGridBase):
                     assert self.notify.debug(
                         "processVisibility: %s: changing location" %
                         (self.doId))
+                    # With cartesian-grid-vis-hysteresis, this is the
+                    # visibility cell's zone, which may lag behind the
+                    # avatar's true cell.
                     messenger.send("avatarZoneChanged", [self.visAvatar, self.doId, zoneId])
                     #self.handleAvatarZoneChange(self.visAvatar, zoneId)
             self.visDirty = False
@@ -109,6 +109,25 @@ class ServerRepository:
         # need to be flushed.
         self.needsFlush = set()
 
+        # A dictionary of (doId, fieldId) -> (client, object,
+        # datagram, payload), holding the latest value of each field
+        # marked "broadcast coalesce" that has been received since the
+        # last time these were sent on.  See coalesceUpdate().
+        self.pendingUpdates = {}
+
+        # A dictionary of doId -> {fieldId: payload}, recording the
+        # last value of each coalesced field that was sent on, so that
+        # repeats of the same value can be dropped.
+        self.lastCoalescedPayloads = {}
+
+        # The minimum time, in seconds, between sending on the
+        # coalesced updates.  If this is 0, they are sent every frame.
+        # This runs on the default task chain, even with threaded-net,
+        # since it walks the same structures as the reader task.
+        self.coalesceInterval = ConfigVariableDouble('coalesce-update-interval', 0.0).getValue()
+        taskMgr.doMethodLater(self.coalesceInterval, self.coalesceTask,
+                              'serverCoalesceTask')
+
         collectTcpInterval = ConfigVariableDouble('collect-tcp-interval').getValue()
         taskMgr.doMethodLater(collectTcpInterval, self.flushTask, 'flushTask',
                               taskChain = 'flushTask')
@@ -135,7 +154,7 @@ class ServerRepository:
 
         # An allocator object that assigns the next doIdBase to each
         # client.
-        self.idAllocator = UniqueIdAllocator(0, 0xffffffff / self.doIdRange)
+        self.idAllocator = UniqueIdAllocator(0, 0xffffffff // self.doIdRange)
 
         self.dcFile = DCFile()
         self.dcSuffix = ''
@@ -154,6 +173,15 @@ class ServerRepository:
 
         return Task.again
 
+    def coalesceTask(self, task):
+        """ This task is run periodically to send on the coalesced
+        updates; see coalesceUpdate(). """
+
+        if self.pendingUpdates:
+            self.flushCoalescedUpdates()
+
+        return Task.again
+
     def setTcpHeaderSize(self, headerSize):
         """Sets the header size of TCP packets.  At the present, legal
         values for this are 0, 2, or 4; this specifies the number of
@@ -470,12 +498,13 @@ class ServerRepository:
 
         # We reformat the message slightly to insert the sender's
         # doIdBase.
+        payload = dgi.getRemainingBytes()
         dg = PyDatagram()
         dg.addUint16(OBJECT_UPDATE_FIELD_CMU)
         dg.addUint32(client.doIdBase)
         dg.addUint32(doId)
         dg.addUint16(fieldId)
-        dg.appendData(dgi.getRemainingBytes())
+        dg.appendData(payload)
 
         if targeted:
             # A targeted update: only to the indicated client.
@@ -495,8 +524,13 @@ class ServerRepository:
             self.needsFlush.add(owner)
 
         elif dcfield.hasKeyword('broadcast'):
-            # Broadcast: to everyone except orig sender
-            self.sendToZoneExcept(object.zoneId, dg, [client])
+            if dcfield.hasKeyword('coalesce'):
+                # Coalesce: only the latest value is sent on, at the
+                # next coalesceTask.
+                self.coalesceUpdate(client, object, fieldId, dg, payload)
+            else:
+                # Broadcast: to everyone except orig sender
+                self.sendToZoneExcept(object.zoneId, dg, [client])
 
         elif dcfield.hasKeyword('reflect'):
             # Reflect: broadcast to everyone including orig sender
@@ -506,6 +540,41 @@ class ServerRepository:
             self.notify.warning(
                 "Message is not broadcast or p2p")
 
+    def coalesceUpdate(self, client, object, fieldId, datagram, payload):
+        """ Records a broadcast update for a field that has the
+        "coalesce" keyword.  Rather than being sent on immediately, it
+        replaces any earlier update to the same field of the same
+        object that has not yet been sent, and the latest value is
+        broadcast by coalesceTask.  An update that repeats
+        the value most recently sent on is dropped altogether.  This
+        is intended for fields like the smoothed position updates,
+        where only the most recent value matters. """
+
+        key = (object.doId, fieldId)
+        lastPayloads = self.lastCoalescedPayloads.get(object.doId)
+        if lastPayloads and lastPayloads.get(fieldId) == payload:
+            # The clients already have this value.
+            self.pendingUpdates.pop(key, None)
+            return
+
+        self.pendingUpdates[key] = (client, object, datagram, payload)
+
+    def flushCoalescedUpdates(self):
+        """ Broadcasts the latest value of each of the coalesced
+        updates that have been received since the last call.  This is
+        normally called from coalesceTask. """
+
+        pending = self.pendingUpdates
+        self.pendingUpdates = {}
+        for (doId, fieldId), (client, object, datagram, payload) in pending.items():
+            owner = self.clientsByDoIdBase.get(self.getDoIdBase(doId))
+            if not owner or owner.objectsByDoId.get(doId) is not object:
+                # The object has been deleted in the meantime.
+                continue
+
+            self.lastCoalescedPayloads.setdefault(doId, {})[fieldId] = payload
+            self.sendToZoneExcept(object.zoneId, datagram, [client])
+
     def getDoIdBase(self, doId):
         """ Given a doId, return the corresponding doIdBase.  This
         will be the owner of the object (clients may only create
@@ -535,6 +604,7 @@ class ServerRepository:
         if not client.objectsByZoneId[object.zoneId]:
             del client.objectsByZoneId[object.zoneId]
         del client.objectsByDoId[doId]
+        self.lastCoalescedPayloads.pop(doId, None)
 
         self.updateClientInterestZones(client)
 
@@ -569,6 +639,10 @@ class ServerRepository:
 
         object.zoneId = zoneId
         self.objectsByZoneId.setdefault(zoneId, set()).add(object)
+
+        # The clients in the new zone haven't seen the values last
+        # sent on for this object.
+        self.lastCoalescedPayloads.pop(object.doId, None)
         owner.objectsByZoneId.setdefault(zoneId, set()).add(object)
 
         self.updateClientInterestZones(owner)
@@ -619,6 +693,7 @@ class ServerRepository:
             self.objectsByZoneId[object.zoneId].remove(object)
             if not self.objectsByZoneId[object.zoneId]:
                 del self.objectsByZoneId[object.zoneId]
+            self.lastCoalescedPayloads.pop(object.doId, None)
 
         client.objectsByDoId = {}
         client.objectsByZoneId = {}
@@ -626,7 +701,7 @@ class ServerRepository:
         del self.clientsByConnection[client.connection]
         del self.clientsByDoIdBase[client.doIdBase]
 
-        id = client.doIdBase / self.doIdRange
+        id = client.doIdBase // self.doIdRange
         self.idAllocator.free(id)
 
         self.qcr.removeConnection(client.connection)
@@ -670,6 +745,12 @@ class ServerRepository:
             datagram.addUint32(zoneId)
             self.sendToZoneExcept(zoneId, datagram, [client])
 
+            # Nor has this client seen the coalesced values last sent
+            # on for the objects in this zone, so don't suppress the
+            # next repeat of any of them.
+            for object in self.objectsByZoneId.get(zoneId, ()):
+                self.lastCoalescedPayloads.pop(object.doId, None)
+
         datagram = PyDatagram()
         datagram.addUint16(OBJECT_DISABLE_CMU)
         for zoneId in removedZoneIds:
@@ -694,20 +775,21 @@ class ServerRepository:
 
     def sendToZoneExcept(self, zoneId, datagram, exceptionList):
         """sends a message to everyone who has interest in the
-        indicated zone, except for the clients on exceptionList."""
+        indicated zone, except for the clients on exceptionList.
+        exceptionList may be any collection of clients, but a set is
+        the most efficient."""
 
         if self.notify.getDebug():
             self.notify.debug(
                 "ServerRepository sending to all in zone %s except %s:" % (zoneId, [c.doIdBase for c in exceptionList]))
             #datagram.dumpHex(ostream)
 
-        for client in self.zonesToClients.get(zoneId, []):
-            if client not in exceptionList:
-                if self.notify.getDebug():
-                    self.notify.debug(
-                        "  -> %s" % (client.doIdBase))
-                self.cw.send(datagram, client.connection)
-                self.needsFlush.add(client)
+        clients = self.zonesToClients.get(zoneId)
+        if not clients:
+            return
+        if exceptionList:
+            clients = clients.difference(exceptionList)
+        self.sendToClients(datagram, clients)
 
     def sendToAllExcept(self, datagram, exceptionList):
         """ sends a message to all connected clients, except for
@@ -718,10 +800,23 @@ class ServerRepository:
                 "ServerRepository sending to all except %s:" % ([c.doIdBase for c in exceptionList],))
             #datagram.dumpHex(ostream)
 
-        for client in self.clientsByConnection.values():
-            if client not in exceptionList:
-                if self.notify.getDebug():
-                    self.notify.debug(
-                        "  -> %s" % (client.doIdBase))
-                self.cw.send(datagram, client.connection)
-                self.needsFlush.add(client)
+        clients = set(self.clientsByConnection.values())
+        if exceptionList:
+            clients.difference_update(exceptionList)
+        self.sendToClients(datagram, clients)
+
+    def sendToClients(self, datagram, clients):
+        """ sends the same datagram to each of the indicated clients.
+        The datagram is serialized once by the caller and shared by
+        all of the recipients, and the clients are all queued for the
+        next flushTask at once. """
+
+        if self.notify.getDebug():
+            for client in clients:
+                self.notify.debug(
+                    "  -> %s" % (client.doIdBase))
+
+        send = self.cw.send
+        for client in clients:
+            send(datagram, client.connection)
+        self.needsFlush.update(clients)
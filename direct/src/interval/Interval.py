@@ -4,12 +4,12 @@ __all__ = ['Interval']
 
 from direct.directnotify.DirectNotifyGlobal import directNotify
 from direct.showbase.DirectObject import DirectObject
-from direct.task.Task import Task, TaskManager
-from direct.task.TaskManagerGlobal import taskMgr
+from direct.task.Task import TaskManager
 from panda3d.core import *
 from panda3d.direct import *
 from direct.extensions_native import CInterval_extensions
 from direct.extensions_native import NodePath_extensions
+from direct.interval.IntervalManager import ivalMgr
 import math
 
 class Interval(DirectObject):
@@ -36,6 +36,10 @@ class Interval(DirectObject):
         self.__doLoop = 0
         self.__loopCount = 0
 
+        # Our slot in the ivalMgr while we are playing.
+        self.playIndex = None
+        self.playName = None
+
         self.pstats = None
         if __debug__ and TaskManager.taskTimerVerbose:
             self.pname = name.split('-', 1)[0]
@@ -170,7 +174,7 @@ class Interval(DirectObject):
         self.currT = 0.0
 
     def isPlaying(self):
-        return taskMgr.hasTaskNamed(self.getName() + '-play')
+        return self.playIndex is not None
 
     def getPlayRate(self):
         """ Returns the play rate as set by the last call to start(),
@@ -421,30 +425,13 @@ class Interval(DirectObject):
             self.pstats.stop()
 
     def __spawnTask(self):
-        # Spawn task
+        # Have the ivalMgr step us each frame.  This also stops any
+        # similarly-named but different interval.
         self.__removeTask()
-        taskName = self.getName() + '-play'
-        task = Task(self.__playTask)
-        task.interval = self
-        taskMgr.add(task, taskName)
+        ivalMgr.playInterval(self)
 
     def __removeTask(self):
-        # Kill old task(s), including those from a similarly-named but
-        # different interval.
-        taskName = self.getName() + '-play'
-        oldTasks = taskMgr.getTasksNamed(taskName)
-        for task in oldTasks:
-            if hasattr(task, "interval"):
-                task.interval.privInterrupt()
-                taskMgr.remove(task)
-
-    def __playTask(self, task):
-        again = self.stepPlay()
-        self.privPostEvent()
-        if again:
-            return Task.cont
-        else:
-            return Task.done
+        ivalMgr.stopInterval(self)
 
     def popupControls(self, tl = None):
         """
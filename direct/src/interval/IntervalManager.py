@@ -6,6 +6,8 @@ from panda3d.core import *
 from panda3d.direct import *
 from direct.directnotify.DirectNotifyGlobal import *
 from direct.showbase import EventManager
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.task import Task
 import fnmatch
 
 class IntervalManager(CIntervalManager):
@@ -31,6 +33,16 @@ class IntervalManager(CIntervalManager):
         self.ivals = []
         self.removedIvals = {}
 
+        # The Python-based Intervals that are currently playing, in
+        # the order they were started.  These are stepped from step()
+        # rather than each from its own task.  An interval that stops
+        # leaves None in its slot, which is compacted away on the next
+        # step; each interval records its own slot in playIndex.
+        self.playingIvals = []
+        self.playingIvalsByName = {}
+        self.__playingHoles = 0
+        self.__playTaskRunning = False
+
     def addInterval(self, interval):
         index = self.addCInterval(interval, 1)
         self.__storeInterval(interval, index)
@@ -40,7 +52,7 @@ class IntervalManager(CIntervalManager):
         if index >= 0:
             self.removeCInterval(index)
             if index < len(self.ivals):
-                self.ivals[index] = None
+                self.__clearInterval(index)
             return 1
         return 0
 
@@ -56,15 +68,20 @@ class IntervalManager(CIntervalManager):
     def getIntervalsMatching(self, pattern):
         ivals = []
 
-        count = 0
-        maxIndex = self.getMaxIndex()
-        for index in range(maxIndex):
+        # If the pattern begins with some literal text, as in
+        # 'avatar-123-*', only the intervals whose names begin with
+        # that text can match, and the C++ name index can list just
+        # those; otherwise we have to look at every interval.
+        prefix = self.__getPatternPrefix(pattern)
+        if prefix:
+            indices = self.__findIndicesWithPrefix(prefix)
+        else:
+            indices = range(self.getMaxIndex())
+
+        for index in indices:
             ival = self.getCInterval(index)
             if ival and \
                fnmatch.fnmatchcase(ival.getName(), pattern):
-                # Finish and remove this interval.  Finishing it
-                # automatically removes it.
-                count += 1
                 if index < len(self.ivals) and self.ivals[index]:
                     # Get the python version if we have it
                     ivals.append(self.ivals[index])
@@ -74,6 +91,27 @@ class IntervalManager(CIntervalManager):
 
         return ivals
 
+    def __getPatternPrefix(self, pattern):
+        # Returns the part of the glob pattern before the first
+        # wildcard.
+        for i in range(len(pattern)):
+            if pattern[i] in '*?[':
+                return pattern[:i]
+        return pattern
+
+    def __findIndicesWithPrefix(self, prefix):
+        # Returns the indices of the intervals whose names begin with
+        # the indicated prefix.
+        indices = []
+        index = self.findCInterval(prefix)
+        if index >= 0:
+            indices.append(index)
+        name = self.findNextCIntervalName(prefix)
+        while name and name.startswith(prefix):
+            indices.append(self.findCInterval(name))
+            name = self.findNextCIntervalName(name)
+        return indices
+
     def finishIntervalsMatching(self, pattern):
         ivals = self.getIntervalsMatching(pattern)
         for ival in ivals:
@@ -89,10 +127,101 @@ class IntervalManager(CIntervalManager):
     def step(self):
         # This method should be called once per frame to perform all
         # of the per-frame processing on the active intervals.
-        # Call C++ step, then do the Python stuff.
+        # Step the Python-based intervals, then call C++ step, then
+        # do the Python stuff.
+        self.stepPlayingIntervals()
         CIntervalManager.step(self)
         self.__doPythonCallbacks()
 
+    def playInterval(self, ival):
+        """Starts stepping the indicated Python-based Interval once
+        per frame, until it finishes or stopInterval() is called.  Only
+        one interval of a given name may be playing; starting another
+        one interrupts the first.  This is called by Interval.start()
+        and its relatives.
+
+        The intervals are stepped from step(), which ShowBase calls
+        from its ivalLoop task at sort 20, after the C++ intervals'
+        own tasks; note that this means a Python interval is stepped
+        after any user task with a sort below 20, rather than at sort
+        0 in a task of its own as in earlier versions.  If there is no
+        ivalLoop task, an ivalMgrPlay task at the same sort steps them
+        instead."""
+        name = ival.getName()
+        other = self.playingIvalsByName.get(name)
+        if other is not None:
+            self.stopInterval(other)
+
+        if not self.__playTaskRunning:
+            # This checks each frame whether anybody is calling
+            # step(); if not (we are running without a ShowBase, or
+            # it has stopped its ivalLoop), it steps the Python
+            # intervals itself.
+            self.__playTaskRunning = True
+            taskMgr.add(self.__playTask, 'ivalMgrPlay', sort = 20,
+                        uponDeath = self.__playTaskDied)
+
+        ival.playIndex = len(self.playingIvals)
+        ival.playName = name
+        self.playingIvals.append(ival)
+        self.playingIvalsByName[name] = ival
+
+    def stopInterval(self, ival):
+        """Stops stepping the indicated Python-based Interval, and
+        interrupts it, if it is playing."""
+        if self.__removePlaying(ival):
+            ival.privInterrupt()
+
+    def isIntervalPlaying(self, ival):
+        return ival.playIndex is not None
+
+    def getNumPlayingIntervals(self):
+        return len(self.playingIvalsByName)
+
+    def __removePlaying(self, ival):
+        index = ival.playIndex
+        if index is None:
+            return False
+        self.playingIvals[index] = None
+        self.__playingHoles += 1
+        ival.playIndex = None
+        del self.playingIvalsByName[ival.playName]
+        return True
+
+    def stepPlayingIntervals(self):
+        # Steps each of the playing Python-based intervals, once per
+        # frame.  Intervals started while we are stepping are not
+        # stepped until the next frame.
+        ivals = self.playingIvals
+        numIvals = len(ivals)
+        for index in range(numIvals):
+            ival = ivals[index]
+            if ival is None:
+                continue
+            again = ival.stepPlay()
+            ival.privPostEvent()
+            if not again and ival.playIndex == index:
+                self.__removePlaying(ival)
+
+        if self.__playingHoles:
+            ivals = [ival for ival in ivals if ival is not None]
+            for index in range(len(ivals)):
+                ivals[index].playIndex = index
+            self.playingIvals = ivals
+            self.__playingHoles = 0
+
+    def __playTask(self, task):
+        if not taskMgr.hasTaskNamed('ivalLoop'):
+            self.stepPlayingIntervals()
+        if self.playingIvals:
+            return Task.cont
+        return Task.done
+
+    def __playTaskDied(self, task):
+        # The task may also have been removed by a cleanup of all
+        # tasks; the next playInterval() starts it again.
+        self.__playTaskRunning = False
+
     def interrupt(self):
         # This method should be called during an emergency cleanup
         # operation, to automatically pause or finish all active
@@ -113,7 +242,7 @@ class IntervalManager(CIntervalManager):
             # privPostEvent() on it, because the interval might itself
             # try to add a new interval.
             ival = self.ivals[index]
-            self.ivals[index] = None
+            self.__clearInterval(index)
             ival.privPostEvent()
             index = self.getNextRemoval()
 
@@ -130,6 +259,15 @@ class IntervalManager(CIntervalManager):
         self.MyEventmanager.doEvents()
 
 
+    def __clearInterval(self, index):
+        self.ivals[index] = None
+        # The C++ side hands out the free indices again before it
+        # makes new ones, so we need only keep the list as long as the
+        # highest index still in use.
+        ivals = self.ivals
+        while ivals and ivals[-1] is None:
+            ivals.pop()
+
     def __storeInterval(self, interval, index):
         while index >= len(self.ivals):
             self.ivals.append(None)
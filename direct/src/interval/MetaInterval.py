@@ -1,6 +1,7 @@
 """Undocumented Module"""
 
-__all__ = ['MetaInterval', 'Sequence', 'Parallel', 'ParallelEndTogether', 'Track']
+__all__ = ['MetaInterval', 'Sequence', 'Parallel', 'ParallelEndTogether', 'Track',
+           'MetaIntervalTemplate', 'TemplateInterval', 'TemplateParam']
 
 from panda3d.core import *
 from panda3d.direct import *
@@ -405,7 +406,8 @@ class MetaInterval(CMetaInterval):
         # this is the same as asking that the component is itself an
         # Interval.
         return isinstance(component, CInterval) or \
-               isinstance(component, Interval.Interval)
+               isinstance(component, Interval.Interval) or \
+               isinstance(component, TemplateInterval)
 
     def validateComponents(self, components):
         # This is called only in debug mode to verify that all the
@@ -627,3 +629,177 @@ class Track(MetaInterval):
 
         # Looks good.
         return 1
+
+
+class TemplateParam:
+    """
+    Stands in for a named parameter of a MetaIntervalTemplate, in the
+    arguments to a TemplateInterval.  It is replaced with the value of
+    that parameter each time the template is instantiated.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'TemplateParam(%r)' % (self.name)
+
+
+class TemplateInterval:
+    """
+    Stands in for an interval in the structure of a
+    MetaIntervalTemplate.  Each time the template is instantiated, a
+    new interval is made by calling factory with the indicated
+    arguments, after replacing any TemplateParam among them (or among
+    the keyword arguments) with the value of that parameter.  For
+    instance:
+
+      TemplateInterval(LerpScaleInterval, TemplateParam('target'), 0.2, 1.5)
+    """
+
+    def __init__(self, factory, *args, **kw):
+        self.factory = factory
+        self.args = args
+        self.kw = kw
+
+        # Note where the parameters go, so make() need not look at
+        # the other arguments.
+        self.argParams = [(i, args[i].name) for i in range(len(args))
+                          if isinstance(args[i], TemplateParam)]
+        self.kwParams = [(key, value.name) for key, value in kw.items()
+                         if isinstance(value, TemplateParam)]
+
+    def make(self, params):
+        args = self.args
+        if self.argParams:
+            args = list(args)
+            for i, name in self.argParams:
+                args[i] = params[name]
+        kw = self.kw
+        if self.kwParams:
+            kw = dict(kw)
+            for key, name in self.kwParams:
+                kw[key] = params[name]
+        return self.factory(*args, **kw)
+
+    def getName(self):
+        return self.factory.__name__
+
+    def getDuration(self):
+        # The duration isn't known until the interval is made.
+        MetaInterval.notify.error(
+            "Duration of a TemplateInterval is not known; it cannot be used in a ParallelEndTogether.")
+
+
+class MetaIntervalTemplate:
+    """
+    A MetaInterval structure that is built once and then instantiated
+    many times, each time against new targets or other parameters.
+
+    The structure is written with the ordinary Sequence, Parallel,
+    Track and similar classes, except that each interval that depends
+    on a parameter is written as a TemplateInterval.  The template
+    walks the structure once, and records the timeline that the
+    MetaIntervals would have added to their C++ list.  instantiate()
+    then makes only the TemplateIntervals, and replays the recorded
+    timeline into a new MetaInterval, without constructing the nested
+    MetaIntervals or walking them again:
+
+      hitTemplate = MetaIntervalTemplate(Sequence(
+          TemplateInterval(LerpScaleInterval, TemplateParam('target'), 0.1, 1.2),
+          TemplateInterval(LerpScaleInterval, TemplateParam('target'), 0.1, 1.0),
+          Wait(0.5)))
+      hitTemplate.instantiate(target = avatar).start()
+
+    Intervals in the structure that are not TemplateIntervals, like
+    the Wait above, are shared by all of the instances, so they should
+    be intervals that don't mind being played by several MetaIntervals
+    at once.  A ParallelEndTogether may not contain TemplateIntervals,
+    since their durations are not known in advance.
+    """
+
+    notify = directNotify.newCategory("MetaIntervalTemplate")
+
+    class Recorder(MetaInterval):
+        # Stands in for the root CMetaInterval while the template's
+        # structure is walked, and records what is added to it.
+
+        def __init__(self):
+            MetaInterval.__init__(self, name = 'MetaIntervalTemplate-recorder')
+            self.timeline = []
+
+        def pushLevel(self, name, relTime, relTo):
+            self.timeline.append((MetaIntervalTemplate.PushLevel, name, relTime, relTo))
+
+        def popLevel(self, duration = -1.0):
+            self.timeline.append((MetaIntervalTemplate.PopLevel, duration))
+
+        def addInterval(self, ival, relTime, relTo):
+            if isinstance(ival, MetaInterval) and \
+               not getattr(ival, "inPython", 0):
+                ival.applyIvals(self, relTime, relTo)
+            else:
+                self.timeline.append((MetaIntervalTemplate.AddInterval, ival, relTime, relTo))
+
+    PushLevel = 0
+    PopLevel = 1
+    AddInterval = 2
+
+    def __init__(self, structure, name = None):
+        if name == None:
+            name = structure.getName().split('-', 1)[0] + 'Template'
+        self.name = name
+
+        # The root is recorded with a relTime of None, which is
+        # replaced with the instance's own relTime when it is
+        # replayed.
+        recorder = MetaIntervalTemplate.Recorder()
+        structure.applyIvals(recorder, None, None)
+        self.timeline = recorder.timeline
+        self.templateIvals = [entry[1] for entry in self.timeline
+                              if entry[0] == self.AddInterval and
+                              isinstance(entry[1], TemplateInterval)]
+
+    def getName(self):
+        return self.name
+
+    def instantiate(self, name = None, **params):
+        """Returns a new MetaInterval that plays the template's
+        structure, with the TemplateIntervals made from the indicated
+        parameters.  The MetaInterval may be played, or added to
+        another MetaInterval, like any other; but intervals may not be
+        added to or removed from it."""
+        ivals = [ival.make(params) for ival in self.templateIvals]
+        if name == None:
+            name = self.name + '-%d'
+        return TemplateInstance(self, ivals, name = name)
+
+
+class TemplateInstance(MetaInterval):
+    # The MetaInterval returned by MetaIntervalTemplate.instantiate().
+
+    def __init__(self, template, templateIvals, **kw):
+        MetaInterval.__init__(self, **kw)
+        self.template = template
+        self.templateIvals = templateIvals
+
+    def applyIvals(self, meta, relTime, relTo):
+        # Replay the template's timeline, substituting our own
+        # intervals for its TemplateIntervals.
+        templateIvals = iter(self.templateIvals)
+        for entry in self.template.timeline:
+            if entry[0] == MetaIntervalTemplate.AddInterval:
+                ival = entry[1]
+                if isinstance(ival, TemplateInterval):
+                    ival = next(templateIvals)
+                if entry[2] is None:
+                    meta.addInterval(ival, relTime, relTo)
+                else:
+                    meta.addInterval(ival, entry[2], entry[3])
+            elif entry[0] == MetaIntervalTemplate.PushLevel:
+                if entry[2] is None:
+                    meta.pushLevel(entry[1], relTime, relTo)
+                else:
+                    meta.pushLevel(entry[1], entry[2], entry[3])
+            else:
+                meta.popLevel(entry[1])
@@ -118,6 +118,26 @@ find_c_interval(const string &name) const {
   return -1;
 }
 
+/**
+ * Returns the name of the interval whose name comes next after the indicated
+ * name in sorted order, or the empty string if there is no such interval.
+ * The indicated name need not be the name of an interval.
+ *
+ * Starting from a prefix, this walks through just the intervals whose names
+ * begin with that prefix, without visiting every index up to
+ * get_max_index().
+ */
+string CIntervalManager::
+find_next_c_interval_name(const string &name) const {
+  MutexHolder holder(_lock);
+
+  NameIndex::const_iterator ni = _name_index.upper_bound(name);
+  if (ni != _name_index.end()) {
+    return (*ni).first;
+  }
+  return string();
+}
+
 /**
  * Returns the interval associated with the given index.
  */
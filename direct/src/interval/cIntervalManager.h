@@ -46,6 +46,7 @@ PUBLISHED:
 
   int add_c_interval(CInterval *interval, bool external);
   int find_c_interval(const string &name) const;
+  string find_next_c_interval_name(const string &name) const;
 
   CInterval *get_c_interval(int index) const;
   void remove_c_interval(int index);
@@ -696,6 +696,7 @@ class AppRunner(DirectObject):
             # that if the app calls run() within its own main.py, it
             # will properly get ignored by ShowBase.
             self.initialAppImport = True
+            VFSImporter.markImportTiming('importing %s' % (moduleName))
 
             # Python won't let us import a module named __main__.  So,
             # we have to do that manually, via the VFSImporter.
@@ -710,6 +711,7 @@ class AppRunner(DirectObject):
             else:
                 __import__(moduleName)
                 mainModule = sys.modules[moduleName]
+            VFSImporter.markImportTiming('imported %s' % (moduleName))
 
             # Check if it has a main() function.  If so, call it.
             if hasattr(mainModule, 'main') and hasattr(mainModule.main, '__call__'):
@@ -945,7 +947,9 @@ class AppRunner(DirectObject):
         # Mount the Multifile under self.multifileRoot.
         vfs.mount(mf, self.multifileRoot, vfs.MFReadOnly)
         self.p3dMultifile = mf
+        VFSImporter.loadImportMap(self.multifileRoot)
         VFSImporter.reloadSharedPackages()
+        VFSImporter.markImportTiming('mounted %s' % (fname))
 
         self.loadMultifilePrcFiles(mf, self.multifileRoot)
         self.gotP3DFilename = True
@@ -1106,6 +1110,7 @@ class AppRunner(DirectObject):
 
         if not self.windowOpened:
             self.windowOpened = True
+            VFSImporter.markImportTiming('window opened')
 
             # Now that the window is open, we don't need to keep those
             # prc settings around any more.
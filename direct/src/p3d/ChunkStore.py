@@ -0,0 +1,495 @@
+__all__ = ["ChunkStore", "ChunkManifest", "ChunkMaker"]
+
+from direct.p3d.FileSpec import FileSpec
+from direct.p3d.SeqValue import SeqValue
+from panda3d.core import Filename, TiXmlDocument, TiXmlDeclaration, TiXmlElement, decompressFile
+import hashlib
+import zlib
+import os
+
+class ChunkManifest:
+    """ This class lists the chunks, in order, that make up one
+    version of a package archive.  It is written to an xml file that
+    sits alongside the archive, named by the chunk_manifest element of
+    the package's desc file. """
+
+    class Chunk:
+        """ One chunk of the archive.  hash and size describe the
+        chunk's data; storedHash and storedSize describe the
+        compressed file that holds it in a ChunkStore. """
+
+        def __init__(self, hash = None, size = 0, storedHash = None, storedSize = 0):
+            self.hash = hash
+            self.size = size
+            self.storedHash = storedHash
+            self.storedSize = storedSize
+
+        def loadXml(self, xchunk):
+            self.hash = xchunk.Attribute('hash')
+            self.size = int(xchunk.Attribute('size') or '0')
+            self.storedHash = xchunk.Attribute('stored_hash')
+            self.storedSize = int(xchunk.Attribute('stored_size') or '0')
+
+        def makeXml(self):
+            xchunk = TiXmlElement('chunk')
+            xchunk.SetAttribute('hash', self.hash)
+            xchunk.SetAttribute('size', str(self.size))
+            xchunk.SetAttribute('stored_hash', self.storedHash)
+            xchunk.SetAttribute('stored_size', str(self.storedSize))
+            return xchunk
+
+        def makeFileSpec(self):
+            """ Returns a FileSpec for the compressed file that holds
+            this chunk, relative to the root of a ChunkStore. """
+            fileSpec = FileSpec()
+            fileSpec.filename = ChunkStore.getChunkFilename(self.hash)
+            fileSpec.basename = Filename(fileSpec.filename).getBasename()
+            fileSpec.size = self.storedSize
+            fileSpec.hash = self.storedHash
+            return fileSpec
+
+    def __init__(self):
+        # The archive that the chunks make up.
+        self.filename = None
+        self.size = 0
+        self.hash = None
+
+        self.chunks = []
+
+    def getChunkHashes(self):
+        """ Returns a dictionary of the chunk hashes in this manifest,
+        mapped to the offset within the archive of the first
+        occurrence of each one. """
+        hashes = {}
+        offset = 0
+        for chunk in self.chunks:
+            hashes.setdefault(chunk.hash, offset)
+            offset += chunk.size
+        return hashes
+
+    def getUniqueChunks(self):
+        """ Returns the list of chunks in this manifest, without
+        duplicates. """
+        chunks = []
+        seen = set()
+        for chunk in self.chunks:
+            if chunk.hash not in seen:
+                seen.add(chunk.hash)
+                chunks.append(chunk)
+        return chunks
+
+    def readFile(self, pathname):
+        """ Reads the manifest from the indicated xml file.  Returns
+        true on success, false on failure. """
+
+        doc = TiXmlDocument(pathname.toOsSpecific())
+        if not doc.LoadFile():
+            return False
+
+        xmanifest = doc.FirstChildElement('chunk_manifest')
+        if not xmanifest:
+            return False
+
+        fileSpec = FileSpec()
+        fileSpec.loadXml(xmanifest)
+        self.filename = fileSpec.filename
+        self.size = fileSpec.size
+        self.hash = fileSpec.hash
+
+        self.chunks = []
+        xchunk = xmanifest.FirstChildElement('chunk')
+        while xchunk:
+            chunk = self.Chunk()
+            chunk.loadXml(xchunk)
+            self.chunks.append(chunk)
+            xchunk = xchunk.NextSiblingElement('chunk')
+
+        return True
+
+    def writeFile(self, pathname):
+        """ Writes the manifest to the indicated xml file. """
+
+        doc = TiXmlDocument(pathname.toOsSpecific())
+        decl = TiXmlDeclaration("1.0", "utf-8", "")
+        doc.InsertEndChild(decl)
+
+        xmanifest = TiXmlElement('chunk_manifest')
+        xmanifest.SetAttribute('filename', self.filename)
+        xmanifest.SetAttribute('size', str(self.size))
+        xmanifest.SetAttribute('hash', self.hash)
+        for chunk in self.chunks:
+            xmanifest.InsertEndChild(chunk.makeXml())
+        doc.InsertEndChild(xmanifest)
+
+        pathname.makeDir()
+        return doc.SaveFile()
+
+
+class ChunkStore:
+    """ This class manages a directory of content-addressed chunks:
+    pieces of package archives, each stored compressed in a file named
+    by the md5 hash of its data.  An archive is cut into chunks at
+    boundaries chosen by the content itself, with a rolling hash, so
+    that inserting or removing data in one place only changes the
+    chunks near that place; the unchanged chunks of a new version are
+    the same chunks as in the previous version, and are stored (and
+    downloaded) only once.
+
+    On the host, the store is the "chunks" directory at the root of
+    the install directory, shared by all packages.  On the client, it
+    is a cache of the chunks downloaded for an update that has not
+    yet been completed. """
+
+    # The name of the store directory, relative to the root of the
+    # host.
+    StoreDirname = 'chunks'
+
+    # The default limits on the size of a chunk.
+    minChunkSize = 8 * 1024
+    avgChunkSize = 32 * 1024
+    maxChunkSize = 128 * 1024
+
+    # The table of random values for the rolling hash.  These must
+    # never change, or the chunks of new versions won't match those
+    # of old versions.
+    Gear = [int(hashlib.md5(('gear%d' % (i)).encode('ascii')).hexdigest()[:8], 16)
+            for i in range(256)]
+
+    # The size of the buffer read from an archive at a time.
+    readSize = 1024 * 1024
+
+    def __init__(self, storeDir, minChunkSize = None, avgChunkSize = None,
+                 maxChunkSize = None):
+        self.storeDir = Filename(storeDir)
+        if minChunkSize is not None:
+            self.minChunkSize = minChunkSize
+        if avgChunkSize is not None:
+            self.avgChunkSize = avgChunkSize
+        if maxChunkSize is not None:
+            self.maxChunkSize = maxChunkSize
+        assert 64 <= self.minChunkSize < self.avgChunkSize < self.maxChunkSize
+
+        # A boundary falls where the top bits of the rolling hash are
+        # all zero.  We test the top bits, because each bit of the
+        # hash depends on one more byte than the bit below it.
+        bits = 1
+        while (1 << (bits + 1)) <= self.avgChunkSize - self.minChunkSize:
+            bits += 1
+        self.mask = ((1 << bits) - 1) << (32 - bits)
+
+        # The number of chunks, and the bytes stored for them, that
+        # were added to the store by addFile().
+        self.newChunks = 0
+        self.newBytes = 0
+
+    @staticmethod
+    def getChunkFilename(hash):
+        """ Returns the filename of the indicated chunk, relative to
+        the root of the store. """
+        return '%s/%s.pz' % (hash[:2], hash)
+
+    def getChunkPathname(self, hash):
+        return Filename(self.storeDir, self.getChunkFilename(hash))
+
+    def hasChunk(self, chunk):
+        """ Returns true if the store has a file of the right size for
+        the indicated chunk. """
+        pathname = self.getChunkPathname(chunk.hash)
+        try:
+            return os.stat(pathname.toOsSpecific()).st_size == chunk.storedSize
+        except OSError:
+            return False
+
+    def addChunk(self, data):
+        """ Stores the indicated data as a chunk, if it is not already
+        stored, and returns its ChunkManifest.Chunk. """
+
+        hash = hashlib.md5(data).hexdigest()
+        stored = zlib.compress(data, 9)
+        chunk = ChunkManifest.Chunk(hash, len(data), hashlib.md5(stored).hexdigest(), len(stored))
+        if not self.hasChunk(chunk):
+            pathname = self.getChunkPathname(hash)
+            pathname.setBinary()
+            pathname.makeDir()
+            tempPathname = Filename(pathname.getFullpath() + '.tmp')
+            f = open(tempPathname.toOsSpecific(), 'wb')
+            f.write(stored)
+            f.close()
+            pathname.unlink()
+            tempPathname.renameTo(pathname)
+            self.newChunks += 1
+            self.newBytes += len(stored)
+        return chunk
+
+    def readChunk(self, chunk):
+        """ Returns the data of the indicated chunk from the store, or
+        None if it is missing or corrupt. """
+
+        pathname = self.getChunkPathname(chunk.hash)
+        try:
+            f = open(pathname.toOsSpecific(), 'rb')
+            stored = f.read()
+            f.close()
+            data = zlib.decompress(stored)
+        except (IOError, OSError, zlib.error):
+            return None
+
+        if hashlib.md5(data).hexdigest() != chunk.hash:
+            return None
+        return data
+
+    def removeChunk(self, chunk):
+        self.getChunkPathname(chunk.hash).unlink()
+
+    def findBoundary(self, data, length):
+        """ Returns the length of the first chunk within the first
+        length bytes of data, which should be at least maxChunkSize
+        unless it is the end of the archive. """
+
+        if length <= self.minChunkSize:
+            return length
+
+        gear = self.Gear
+        mask = self.mask
+        minSize = self.minChunkSize
+        end = min(length, self.maxChunkSize)
+
+        # The hash only depends on the last 32 bytes, so we can skip
+        # ahead to just before the minimum chunk size.
+        h = 0
+        for i in range(minSize - 32, end):
+            h = ((h << 1) + gear[data[i]]) & 0xffffffff
+            if not (h & mask) and i >= minSize:
+                return i + 1
+
+        return end
+
+    def addFile(self, pathname, filename = None):
+        """ Cuts the indicated archive into chunks, adds any new ones to
+        the store, and returns a ChunkManifest describing it.
+        filename is the name to record for the archive; it defaults
+        to the basename of pathname. """
+
+        manifest = ChunkManifest()
+        fileSpec = FileSpec()
+        fileSpec.fromFile(pathname.getDirname(), pathname.getBasename(), pathname = pathname)
+        manifest.filename = filename or fileSpec.filename
+        manifest.size = fileSpec.size
+        manifest.hash = fileSpec.hash
+
+        f = open(pathname.toOsSpecific(), 'rb')
+        data = bytearray()
+        eof = False
+        while data or not eof:
+            if not eof and len(data) < self.maxChunkSize:
+                block = f.read(self.readSize)
+                if block:
+                    data += block
+                    continue
+                eof = True
+                if not data:
+                    break
+
+            length = self.findBoundary(data, len(data))
+            manifest.chunks.append(self.addChunk(bytes(data[:length])))
+            del data[:length]
+        f.close()
+
+        return manifest
+
+    def getMissingChunks(self, manifest, haveHashes = {}):
+        """ Returns the list of unique chunks in the manifest that are
+        neither in the store nor listed in haveHashes. """
+
+        return [chunk for chunk in manifest.getUniqueChunks()
+                if chunk.hash not in haveHashes and not self.hasChunk(chunk)]
+
+    def rebuildFile(self, manifest, targetPathname, oldPathname = None,
+                    oldManifest = None):
+        """ Writes the archive described by manifest to
+        targetPathname.  Each chunk is copied from the archive at
+        oldPathname, described by oldManifest, if it is there, or
+        from the store otherwise.  Returns true on success, false on
+        failure. """
+
+        for result in self.rebuildFileGenerator(manifest, targetPathname,
+                                                oldPathname, oldManifest):
+            if result is False:
+                return False
+        return True
+
+    def rebuildFileGenerator(self, manifest, targetPathname,
+                             oldPathname = None, oldManifest = None):
+        """ A generator function that implements rebuildFile() one
+        chunk at a time.  It yields the number of bytes written so
+        far after each chunk, and finally True on success or False
+        on failure. """
+
+        oldHashes = {}
+        oldFile = None
+        if oldPathname and oldManifest:
+            try:
+                oldFile = open(oldPathname.toOsSpecific(), 'rb')
+                oldHashes = oldManifest.getChunkHashes()
+            except IOError:
+                pass
+
+        targetPathname.setBinary()
+        targetPathname.makeDir()
+        targetFile = open(targetPathname.toOsSpecific(), 'wb')
+        md5 = hashlib.md5()
+        bytesDone = 0
+        success = True
+        for chunk in manifest.chunks:
+            data = None
+            offset = oldHashes.get(chunk.hash)
+            if offset is not None:
+                oldFile.seek(offset)
+                data = oldFile.read(chunk.size)
+                if len(data) != chunk.size:
+                    data = None
+            if data is None:
+                data = self.readChunk(chunk)
+            if data is None:
+                success = False
+                break
+
+            targetFile.write(data)
+            md5.update(data)
+            bytesDone += len(data)
+            yield bytesDone
+
+        targetFile.close()
+        if oldFile:
+            oldFile.close()
+
+        if success and md5.hexdigest() != manifest.hash:
+            # The old archive must not have been what its manifest
+            # says it was.
+            success = False
+        if not success:
+            targetPathname.unlink()
+        yield success
+
+
+class ChunkMaker:
+    """ This class will operate on an existing package install
+    directory, as generated by the Packager, and add a chunk manifest
+    for the current version of each package, storing the chunks in
+    the host's chunk store.  It is run as a post-process after each
+    ppackage run, like the PatchMaker. """
+
+    def __init__(self, installDir, **kw):
+        self.installDir = installDir
+        self.store = ChunkStore(Filename(installDir, ChunkStore.StoreDirname), **kw)
+        self.contentsDoc = None
+
+    def buildManifests(self, packageNames = None):
+        """ Makes the chunk manifests that are missing or out of date.
+        If packageNames is None, this processes all packages;
+        otherwise, it should be a list of package name strings.
+        Returns true on success, false on failure. """
+
+        contentsFilename = Filename(self.installDir, 'contents.xml')
+        doc = TiXmlDocument(contentsFilename.toOsSpecific())
+        if not doc.LoadFile():
+            # Couldn't read file.
+            print("couldn't read %s" % (contentsFilename))
+            return False
+
+        anyChanges = False
+        xcontents = doc.FirstChildElement('contents')
+        if xcontents:
+            xpackage = xcontents.FirstChildElement('package')
+            while xpackage:
+                solo = int(xpackage.Attribute('solo') or '0')
+                filename = xpackage.Attribute('filename')
+                name = xpackage.Attribute('name')
+                if filename and not solo and \
+                   (packageNames is None or name in packageNames):
+                    if self.processPackage(Filename(filename), xpackage):
+                        anyChanges = True
+
+                xpackage = xpackage.NextSiblingElement('package')
+
+        if anyChanges:
+            contentsSeq = SeqValue()
+            contentsSeq.loadXml(xcontents)
+            contentsSeq += 1
+            contentsSeq.storeXml(xcontents)
+            doc.SaveFile()
+
+        print("%s new chunks, %s bytes" % (self.store.newChunks, self.store.newBytes))
+        return True
+
+    def processPackage(self, packageDesc, xcontentsPackage):
+        """ Builds the chunk manifest for the package described by the
+        indicated desc file, if it needs one.  Returns true if the
+        desc file was changed, false otherwise. """
+
+        packageDir = Filename(self.installDir, packageDesc.getDirname())
+        descPathname = Filename(self.installDir, packageDesc)
+        doc = TiXmlDocument(descPathname.toOsSpecific())
+        if not doc.LoadFile():
+            print("Couldn't read %s" % (descPathname))
+            return False
+
+        xpackage = doc.FirstChildElement('package')
+        xuncompressed = xpackage and xpackage.FirstChildElement('uncompressed_archive')
+        xcompressed = xpackage and xpackage.FirstChildElement('compressed_archive')
+        if not xuncompressed or not xcompressed:
+            return False
+
+        uncompressedFile = FileSpec()
+        uncompressedFile.loadXml(xuncompressed)
+        compressedFile = FileSpec()
+        compressedFile.loadXml(xcompressed)
+
+        manifestFilename = uncompressedFile.filename + '.chunks.xml'
+        manifestPathname = Filename(packageDir, manifestFilename)
+        xmanifest = xpackage.FirstChildElement('chunk_manifest')
+        if xmanifest:
+            manifest = ChunkManifest()
+            if manifest.readFile(manifestPathname) and \
+               manifest.hash == uncompressedFile.hash:
+                # Already up to date.
+                return False
+
+        # Only the compressed archive is kept in the install
+        # directory.
+        tempPathname = Filename.temporary('', 'chunk_')
+        if not decompressFile(Filename(packageDir, compressedFile.filename), tempPathname):
+            print("Couldn't decompress %s" % (compressedFile.filename))
+            tempPathname.unlink()
+            return False
+
+        print("Chunking %s" % (uncompressedFile.filename))
+        manifest = self.store.addFile(tempPathname, uncompressedFile.filename)
+        tempPathname.unlink()
+        if manifest.hash != uncompressedFile.hash:
+            print("%s does not match its desc file" % (compressedFile.filename))
+            return False
+        manifest.writeFile(manifestPathname)
+
+        # Record the manifest in the desc file.
+        fileSpec = FileSpec()
+        fileSpec.fromFile(packageDir, manifestFilename)
+        if xmanifest:
+            fileSpec.storeXml(xmanifest)
+        else:
+            xmanifest = TiXmlElement('chunk_manifest')
+            fileSpec.storeXml(xmanifest)
+            xpackage.InsertEndChild(xmanifest)
+
+        packageSeq = SeqValue()
+        packageSeq.loadXml(xpackage, 'seq')
+        packageSeq += 1
+        packageSeq.storeXml(xpackage, 'seq')
+        doc.SaveFile()
+
+        # And update the desc file's hash in contents.xml.
+        fileSpec = FileSpec()
+        fileSpec.fromFile(self.installDir, packageDesc)
+        fileSpec.storeXml(xcontentsPackage)
+        packageSeq.storeXml(xcontentsPackage, 'seq')
+        return True
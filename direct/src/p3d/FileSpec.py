@@ -2,6 +2,7 @@ __all__ = ["FileSpec"]
 
 import os
 import time
+import hashlib
 from panda3d.core import Filename, HashVal, VirtualFileSystem
 
 class FileSpec:
@@ -17,6 +18,12 @@ class FileSpec:
         self.timestamp = 0
         self.hash = None
 
+        # If the file is divided into ranges for downloading, this is
+        # the size of each range (the last may be shorter), and the
+        # list of the md5 hashes of the ranges, in order.
+        self.rangeSize = 0
+        self.rangeHashes = None
+
     def fromFile(self, packageDir, filename, pathname = None, st = None):
         """ Reads the file information from the indicated file.  If st
         is supplied, it is the result of os.stat on the filename. """
@@ -44,6 +51,30 @@ class FileSpec:
         hv.hashFile(pathname)
         self.hash = hv.asHex()
 
+    def readRangeHashes(self, pathname, rangeSize):
+        """ Divides the indicated file into ranges of rangeSize bytes,
+        and computes the hash of each one.  If the file is no larger
+        than a single range, it is not divided. """
+
+        self.rangeSize = 0
+        self.rangeHashes = None
+        if pathname.getFileSize() <= rangeSize:
+            return
+
+        self.rangeSize = rangeSize
+        self.rangeHashes = []
+        f = open(pathname.toOsSpecific(), 'rb')
+        data = f.read(rangeSize)
+        while data:
+            self.rangeHashes.append(hashlib.md5(data).hexdigest())
+            data = f.read(rangeSize)
+        f.close()
+
+    def getRange(self, i):
+        """ Returns the (start, size) of the ith range of the file. """
+
+        start = i * self.rangeSize
+        return (start, min(self.rangeSize, self.size - start))
 
     def loadXml(self, xelement):
         """ Reads the file information from the indicated XML
@@ -68,6 +99,18 @@ class FileSpec:
 
         self.hash = xelement.Attribute('hash')
 
+        self.rangeSize = 0
+        self.rangeHashes = None
+        rangeSize = xelement.Attribute('range_size')
+        rangeHashes = xelement.Attribute('range_hashes')
+        if rangeSize and rangeHashes:
+            try:
+                self.rangeSize = int(rangeSize)
+            except:
+                self.rangeSize = 0
+            if self.rangeSize:
+                self.rangeHashes = rangeHashes.split()
+
     def storeXml(self, xelement):
         """ Adds the file information to the indicated XML
         element. """
@@ -80,6 +123,9 @@ class FileSpec:
             xelement.SetAttribute('timestamp', str(int(self.timestamp)))
         if self.hash:
             xelement.SetAttribute('hash', self.hash)
+        if self.rangeHashes:
+            xelement.SetAttribute('range_size', str(self.rangeSize))
+            xelement.SetAttribute('range_hashes', ' '.join(self.rangeHashes))
 
     def storeMiniXml(self, xelement):
         """ Adds the just the "mini" file information--size and
@@ -244,3 +290,5 @@ class FileSpec:
         self.hash = self.actualFile.hash
         self.size = self.actualFile.size
         self.timestamp = self.actualFile.timestamp
+        if self.rangeHashes:
+            self.readRangeHashes(pathname, self.rangeSize)
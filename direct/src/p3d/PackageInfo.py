@@ -1,6 +1,6 @@
 __all__ = ["PackageInfo"]
 
-from panda3d.core import Filename, DocumentSpec, Multifile, Decompressor, EUOk, EUSuccess, VirtualFileSystem, Thread, getModelPath, ExecutionEnvironment, PStatCollector, TiXmlDocument, TiXmlDeclaration, TiXmlElement
+from panda3d.core import Filename, DocumentSpec, Ramfile, Multifile, Decompressor, EUOk, EUSuccess, VirtualFileSystem, Thread, getModelPath, ExecutionEnvironment, PStatCollector, TiXmlDocument, TiXmlDeclaration, TiXmlElement
 import panda3d.core as core
 from direct.p3d.FileSpec import FileSpec
 from direct.p3d.ScanDirectoryNode import ScanDirectoryNode
@@ -12,6 +12,8 @@ import sys
 import random
 import time
 import copy
+import zlib
+import hashlib
 
 class PackageInfo:
 
@@ -78,6 +80,68 @@ class PackageInfo:
                 return 1
             return min(float(self.bytesDone) / float(self.bytesNeeded), 1)
 
+    class StreamDecompressor:
+        """ This class uncompresses the compressed archive as it is
+        downloaded, and writes out the uncompressed archive, computing
+        the hashes of both along the way.  The compressed archive is
+        never stored, and the uncompressed archive is written and
+        verified in a single pass. """
+
+        def __init__(self, pathname):
+            self.decompressor = zlib.decompressobj()
+            self.compressedHash = hashlib.md5()
+            self.compressedSize = 0
+            self.hash = hashlib.md5()
+            self.size = 0
+
+            pathname.makeDir()
+            pathname.unlink()
+            self.file = open(pathname.toOsSpecific(), 'wb')
+
+        def write(self, data):
+            """ Accepts the next piece of the compressed archive.
+            Returns true on success, false if it could not be
+            uncompressed. """
+
+            self.compressedHash.update(data)
+            self.compressedSize += len(data)
+            try:
+                data = self.decompressor.decompress(data)
+            except zlib.error:
+                return False
+
+            self.__writeUncompressed(data)
+            return True
+
+        def close(self):
+            """ Flushes the end of the uncompressed archive to disk.
+            Returns true on success, false on failure. """
+
+            try:
+                data = self.decompressor.flush()
+            except zlib.error:
+                self.file.close()
+                return False
+
+            self.__writeUncompressed(data)
+            self.file.close()
+            return True
+
+        def verify(self, compressedArchive, uncompressedArchive):
+            """ Returns true if the data written matches the indicated
+            FileSpecs, false otherwise. """
+
+            return self.compressedSize == compressedArchive.size and \
+                   self.compressedHash.hexdigest() == compressedArchive.hash and \
+                   self.size == uncompressedArchive.size and \
+                   self.hash.hexdigest() == uncompressedArchive.hash
+
+        def __writeUncompressed(self, data):
+            if data:
+                self.hash.update(data)
+                self.size += len(data)
+                self.file.write(data)
+
     def __init__(self, host, packageName, packageVersion, platform = None,
                  solo = False, asMirror = False, perPlatform = False):
         self.host = host
@@ -108,6 +172,7 @@ class PackageInfo:
         self.guiApp = False
         self.uncompressedArchive = None
         self.compressedArchive = None
+        self.chunkManifest = None
         self.extracts = []
         self.requires = []
         self.installPlans = None
@@ -390,6 +455,14 @@ class PackageInfo:
             self.compressedArchive = FileSpec()
             self.compressedArchive.loadXml(xcompressedArchive)
 
+        # The list of chunks that make up the uncompressed archive,
+        # if the host has a chunk store.
+        self.chunkManifest = None
+        xchunkManifest = xpackage.FirstChildElement('chunk_manifest')
+        if xchunkManifest:
+            self.chunkManifest = FileSpec()
+            self.chunkManifest.loadXml(xchunkManifest)
+
         # The list of files that should be extracted to disk.
         self.extracts = []
         xextract = xpackage.FirstChildElement('extract')
@@ -499,6 +572,17 @@ class PackageInfo:
         step = self.InstallStep(func, downloadSize, self.downloadFactor, 'download')
         planB = [step] + planB
 
+        # Better still than plan B is to uncompress the archive as it
+        # downloads, without storing the compressed archive.  If that
+        # goes wrong, we fall back to plan B.  But streaming can't
+        # resume a download, so if part of the compressed archive is
+        # already on disk from an earlier attempt, plan B is better.
+        planStream = None
+        if core.ConfigVariableBool('package-stream-install', True).getValue() and \
+           not self.__hasPartialArchive():
+            step = self.InstallStep(self.__streamArchive, downloadSize, self.downloadFactor + self.uncompressFactor, 'download')
+            planStream = [step] + planA
+
         # Now look for patches.  Start with the md5 hash from the
         # uncompressedArchive file we have on disk, and see if we can
         # find a patch chain from this file to our target.
@@ -509,10 +593,23 @@ class PackageInfo:
             fileSpec.fromFile(self.getPackageDir(), self.uncompressedArchive.filename)
         plan = None
         if fileSpec:
-            plan = self.__findPatchChain(fileSpec)
+            # If we have the chunk manifest for the archive on disk,
+            # we can download just the chunks we don't already have.
+            plan = self.__findChunkPlan(fileSpec)
+            if not plan:
+                plan = self.__findPatchChain(fileSpec)
+                if plan and self.chunkManifest:
+                    # Get the new chunk manifest too, so we can fetch
+                    # chunks for the next update.
+                    plan = [self.__makeChunkManifestStep(required = False)] + plan
+        if self.chunkManifest:
+            planB = [self.__makeChunkManifestStep(required = False)] + planB
+            if planStream:
+                planStream = [self.__makeChunkManifestStep(required = False)] + planStream
+
         if plan:
-            # We can download patches.  Great!  That means this is
-            # plan A, and the full download is plan B (in case
+            # We can download patches (or chunks).  Great!  That means
+            # this is plan A, and the full download is plan B (in case
             # something goes wrong with the patching).
             planA = plan + planA
             self.installPlans = [planA, planB]
@@ -521,6 +618,9 @@ class PackageInfo:
             # plan B as the only plan.
             self.installPlans = [planB]
 
+        if planStream:
+            self.installPlans.insert(-1, planStream)
+
         # In case of unexpected failures on the internet, we will retry
         # the full download instead of just giving up.
         retries = core.ConfigVariableInt('package-full-dl-retries', 1).getValue()
@@ -529,6 +629,16 @@ class PackageInfo:
 
         pc.stop()
 
+    def __hasPartialArchive(self):
+        """ Returns true if there is a compressed archive, or a part
+        of one, left in the package directory by an earlier download
+        attempt. """
+
+        from direct.p3d.RangeDownloader import RangeDownloader
+        pathname = Filename(self.getPackageDir(), self.compressedArchive.filename)
+        return pathname.exists() or \
+               Filename(pathname + RangeDownloader.PartialSuffix).exists()
+
     def __scanDirectoryRecursively(self, dirname):
         """ Generates a list of Filename objects: all of the files
         (not directories) within and below the indicated dirname. """
@@ -566,11 +676,24 @@ class PackageInfo:
         self.__removeFileFromList(contents, self.descFileBasename)
         self.__removeFileFromList(contents, self.compressedArchive.filename)
         self.__removeFileFromList(contents, self.UsageBasename)
+        if self.compressedArchive.rangeHashes:
+            # Keep the ranges downloaded by an unfinished download.
+            from direct.p3d.RangeDownloader import RangeDownloader
+            self.__removeFileFromList(contents, self.compressedArchive.filename + RangeDownloader.PartialSuffix)
         if not self.asMirror:
             self.__removeFileFromList(contents, self.uncompressedArchive.filename)
             for file in self.extracts:
                 self.__removeFileFromList(contents, file.filename)
 
+            if self.chunkManifest:
+                # Keep the manifest of the archive we have, and any
+                # chunks downloaded by an unfinished update.
+                self.__removeFileFromList(contents, self.chunkManifest.filename)
+                from direct.p3d.ChunkStore import ChunkStore
+                prefix = ChunkStore.StoreDirname + '/'
+                contents = [filename for filename in contents
+                            if not filename.getFullpath().startswith(prefix)]
+
         # Now, any files that are still in the contents list don't
         # belong.  It's important to remove these files before we
         # start verifying the files that we expect to find here, in
@@ -753,6 +876,142 @@ class PackageInfo:
         patchMaker.cleanup()
         return plan
 
+    def __findChunkPlan(self, fileSpec):
+        """ If the host has a chunk store, and we have the chunk
+        manifest for the archive described by fileSpec, constructs an
+        installPlan that downloads the chunks of the current version
+        that are not in that archive, and rebuilds the current
+        version from them.  Otherwise, returns None. """
+
+        if not self.chunkManifest:
+            return None
+
+        from direct.p3d.ChunkStore import ChunkManifest
+
+        # The manifest on disk is still the one for the archive we
+        # have; read it now, before we download the new one over it.
+        oldManifest = ChunkManifest()
+        pathname = Filename(self.getPackageDir(), self.chunkManifest.filename)
+        if not oldManifest.readFile(pathname) or oldManifest.hash != fileSpec.hash:
+            return None
+
+        plan = [self.__makeChunkManifestStep(required = True)]
+
+        # We don't know how many chunks we need until we have the new
+        # manifest; assume the worst.
+        downloadSize = self.compressedArchive.size
+        func = lambda step, oldManifest = oldManifest: self.__downloadChunks(step, oldManifest)
+        step = self.InstallStep(func, downloadSize, self.downloadFactor, 'download')
+        plan.append(step)
+
+        rebuildSize = self.uncompressedArchive.size
+        func = lambda step, oldManifest = oldManifest: self.__rebuildFromChunks(step, oldManifest)
+        step = self.InstallStep(func, rebuildSize, self.patchFactor, 'patch')
+        plan.append(step)
+
+        return plan
+
+    def __makeChunkManifestStep(self, required):
+        """ Returns an InstallStep that downloads the chunk manifest
+        for the current version.  If required is false, failing to
+        download it does not fail the plan. """
+
+        def func(step, fileSpec = self.chunkManifest):
+            for token in self.__downloadFile(step, fileSpec, allowPartial = False):
+                if token == self.stepFailed and not required:
+                    self.notify.info("Couldn't download chunk manifest for %s" % (self.packageName))
+                    token = self.stepComplete
+                yield token
+                if token != self.stepContinue:
+                    return
+
+        return self.InstallStep(func, self.chunkManifest.size, self.downloadFactor, 'download')
+
+    def __downloadChunks(self, step, oldManifest):
+        """ Downloads the chunks of the current version that are in
+        neither the old archive nor the local chunk store.  Yields one
+        of stepComplete, stepFailed, restartDownload, or
+        stepContinue. """
+
+        from direct.p3d.ChunkStore import ChunkStore, ChunkManifest
+
+        manifest = ChunkManifest()
+        pathname = Filename(self.getPackageDir(), self.chunkManifest.filename)
+        if not manifest.readFile(pathname) or manifest.hash != self.uncompressedArchive.hash:
+            self.notify.warning("Chunk manifest for %s is incorrect" % (self.packageName))
+            yield self.stepFailed; return
+
+        store = ChunkStore(Filename(self.getPackageDir(), ChunkStore.StoreDirname))
+        missing = store.getMissingChunks(manifest, oldManifest.getChunkHashes())
+        step.bytesNeeded = sum([chunk.storedSize for chunk in missing])
+        self.notify.info("%s needs %s of %s chunks, %s bytes" % (
+            self.packageName, len(missing), len(manifest.chunks), step.bytesNeeded))
+
+        bytesDone = 0
+        for chunk in missing:
+            # The chunks are stored at the root of the host, shared
+            # by all packages; we keep them in our own directory.
+            fileSpec = chunk.makeFileSpec()
+            fileSpec.filename = ChunkStore.StoreDirname + '/' + fileSpec.filename
+            for token in self.__downloadFile(None, fileSpec, urlbase = fileSpec.filename):
+                if token != self.stepContinue:
+                    break
+                yield token
+            if token != self.stepComplete:
+                yield token; return
+
+            bytesDone += chunk.storedSize
+            step.bytesDone = bytesDone
+            self.__updateStepProgress(step)
+            yield self.stepContinue
+
+        yield self.stepComplete; return
+
+    def __rebuildFromChunks(self, step, oldManifest):
+        """ Rebuilds the current version of the uncompressed archive
+        from the old archive and the downloaded chunks.  Yields one of
+        stepComplete, stepFailed, restartDownload, or
+        stepContinue. """
+
+        from direct.p3d.ChunkStore import ChunkStore, ChunkManifest
+
+        self.updated = True
+
+        manifest = ChunkManifest()
+        manifest.readFile(Filename(self.getPackageDir(), self.chunkManifest.filename))
+        store = ChunkStore(Filename(self.getPackageDir(), ChunkStore.StoreDirname))
+
+        origPathname = Filename(self.getPackageDir(), self.uncompressedArchive.filename)
+        result = Filename.temporary('', 'chunks_')
+        self.notify.info("Rebuilding %s from chunks" % (origPathname))
+
+        for token in store.rebuildFileGenerator(manifest, result, origPathname, oldManifest):
+            if token is True or token is False:
+                break
+            step.bytesDone = token
+            self.__updateStepProgress(step)
+            if taskMgr.destroyed:
+                self.notify.warning("Task Manager destroyed, aborting rebuild %s" % (origPathname))
+                result.unlink()
+                yield self.stepFailed; return
+
+            yield self.stepContinue
+
+        if not token:
+            self.notify.warning("Rebuilding %s from chunks failed." % (origPathname))
+            yield self.stepFailed; return
+
+        if not result.renameTo(origPathname):
+            self.notify.warning("Couldn't rename %s to %s" % (result, origPathname))
+            yield self.stepFailed; return
+
+        # We don't need the downloaded chunks any more; they are all
+        # in the archive now.
+        for chunk in manifest.getUniqueChunks():
+            store.removeChunk(chunk)
+
+        yield self.stepComplete; return
+
     def __downloadFile(self, step, fileSpec, urlbase = None, filename = None,
                        allowPartial = False):
         """ Downloads the indicated file from the host into
@@ -768,34 +1027,27 @@ class PackageInfo:
         if not urlbase:
             urlbase = self.descFileDirname + '/' + fileSpec.filename
 
-        # Build up a list of URL's to try downloading from.  Unlike
-        # the C++ implementation in P3DPackage.cxx, here we build the
-        # URL's in forward order.
-        tryUrls = []
-
-        if self.host.appRunner and self.host.appRunner.superMirrorUrl:
-            # We start with the "super mirror", if it's defined.
-            url = self.host.appRunner.superMirrorUrl + urlbase
-            tryUrls.append((url, False))
-
-        if self.host.mirrors:
-            # Choose two mirrors at random.
-            mirrors = self.host.mirrors[:]
-            for i in range(2):
-                mirror = random.choice(mirrors)
-                mirrors.remove(mirror)
-                url = mirror + urlbase
-                tryUrls.append((url, False))
-                if not mirrors:
+        maxConnections = core.ConfigVariableInt('package-download-connections', 4).getValue()
+        if fileSpec.rangeHashes and maxConnections > 1:
+            # The file is divided into ranges, so we can download
+            # several of them at once, from all of the mirrors.
+            for token in self.__downloadRanges(step, fileSpec, urlbase, filename, maxConnections):
+                if token != self.stepContinue:
                     break
+                yield token
 
-        # After trying two mirrors and failing (or if there are no
-        # mirrors), go get it from the original host.
-        url = self.host.downloadUrlPrefix + urlbase
-        tryUrls.append((url, False))
+            if token == self.stepComplete or taskMgr.destroyed:
+                yield token; return
+
+            # Something went wrong; fall back to downloading it the
+            # old way, from one URL at a time.
+
+        # Try two mirrors at random, and the original host.
+        tryUrls = [(url, False) for url in self.__getDownloadUrls(urlbase, 2)]
 
         # And finally, if the original host also fails, try again with
         # a cache-buster.
+        url = self.host.downloadUrlPrefix + urlbase
         tryUrls.append((url, True))
 
         for url, cacheBust in tryUrls:
@@ -896,6 +1148,176 @@ class PackageInfo:
         # must be just fubar.
         yield self.stepFailed; return
 
+    def __getDownloadUrls(self, urlbase, maxMirrors = None):
+        """ Returns the list of URL's to try downloading urlbase from,
+        in order.  Unlike the C++ implementation in P3DPackage.cxx,
+        here we build the URL's in forward order: the "super mirror",
+        if it's defined, then up to maxMirrors of the mirrors (or all
+        of them), chosen at random, then the original host. """
+
+        urls = []
+        if self.host.appRunner and self.host.appRunner.superMirrorUrl:
+            urls.append(self.host.appRunner.superMirrorUrl + urlbase)
+
+        mirrors = self.host.mirrors[:]
+        random.shuffle(mirrors)
+        if maxMirrors is not None:
+            mirrors = mirrors[:maxMirrors]
+        for mirror in mirrors:
+            urls.append(mirror + urlbase)
+
+        urls.append(self.host.downloadUrlPrefix + urlbase)
+        return urls
+
+    def __downloadRanges(self, step, fileSpec, urlbase, filename, maxConnections):
+        """ Downloads the indicated file, which has been divided into
+        ranges, with a RangeDownloader, from all of the mirrors and
+        the original host at once.  Ranges left in the partial file by
+        an interrupted download are kept.  Yields one of stepComplete,
+        stepFailed, or stepContinue. """
+
+        from direct.p3d.RangeDownloader import RangeDownloader
+
+        urls = self.__getDownloadUrls(urlbase)
+
+        if not filename:
+            filename = fileSpec.filename
+        targetPathname = Filename(self.getPackageDir(), filename)
+        self.notify.info("%s downloading %s in %s ranges from %s URL's" % (
+            self.packageName, urlbase, len(fileSpec.rangeHashes), len(urls)))
+
+        downloader = RangeDownloader(self.http, urls, fileSpec, targetPathname,
+                                     maxConnections = maxConnections)
+        for token in downloader.downloadGenerator():
+            if token is True or token is False:
+                break
+            if step:
+                step.bytesDone = token
+                self.__updateStepProgress(step)
+
+            if taskMgr.destroyed:
+                # If the task manager has been destroyed, we must
+                # be shutting down.  Get out of here.
+                self.notify.warning("Task Manager destroyed, aborting %s" % (urlbase))
+                yield self.stepFailed; return
+
+            yield self.stepContinue
+
+        if not token:
+            yield self.stepFailed; return
+
+        if not fileSpec.fullVerify(self.getPackageDir(), pathname = targetPathname, notify = self.notify):
+            self.notify.warning("After downloading, %s incorrect" % (Filename(fileSpec.filename).getBasename()))
+            yield self.stepFailed; return
+
+        yield self.stepComplete; return
+
+    def __streamArchive(self, step):
+        """ Downloads the compressed archive, and uncompresses it as
+        it arrives, writing only the uncompressed archive to disk, and
+        verifying both on the way.  Yields one of stepComplete,
+        stepFailed, or stepContinue. """
+
+        if self.host.appRunner and self.host.appRunner.verifyContents == self.host.appRunner.P3DVCNever:
+            # We're not allowed to download anything.
+            yield self.stepFailed; return
+
+        self.updated = True
+
+        fileSpec = self.compressedArchive
+        urlbase = self.descFileDirname + '/' + fileSpec.filename
+        targetPathname = Filename(self.getPackageDir(), self.uncompressedArchive.filename)
+        maxConnections = core.ConfigVariableInt('package-download-connections', 4).getValue()
+
+        if fileSpec.rangeHashes and maxConnections > 1:
+            # Fetch the ranges from all of the mirrors at once, and
+            # uncompress them in order.
+            from direct.p3d.RangeDownloader import RangeDownloader
+
+            urls = self.__getDownloadUrls(urlbase)
+            self.notify.info("%s streaming %s in %s ranges from %s URL's" % (
+                self.packageName, urlbase, len(fileSpec.rangeHashes), len(urls)))
+            stream = self.StreamDecompressor(targetPathname)
+            downloader = RangeDownloader(self.http, urls, fileSpec,
+                                         maxConnections = maxConnections,
+                                         consumer = stream.write)
+            for token in downloader.downloadGenerator():
+                if token is True or token is False:
+                    break
+                step.bytesDone = token
+                self.__updateStepProgress(step)
+                if taskMgr.destroyed:
+                    self.notify.warning("Task Manager destroyed, aborting %s" % (urlbase))
+                    stream.close()
+                    yield self.stepFailed; return
+
+                yield self.stepContinue
+
+            success = stream.close() and token
+
+        else:
+            # Fetch the file in one stream, from one URL at a time.
+            for url in self.__getDownloadUrls(urlbase, 2):
+                self.notify.info("%s streaming %s" % (self.packageName, url))
+                stream = self.StreamDecompressor(targetPathname)
+                ramfile = Ramfile()
+                channel = self.http.makeChannel(False)
+                channel.beginGetDocument(DocumentSpec(url))
+                channel.downloadToRam(ramfile, False)
+
+                # Uncompress the data as it arrives, and discard it
+                # from the ramfile.  Ramfile.clear() doesn't reset the
+                # read position, so we have to do that too.
+                success = True
+                while success:
+                    running = channel.run()
+                    success = stream.write(ramfile.read(ramfile.getDataSize()))
+                    ramfile.clear()
+                    ramfile.seek(0)
+                    if not running:
+                        break
+
+                    step.bytesDone = channel.getBytesDownloaded()
+                    if step.bytesDone > step.bytesNeeded:
+                        self.notify.warning("Got more data than expected for download %s" % (url))
+                        success = False
+                    self.__updateStepProgress(step)
+
+                    if taskMgr.destroyed:
+                        self.notify.warning("Task Manager destroyed, aborting %s" % (url))
+                        stream.close()
+                        yield self.stepFailed; return
+
+                    yield self.stepContinue
+
+                success = stream.close() and success and channel.isValid()
+                if success:
+                    break
+                self.notify.warning("Failed to stream %s" % (url))
+
+        if not success or not stream.verify(self.compressedArchive, self.uncompressedArchive):
+            self.notify.warning("After streaming, %s incorrect" % (self.uncompressedArchive.filename))
+            targetPathname.unlink()
+            yield self.stepFailed; return
+
+        step.bytesDone = step.bytesNeeded
+        self.__updateStepProgress(step)
+
+        # The archive was verified as it was written.  Give it the
+        # timestamp we expect, so quickVerify() won't hash it again,
+        # and make it read-only.
+        os.utime(targetPathname.toOsSpecific(), (time.time(), self.uncompressedArchive.timestamp))
+        os.chmod(targetPathname.toOsSpecific(), 0o444)
+
+        # Any compressed archive left over from a previous attempt is
+        # no longer needed.
+        Filename(self.getPackageDir(), fileSpec.filename).unlink()
+        if fileSpec.rangeHashes:
+            from direct.p3d.RangeDownloader import RangeDownloader
+            Filename(self.getPackageDir(), fileSpec.filename + RangeDownloader.PartialSuffix).unlink()
+
+        yield self.stepComplete; return
+
     def __applyPatch(self, step, patchfile):
         """ Applies the indicated patching in-place to the current
         uncompressed archive.  The patchfile is removed after the
@@ -1073,6 +1495,7 @@ class PackageInfo:
 
         vfs = VirtualFileSystem.getGlobalPtr()
         vfs.mount(mf, root, vfs.MFReadOnly)
+        VFSImporter.loadImportMap(root)
 
         # Add this to the Python search path, if it's not already
         # there.  We have to take a bit of care to check if it's
@@ -1136,6 +1559,7 @@ class PackageInfo:
         # Fix up any shared directories so we can load packages from
         # disparate locations.
         VFSImporter.reloadSharedPackages()
+        VFSImporter.markImportTiming('installed %s' % (self.packageName))
 
         self.installed = True
         appRunner.installedPackages.append(self)
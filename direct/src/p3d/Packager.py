@@ -19,6 +19,7 @@ from direct.p3d.SeqValue import SeqValue
 from direct.p3d.HostInfo import HostInfo
 from direct.showbase import Loader
 from direct.showbase import AppRunnerGlobal
+from direct.showbase import VFSImporter
 from direct.showutil import FreezeTool
 from direct.directnotify.DirectNotifyGlobal import *
 
@@ -585,6 +586,11 @@ class Packager:
             self.freezer.addToMultifile(self.multifile, self.compressionLevel)
             self.addExtensionModules()
 
+            # Also record where each module went, so the runtime can
+            # import it without searching.
+            self.freezer.addImportMap(self.multifile, VFSImporter.importMapFilename,
+                                      self.compressionLevel)
+
             # Add known module names.
             self.moduleNames = {}
             modules = sorted(self.freezer.modules.items())
@@ -1635,6 +1641,11 @@ class Packager:
             xcompressedArchive = self.getFileSpec(
                 'compressed_archive', self.packageFullpath + '.pz',
                 self.packageBasename + '.pz')
+            if self.packager.downloadRangeSize:
+                spec = FileSpec()
+                spec.readRangeHashes(Filename(self.packageFullpath + '.pz'),
+                                     self.packager.downloadRangeSize)
+                spec.storeXml(xcompressedArchive)
             xpackage.InsertEndChild(xcompressedArchive)
 
             # Copy in the patch entries read from the previous version
@@ -2243,6 +2254,13 @@ class Packager:
         # contents.xml before re-querying the server, in seconds.
         self.maxAge = 0
 
+        # The compressed archive of each package is divided into
+        # ranges of this many bytes, and the hash of each range is
+        # recorded in the desc file, so that clients can download the
+        # ranges in parallel and verify each one as it arrives.  Set
+        # this to 0 to leave the archives undivided.
+        self.downloadRangeSize = 1024 * 1024
+
         # The contents seq: a tuple of integers, representing the
         # current seq value.  The contents seq generally increments
         # with each modification to the contents.xml file.  There is
@@ -4,6 +4,36 @@ from direct.p3d.FileSpec import FileSpec
 from direct.p3d.SeqValue import SeqValue
 from panda3d.core import *
 import copy
+import time
+
+def buildPatchJob(job):
+    """ Builds a patch from origFilename to newFilename, and
+    compresses it into patchFilename.pz.  The job is a tuple of those
+    three os-specific filename strings, so that this can be handed to
+    a multiprocessing pool.  Returns a tuple of (buildTime,
+    compressTime, compressedSize) on success, or None on failure. """
+
+    origFilename, newFilename, patchFilename = \
+                  [Filename.fromOsSpecific(f) for f in job]
+    patchFilename.setBinary()
+
+    start = time.time()
+    patchFilename.unlink()
+    p = Patchfile()  # The C++ class
+    if not p.build(origFilename, newFilename, patchFilename):
+        patchFilename.unlink()
+        return None
+    buildTime = time.time() - start
+
+    start = time.time()
+    compressedFilename = Filename(patchFilename + '.pz')
+    compressedFilename.unlink()
+    if not compressFile(patchFilename, compressedFilename, 9):
+        return None
+    patchFilename.unlink()
+    compressTime = time.time() - start
+
+    return (buildTime, compressTime, compressedFilename.getFileSize())
 
 class PatchMaker:
     """ This class will operate on an existing package install
@@ -562,11 +592,17 @@ class PatchMaker:
 
 
     # PatchMaker constructor.
-    def __init__(self, installDir):
+    def __init__(self, installDir, numJobs = 1):
         self.installDir = installDir
         self.packageVersions = {}
         self.packages = []
 
+        # If this is more than 1, the patches for the different
+        # packages are built concurrently, by a pool of this many
+        # processes.
+        self.numJobs = numJobs
+        self.pendingPatches = []
+
     def buildPatches(self, packageNames = None):
         """ Makes the patches required in a particular directory
         structure on disk.  If packageNames is None, this makes
@@ -581,6 +617,7 @@ class PatchMaker:
             self.processAllPackages()
         else:
             self.processSomePackages(packageNames)
+        self.buildPendingPatches()
 
         self.writeContentsFile()
         self.cleanup()
@@ -764,24 +801,104 @@ class PatchMaker:
             # They're different, so build a new patch.
             filename = Filename(package.currentFile.filename + '.%s.patch' % (package.patchVersion))
             assert filename not in self.patchFilenames
-            if not self.buildPatch(topPv, currentPv, package, filename):
+            if self.numJobs > 1:
+                # Build it later, alongside the other packages'
+                # patches, in buildPendingPatches().
+                self.pendingPatches.append((topPv, currentPv, package, filename))
+            elif not self.buildPatch(topPv, currentPv, package, filename):
                 raise Exception("Couldn't build patch.")
 
+    def buildPendingPatches(self):
+        """ Builds the patches queued up by processPackage() when
+        numJobs is more than 1.  Each patch is independent of the
+        others, so they are built and compressed in parallel by a
+        pool of processes; but the results are recorded afterwards in
+        the order the packages were processed, so the desc files and
+        contents.xml come out the same as for a serial build. """
+
+        if not self.pendingPatches:
+            return
+
+        # Recreating the source and target archives may involve
+        # walking a patch chain, which depends on this object's
+        # state, so that much is done here, one at a time.
+        # A patch with no job fails, just as in buildPatch().
+        failed = False
+        patches = []
+        jobs = []
+        for v1, v2, package, patchFilename in self.pendingPatches:
+            job = self.makePatchJob(v1, v2, package, patchFilename)
+            if job:
+                patches.append((v1, v2, package, patchFilename))
+                jobs.append(job)
+            else:
+                failed = True
+        self.pendingPatches = []
+
+        if not jobs:
+            if failed:
+                raise Exception("Couldn't build patch.")
+            return
+
+        import multiprocessing
+        pool = multiprocessing.Pool(min(self.numJobs, len(jobs)))
+        try:
+            # map() returns the results in the order of the jobs,
+            # whichever order they finish in.
+            results = pool.map(buildPatchJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (v1, v2, package, patchFilename), result in zip(patches, results):
+            if not self.recordNewPatch(v1, v2, package, patchFilename, result):
+                failed = True
+
+        if failed:
+            raise Exception("Couldn't build patch.")
+
     def buildPatch(self, v1, v2, package, patchFilename):
         """ Builds a patch from PackageVersion v1 to PackageVersion
         v2, and stores it in patchFilename.pz.  Returns true on
         success, false on failure."""
 
+        job = self.makePatchJob(v1, v2, package, patchFilename)
+        if not job:
+            return False
+
+        result = buildPatchJob(job)
+        return self.recordNewPatch(v1, v2, package, patchFilename, result)
+
+    def makePatchJob(self, v1, v2, package, patchFilename):
+        """ Gets the files for PackageVersion v1 and v2, recreating
+        them if necessary, and returns the job tuple to pass to
+        buildPatchJob() to build the patch between them.  Returns
+        None if there is no original version to patch from. """
+
+        origFilename = v1.getFile()
+        newFilename = v2.getFile()
+        if not origFilename or not origFilename.exists():
+            # No original version to patch from.
+            return None
+
+        print("Building patch from %s to %s" % (v1.printName, v2.printName))
         pathname = Filename(package.packageDir, patchFilename)
-        if not self.buildPatchFile(v1.getFile(), v2.getFile(), pathname,
-                                   v1.printName, v2.printName):
+        return (origFilename.toOsSpecific(), newFilename.toOsSpecific(),
+                pathname.toOsSpecific())
+
+    def recordNewPatch(self, v1, v2, package, patchFilename, result):
+        """ Adds the patch just built by buildPatchJob() to the
+        package and to the patch chains.  result is the value
+        buildPatchJob() returned.  Returns true on success, false on
+        failure. """
+
+        if not result:
+            print("Couldn't build patch %s" % (patchFilename))
             return False
 
-        compressedPathname = Filename(pathname + '.pz')
-        compressedPathname.unlink()
-        if not compressFile(pathname, compressedPathname, 9):
-            raise Exception("Couldn't compress patch.")
-        pathname.unlink()
+        buildTime, compressTime, size = result
+        print("Built %s.pz: %s bytes, %.2f s to build, %.2f s to compress" % (
+            patchFilename, size, buildTime, compressTime))
 
         patchfile = self.Patchfile(package)
         patchfile.fromFile(package.packageDir, patchFilename + '.pz',
@@ -792,23 +909,3 @@ class PatchMaker:
         self.recordPatchfile(patchfile)
 
         return True
-
-    def buildPatchFile(self, origFilename, newFilename, patchFilename,
-                       printOrigName, printNewName):
-        """ Creates a patch file from origFilename to newFilename,
-        storing the result in patchFilename.  Returns true on success,
-        false on failure. """
-
-        if not origFilename.exists():
-            # No original version to patch from.
-            return False
-
-        print("Building patch from %s to %s" % (printOrigName, printNewName))
-        patchFilename.unlink()
-        p = Patchfile()  # The C++ class
-        if p.build(origFilename, newFilename, patchFilename):
-            return True
-
-        # Unable to build a patch for some reason.
-        patchFilename.unlink()
-        return False
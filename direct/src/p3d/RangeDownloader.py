@@ -0,0 +1,273 @@
+__all__ = ["RangeDownloader"]
+
+from panda3d.core import Filename, DocumentSpec, Ramfile
+from direct.directnotify.DirectNotifyGlobal import directNotify
+import os
+import time
+import hashlib
+
+class RangeDownloader:
+    """ This class downloads a file that has been divided into ranges
+    (see FileSpec.readRangeHashes()) from several URL's at once.  Each
+    range is fetched with a separate HTTP request, on one of several
+    connections that are run together, and its hash is checked as it
+    arrives; a URL that serves a bad range is not asked for any more.
+
+    The ranges are written in place, as they arrive, to a partial
+    file of the full size, named with PartialSuffix; it is renamed
+    when it is complete.  If a download is interrupted, a new
+    RangeDownloader for the same file checks the ranges already in the
+    partial file, and downloads only the ones that are missing.
+
+    Alternatively, if a consumer function is given instead of a
+    pathname, nothing is written to disk; the consumer is called with
+    the data of each range in turn, in order.  A range that arrives
+    early is held in memory until the ranges before it have been
+    consumed, so the downloader does not run more than a few ranges
+    ahead of the consumer. """
+
+    notify = directNotify.newCategory("RangeDownloader")
+
+    # A URL that fails this many times is not tried again.
+    maxFailures = 2
+
+    PartialSuffix = '.part'
+
+    class Source:
+        """ One of the URL's the file may be downloaded from. """
+
+        def __init__(self, url):
+            self.url = url
+            self.numActive = 0
+            self.numFailures = 0
+            self.bytesDownloaded = 0
+
+            # Channels that have finished a range, and can be used
+            # again on the same connection.
+            self.idleChannels = []
+
+    class Request:
+        """ A single range being downloaded from a Source. """
+
+        def __init__(self, source, index, start, size, channel):
+            self.source = source
+            self.index = index
+            self.start = start
+            self.size = size
+            self.channel = channel
+            self.ramfile = Ramfile()
+
+    def __init__(self, http, urls, fileSpec, pathname = None,
+                 maxConnections = 4, consumer = None):
+        self.http = http
+        self.sources = [self.Source(url) for url in urls]
+        self.fileSpec = fileSpec
+        self.maxConnections = maxConnections
+
+        self.pathname = None
+        self.partialPathname = None
+        if pathname:
+            self.pathname = Filename(pathname)
+            self.pathname.setBinary()
+            self.partialPathname = Filename(self.pathname + self.PartialSuffix)
+            self.partialPathname.setBinary()
+
+        # If this is set, it is called with the data of each range, in
+        # order; it returns false if it can't accept it.  The ranges
+        # that have arrived early wait in self.ready.
+        self.consumer = consumer
+        self.ready = {}
+        self.nextIndex = 0
+        self.consumerFailed = False
+
+        # The indexes of the ranges still to be downloaded, and the
+        # requests in progress.
+        self.pending = []
+        self.requests = []
+
+        # The bytes of the file that are on disk and verified, and the
+        # part of those that was already there when we started.
+        self.bytesDone = 0
+        self.bytesResumed = 0
+
+        self.file = None
+        self.startTime = None
+        self.elapsedTime = 0
+
+    def getBytesDownloaded(self):
+        """ Returns the number of bytes successfully downloaded, not
+        counting those found already on disk. """
+        return self.bytesDone - self.bytesResumed
+
+    def getThroughput(self):
+        """ Returns the average download rate, in bytes per second,
+        of the last call to downloadGenerator(). """
+        if not self.elapsedTime:
+            return 0
+        return self.getBytesDownloaded() / self.elapsedTime
+
+    def downloadGenerator(self):
+        """ A generator function that downloads the file.  It yields
+        the number of bytes of the file done so far, including those
+        in progress, as it goes; and finally yields True on success,
+        or False if some range could not be downloaded from any URL.
+        The caller should still verify the whole file afterwards. """
+
+        self.startTime = time.time()
+        try:
+            self.doneRanges = set()
+            if not self.consumer:
+                for token in self.__openFile():
+                    yield token
+
+            self.pending = [i for i in range(len(self.fileSpec.rangeHashes))
+                            if i not in self.doneRanges]
+            while self.pending or self.requests:
+                self.__startRequests()
+                if not self.requests:
+                    # Nowhere left to get the remaining ranges from.
+                    self.notify.warning("No working URL for %s" % (self.fileSpec.filename))
+                    yield False; return
+
+                for request in self.requests[:]:
+                    if not request.channel.run():
+                        self.requests.remove(request)
+                        self.__finishRequest(request)
+
+                if self.consumerFailed:
+                    self.notify.warning("Couldn't process %s" % (self.fileSpec.filename))
+                    yield False; return
+
+                yield self.bytesDone + sum([request.channel.getBytesDownloaded()
+                                            for request in self.requests])
+
+            if self.file:
+                self.file.close()
+                self.file = None
+                self.pathname.unlink()
+                if not self.partialPathname.renameTo(self.pathname):
+                    self.notify.warning("Couldn't rename %s to %s" % (self.partialPathname, self.pathname))
+                    yield False; return
+
+            self.elapsedTime = time.time() - self.startTime
+            self.notify.info("Downloaded %s bytes of %s in %.2f s, %.0f KB/s; %s bytes already on disk" % (
+                self.getBytesDownloaded(), self.fileSpec.filename,
+                self.elapsedTime, self.getThroughput() / 1024.0,
+                self.bytesResumed))
+            for source in self.sources:
+                self.notify.debug("  %s bytes from %s" % (source.bytesDownloaded, source.url))
+
+            yield True; return
+
+        finally:
+            self.requests = []
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def __openFile(self):
+        """ Opens the file for writing, at its full size.  If it is
+        already there, from an interrupted download, checks which
+        ranges are already complete, yielding the bytes done so far as
+        it goes. """
+
+        filename = self.partialPathname.toOsSpecific()
+        if self.partialPathname.getFileSize() == self.fileSpec.size:
+            # Make sure the file is writable.
+            os.chmod(filename, 0o644)
+            self.file = open(filename, 'r+b')
+            for i in range(len(self.fileSpec.rangeHashes)):
+                start, size = self.fileSpec.getRange(i)
+                self.file.seek(start)
+                data = self.file.read(size)
+                if hashlib.md5(data).hexdigest() == self.fileSpec.rangeHashes[i]:
+                    self.doneRanges.add(i)
+                    self.bytesDone += size
+                    yield self.bytesDone
+
+            self.bytesResumed = self.bytesDone
+            if self.bytesResumed:
+                self.notify.info("Resuming %s after %s bytes already downloaded" % (
+                    self.fileSpec.filename, self.bytesResumed))
+        else:
+            self.partialPathname.makeDir()
+            self.partialPathname.unlink()
+            self.file = open(filename, 'w+b')
+            self.file.truncate(self.fileSpec.size)
+
+    def __startRequests(self):
+        """ Starts downloading pending ranges, until all of the
+        connections are busy.  Each range goes to the working URL with
+        the fewest requests in progress. """
+
+        while self.pending and len(self.requests) < self.maxConnections:
+            if self.consumer and self.pending[0] >= self.nextIndex + self.maxConnections * 2:
+                # Don't get too far ahead of the consumer.
+                return
+
+            sources = [source for source in self.sources
+                       if source.numFailures < self.maxFailures]
+            if not sources:
+                return
+            source = min(sources, key = lambda source: source.numActive)
+
+            index = self.pending.pop(0)
+            start, size = self.fileSpec.getRange(index)
+            if source.idleChannels:
+                channel = source.idleChannels.pop()
+            else:
+                channel = self.http.makeChannel(True)
+            channel.beginGetSubdocument(DocumentSpec(source.url), start, start + size - 1)
+            request = self.Request(source, index, start, size, channel)
+            channel.downloadToRam(request.ramfile, False)
+            source.numActive += 1
+            self.requests.append(request)
+
+    def __finishRequest(self, request):
+        """ Checks the range downloaded by the indicated request, and
+        writes it to the file, or passes it to the consumer, if it is
+        good; otherwise, puts it back on the pending list, to be tried
+        from another URL. """
+
+        source = request.source
+        source.numActive -= 1
+        channel = request.channel
+
+        data = None
+        if not channel.isValid():
+            self.notify.info("Failed to download range %s of %s: %s %s" % (
+                request.index, source.url, channel.getStatusCode(),
+                channel.getStatusString()))
+        elif channel.getStatusCode() != 206:
+            # The server ignored the range, and sent us something
+            # else (probably the whole file).  No point in asking it
+            # again.
+            self.notify.info("%s does not support range requests" % (source.url))
+            source.numFailures = self.maxFailures
+        else:
+            data = request.ramfile.getData()
+            if len(data) != request.size or \
+               hashlib.md5(data).hexdigest() != self.fileSpec.rangeHashes[request.index]:
+                self.notify.info("Range %s of %s is incorrect" % (request.index, source.url))
+                data = None
+
+        if data is None:
+            source.numFailures += 1
+            self.pending.append(request.index)
+            self.pending.sort()
+            return
+
+        source.idleChannels.append(channel)
+        source.bytesDownloaded += request.size
+        self.bytesDone += request.size
+
+        if not self.consumer:
+            self.file.seek(request.start)
+            self.file.write(data)
+            return
+
+        self.ready[request.index] = data
+        while self.nextIndex in self.ready and not self.consumerFailed:
+            if not self.consumer(self.ready.pop(self.nextIndex)):
+                self.consumerFailed = True
+            self.nextIndex += 1
@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+
+usageText = """
+
+This script adds chunk manifests to the Panda3D packages in a
+directory hierarchy created by ppackage.  It can be run as a
+post-process, like ppatcher; it will examine the directory hierarchy,
+and chunk the current version of each package that does not yet have
+an up-to-date manifest.
+
+Each package archive is cut into chunks at content-defined
+boundaries, and the chunks are stored, compressed and named by their
+hash, in the "chunks" directory at the root of the install directory.
+The list of chunks that make up each archive is written to a
+manifest file alongside it, and recorded in the package's desc file.
+A client that has the previous version of a package, and its
+manifest, then downloads only the chunks it does not already have,
+rather than the whole archive or a chain of patches.
+
+Chunks are shared by all versions of all packages in the install
+directory, so the store grows only by the chunks that are new in
+each release.  Run this script after each ppackage run; running it
+on an existing install directory converts its packages to the chunk
+format, without disturbing the archives and patches already there.
+
+This script is actually a wrapper around Panda's ChunkStore.py.
+
+Usage:
+
+  %(prog)s [opts] [packageName1 .. packageNameN]
+
+Parameters:
+
+  packageName1 .. packageNameN
+    Specify the names of the package(s) you wish to chunk.  If you
+    omit these parameters, all packages are chunked.
+
+Options:
+
+  -i install_dir
+     The full path to the install directory.  This should be the same
+     directory named by the -i parameter to ppackage.
+
+  -s size
+     The average size of a chunk, in kilobytes.  The default is 32.
+     Changing this for an install directory that already has chunks
+     means that new versions will not share chunks with old ones.
+
+  -h
+     Display this help
+
+"""
+
+import sys
+import getopt
+import os
+
+from direct.p3d.ChunkStore import ChunkMaker
+from panda3d.core import Filename
+
+def usage(code, msg = ''):
+    sys.stderr.write(usageText % {'prog' : os.path.split(sys.argv[0])[1]})
+    sys.stderr.write(msg + '\n')
+    sys.exit(code)
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'i:s:h')
+except getopt.error as msg:
+    usage(1, msg)
+
+installDir = None
+chunkSizes = {}
+for opt, arg in opts:
+    if opt == '-i':
+        installDir = Filename.fromOsSpecific(arg)
+    elif opt == '-s':
+        avgChunkSize = int(arg) * 1024
+        chunkSizes = {
+            'minChunkSize' : avgChunkSize // 4,
+            'avgChunkSize' : avgChunkSize,
+            'maxChunkSize' : avgChunkSize * 4,
+            }
+
+    elif opt == '-h':
+        usage(0)
+    else:
+        print('illegal option: ' + arg)
+        sys.exit(1)
+
+packageNames = args
+
+if not installDir:
+    installDir = Filename('install')
+
+if not packageNames:
+    # "None" means all packages.
+    packageNames = None
+
+cm = ChunkMaker(installDir, **chunkSizes)
+if not cm.buildManifests(packageNames = packageNames):
+    sys.exit(1)
+
+# An explicit call to exit() is required to exit the program, when
+# this module is packaged in a p3d file.
+sys.exit(0)
@@ -51,6 +51,13 @@ Options:
      The full path to the install directory.  This should be the same
      directory named by the -i parameter to ppackage.
 
+  -j jobs
+     The number of patches to build at once, in separate processes.
+     Building a patch is slow for a large package, so when there are
+     several packages to patch, this can save a lot of time; but each
+     job needs enough memory to hold both versions of its package.
+     The default is 1, which builds the patches one at a time.
+
   -h
      Display this help
 
@@ -59,6 +66,7 @@ Options:
 import sys
 import getopt
 import os
+import multiprocessing
 
 from direct.p3d.PatchMaker import PatchMaker
 from panda3d.core import Filename
@@ -68,34 +76,48 @@ def usage(code, msg = ''):
     sys.stderr.write(msg + '\n')
     sys.exit(code)
 
-try:
-    opts, args = getopt.getopt(sys.argv[1:], 'i:h')
-except getopt.error as msg:
-    usage(1, msg)
-
-installDir = None
-for opt, arg in opts:
-    if opt == '-i':
-        installDir = Filename.fromOsSpecific(arg)
-
-    elif opt == '-h':
-        usage(0)
-    else:
-        print('illegal option: ' + arg)
-        sys.exit(1)
-
-packageNames = args
-
-if not installDir:
-    installDir = Filename('install')
-
-if not packageNames:
-    # "None" means all packages.
-    packageNames = None
-
-pm = PatchMaker(installDir)
-pm.buildPatches(packageNames = packageNames)
-
-# An explicit call to exit() is required to exit the program, when
-# this module is packaged in a p3d file.
-sys.exit(0)
+if __name__ == '__main__':
+    # The -j option builds the patches in a pool of processes, which
+    # may start by importing this module again, or, when this is
+    # frozen, by running it again.
+    multiprocessing.freeze_support()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:j:h')
+    except getopt.error as msg:
+        usage(1, msg)
+
+    installDir = None
+    numJobs = 1
+    for opt, arg in opts:
+        if opt == '-i':
+            installDir = Filename.fromOsSpecific(arg)
+        elif opt == '-j':
+            try:
+                numJobs = int(arg)
+            except ValueError:
+                usage(1, 'Invalid number of jobs: %s' % (arg))
+            if numJobs < 1:
+                usage(1, 'Invalid number of jobs: %s' % (arg))
+
+        elif opt == '-h':
+            usage(0)
+        else:
+            print('illegal option: ' + arg)
+            sys.exit(1)
+
+    packageNames = args
+
+    if not installDir:
+        installDir = Filename('install')
+
+    if not packageNames:
+        # "None" means all packages.
+        packageNames = None
+
+    pm = PatchMaker(installDir, numJobs = numJobs)
+    pm.buildPatches(packageNames = packageNames)
+
+    # An explicit call to exit() is required to exit the program, when
+    # this module is packaged in a p3d file.
+    sys.exit(0)
@@ -6,6 +6,9 @@ from panda3d.core import *
 from panda3d.core import Loader as PandaLoader
 from direct.directnotify.DirectNotifyGlobal import *
 from direct.showbase.DirectObject import DirectObject
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.task import Task
+import heapq
 
 # You can specify a phaseChecker callback to check
 # a modelPath to see if it is being loaded in the correct
@@ -34,12 +37,36 @@ class Loader(DirectObject):
             self.objects[index] = object
             self.numRemaining -= 1
 
-            if self.numRemaining == 0:
+            if self.numRemaining == 0 and self.callback is not None:
                 if self.gotList:
                     self.callback(self.objects, *self.extraArgs)
                 else:
                     self.callback(*(self.objects + self.extraArgs))
 
+    class Prefetch:
+        """ One model being prefetched.  All of the prefetch() callers
+        that ask for the same model share the same Prefetch, and the
+        same load request. """
+        def __init__(self, key, modelPath, loaderOptions, priority):
+            self.key = key
+            self.modelPath = modelPath
+            self.loaderOptions = loaderOptions
+            self.priority = priority
+            # A list of (Callback, index) pairs waiting for the model.
+            self.refs = []
+            self.request = None
+            self.startTime = None
+
+    class WarmUp:
+        """ A list of models waiting to be prepared on a GSG by
+        warmUp().  Each GeomNode is prepared separately, so the work
+        can be spread over several frames. """
+        def __init__(self, gsg, geomNodes, cb):
+            self.gsg = gsg
+            self.geomNodes = geomNodes
+            self.cb = cb
+            self.textures = set()
+
     # special methods
     def __init__(self, base):
         self.base = base
@@ -47,12 +74,36 @@ class Loader(DirectObject):
 
         self.__requests = {}
 
+        # The prefetch queue.  __prefetches maps a (fullpath, flags)
+        # key to its Prefetch, whether it is still waiting in
+        # __prefetchQueue or has already been handed to the loader
+        # thread, in which case its request is in __prefetchRequests.
+        self.__prefetches = {}
+        self.__prefetchQueue = []
+        self.__prefetchRequests = {}
+        self.__prefetchGroups = {}
+        self.__prefetchSeq = 0
+        self.prefetchMaxRequests = ConfigVariableInt(
+            'loader-prefetch-max-requests', 4).getValue()
+
+        # The warm-up queue, serviced by the loaderWarmUp task.
+        self.__warmUps = []
+        self.warmUpBytesPerFrame = ConfigVariableInt(
+            'warm-up-bytes-per-frame', 4 * 1024 * 1024).getValue()
+        self.warmUpMsPerFrame = ConfigVariableDouble(
+            'warm-up-ms-per-frame', 4.0).getValue()
+        self.warmUpTaskName = "loaderWarmUp_%s" % (Loader.loaderIndex)
+
+        self.resetStats()
+
         self.hook = "async_loader_%s" % (Loader.loaderIndex)
         Loader.loaderIndex += 1
         self.accept(self.hook, self.__gotAsyncObject)
 
     def destroy(self):
         self.ignore(self.hook)
+        taskMgr.remove(self.warmUpTaskName)
+        self.__warmUps = []
         self.loader.stopThreads()
         del self.base
         del self.loader
@@ -200,10 +251,20 @@ class Loader(DirectObject):
 
         if not cb.cancelled:
             cb.cancelled = True
+            hadPrefetch = False
             for request in cb.requests:
-                self.loader.remove(request)
-                del self.__requests[request]
+                if isinstance(request, Loader.Prefetch):
+                    self.__releasePrefetch(request, cb)
+                    hadPrefetch = True
+                elif isinstance(request, Loader.WarmUp):
+                    self.__warmUps.remove(request)
+                else:
+                    self.loader.remove(request)
+                    del self.__requests[request]
             cb.requests = None
+            if hadPrefetch:
+                self.__discardPrefetchCallback(cb)
+                self.__issuePrefetches()
 
     def isRequestPending(self, cb):
         """ Returns true if an asynchronous loading or flatten request
@@ -212,6 +273,310 @@ class Loader(DirectObject):
 
         return bool(cb.requests)
 
+    def prefetch(self, modelPath, priority = 0, group = None,
+                 callback = None, extraArgs = [], loaderOptions = None):
+        """
+        Queues up an asynchronous load of a model or list of models,
+        usually ones that will be needed soon, such as the models of
+        a neighboring area.  The loads are performed in the background
+        with at most loader-prefetch-max-requests of them in flight at
+        a time; the rest wait in a queue, highest priority first.
+
+        If several callers prefetch the same model (with the same
+        loaderOptions) while it is still pending, it is only loaded
+        once, and the result is shared among all of them.  If a
+        waiting caller asks for a higher priority, the pending load is
+        promoted.
+
+        If callback is not None, it is called with the loaded models
+        when they have all been loaded, as in loadModel().  Each
+        caller receives its own copy of the model, unless
+        LFAllowInstance is set in loaderOptions.  Without a callback,
+        the load simply warms the ModelPool, so that a later
+        loadModel() of the same model returns immediately.
+
+        group may be any hashable object, such as the name of an area.
+        cancelPrefetchGroup() cancels every prefetch in that group at
+        once, for instance when the player leaves the area.  The
+        return value may also be passed to cancelRequest() to cancel
+        just this call.
+        """
+
+        if loaderOptions is None:
+            loaderOptions = LoaderOptions()
+        else:
+            loaderOptions = LoaderOptions(loaderOptions)
+
+        if not isinstance(modelPath, (tuple, list, set)):
+            modelList = [modelPath]
+            gotList = False
+        else:
+            modelList = list(modelPath)
+            gotList = True
+
+        cb = Loader.Callback(len(modelList), gotList, callback, extraArgs)
+        cb.prefetchGroup = group
+        for i in range(len(modelList)):
+            if phaseChecker:
+                phaseChecker(modelList[i], loaderOptions)
+
+            key = (Filename(modelList[i]).getFullpath(), loaderOptions.getFlags())
+            entry = self.__prefetches.get(key)
+            if entry is None:
+                entry = Loader.Prefetch(key, modelList[i], loaderOptions, priority)
+                self.__prefetches[key] = entry
+                self.__queuePrefetch(entry)
+            else:
+                self.__stats['deduplicated'] += 1
+                if priority > entry.priority:
+                    entry.priority = priority
+                    if entry.request is not None:
+                        entry.request.setPriority(priority)
+                    else:
+                        # The old queue entry becomes stale, and will
+                        # be skipped when it comes up.
+                        self.__queuePrefetch(entry)
+
+            entry.refs.append((cb, i))
+            cb.requests.add(entry)
+
+        if cb.requests:
+            self.__prefetchGroups.setdefault(group, set()).add(cb)
+        self.__issuePrefetches()
+        return cb
+
+    def cancelPrefetchGroup(self, group):
+        """ Cancels all of the pending prefetch() calls that were made
+        with the indicated group.  Models that are also wanted by a
+        prefetch in some other group continue to load. """
+
+        for cb in list(self.__prefetchGroups.get(group, ())):
+            self.cancelRequest(cb)
+
+    def getStats(self):
+        """ Returns a dictionary of statistics about prefetch(): the
+        number of models queued and in flight, the number of loads
+        issued, completed, failed and cancelled, the number of requests
+        that were satisfied by a load already pending, the total bytes
+        and seconds spent loading, and the seconds taken by each
+        model.  It also reports the number of GeomNodes still waiting
+        for warmUp(), and the estimated bytes and the frames it has
+        spent preparing them. """
+
+        stats = dict(self.__stats)
+        stats['queued'] = len(self.__prefetches) - len(self.__prefetchRequests)
+        stats['inFlight'] = len(self.__prefetchRequests)
+        stats['modelTimes'] = dict(self.__stats['modelTimes'])
+        stats['warmUpPending'] = sum([len(w.geomNodes) for w in self.__warmUps])
+        return stats
+
+    def resetStats(self):
+        """ Resets the counters reported by getStats(). """
+        self.__stats = {
+            'issued' : 0,
+            'completed' : 0,
+            'failed' : 0,
+            'cancelled' : 0,
+            'deduplicated' : 0,
+            'bytesLoaded' : 0,
+            'loadTime' : 0.0,
+            'modelTimes' : {},
+            'warmUpBytes' : 0,
+            'warmUpFrames' : 0,
+            }
+
+    def __queuePrefetch(self, entry):
+        heapq.heappush(self.__prefetchQueue,
+                       (-entry.priority, self.__prefetchSeq, entry))
+        self.__prefetchSeq += 1
+
+    def __issuePrefetches(self):
+        """ Hands queued prefetches to the loader thread until the
+        in-flight limit is reached. """
+
+        while self.__prefetchQueue and \
+              len(self.__prefetchRequests) < self.prefetchMaxRequests:
+            negPriority, seq, entry = heapq.heappop(self.__prefetchQueue)
+            if self.__prefetches.get(entry.key) is not entry or \
+               entry.request is not None or -negPriority != entry.priority:
+                # Cancelled, already issued, or since promoted.
+                continue
+
+            request = self.loader.makeAsyncRequest(Filename(entry.modelPath), entry.loaderOptions)
+            request.setPriority(entry.priority)
+            request.setDoneEvent(self.hook)
+            entry.request = request
+            entry.startTime = ClockObject.getGlobalClock().getRealTime()
+            self.__prefetchRequests[request] = entry
+            self.__stats['issued'] += 1
+            self.loader.loadAsync(request)
+
+    def __releasePrefetch(self, entry, cb):
+        """ Removes the indicated Callback from the Prefetch, and
+        cancels the load if nobody else is waiting for it. """
+
+        entry.refs = [ref for ref in entry.refs if ref[0] is not cb]
+        if entry.refs or self.__prefetches.get(entry.key) is not entry:
+            return
+
+        del self.__prefetches[entry.key]
+        if entry.request is not None:
+            self.loader.remove(entry.request)
+            del self.__prefetchRequests[entry.request]
+        self.__stats['cancelled'] += 1
+
+    def __discardPrefetchCallback(self, cb):
+        callbacks = self.__prefetchGroups.get(cb.prefetchGroup)
+        if callbacks is not None:
+            callbacks.discard(cb)
+            if not callbacks:
+                del self.__prefetchGroups[cb.prefetchGroup]
+
+    def __gotPrefetch(self, entry, request):
+        """ A prefetched model has been loaded; hand it to everyone
+        who is waiting for it. """
+
+        del self.__prefetches[entry.key]
+        loadTime = ClockObject.getGlobalClock().getRealTime() - entry.startTime
+        self.__stats['loadTime'] += loadTime
+        self.__stats['modelTimes'][entry.key[0]] = loadTime
+
+        node = request.getModel()
+        if node is None:
+            self.__stats['failed'] += 1
+        else:
+            self.__stats['completed'] += 1
+            file = VirtualFileSystem.getGlobalPtr().getFile(node.getFullpath())
+            if file is not None:
+                self.__stats['bytesLoaded'] += file.getFileSize()
+
+        allowInstance = (entry.loaderOptions.getFlags() & LoaderOptions.LFAllowInstance) != 0
+        first = True
+        for cb, i in entry.refs:
+            object = None
+            if node is not None and cb.callback is not None:
+                # The first caller gets the node we loaded; everyone
+                # else gets a copy of it.
+                if first or allowInstance:
+                    object = NodePath(node)
+                else:
+                    object = NodePath(node.copySubgraph())
+                first = False
+
+            cb.requests.discard(entry)
+            if not cb.requests:
+                self.__discardPrefetchCallback(cb)
+            cb.gotObject(i, object)
+
+        self.__issuePrefetches()
+
+    def warmUp(self, model, callback = None, extraArgs = [], gsg = None):
+        """
+        Prepares the textures and vertex buffers of a freshly loaded
+        model (or list of models) on the GSG ahead of time, so that
+        they are not all uploaded at once the first time the model is
+        rendered.  This is like model.prepareScene(gsg), but the work
+        is spread over several frames: each frame, GeomNodes are
+        prepared until about warm-up-bytes-per-frame bytes of
+        textures and vertex data have been queued for upload, or
+        warm-up-ms-per-frame milliseconds have been spent, whichever
+        comes first.  At least one GeomNode is prepared each frame.
+
+        If callback is not None, it is called with the model(s) when
+        they have all been prepared.  The return value may be passed
+        to cancelRequest() to stop warming them up.  The default gsg
+        is that of base.win; if there is none, the callback is
+        invoked immediately.
+        """
+
+        if isinstance(model, NodePath):
+            modelList = [model]
+            gotList = False
+        else:
+            modelList = list(model)
+            gotList = True
+
+        cb = Loader.Callback(len(modelList), gotList, callback, extraArgs)
+        if gsg is None and getattr(self.base, 'win', None):
+            gsg = self.base.win.getGsg()
+
+        geomNodes = []
+        if gsg is not None:
+            for model in modelList:
+                if model.node().isGeomNode():
+                    geomNodes.append(model)
+                geomNodes.extend(model.findAllMatches('**/+GeomNode'))
+
+        if not geomNodes:
+            for i in range(len(modelList)):
+                cb.gotObject(i, modelList[i])
+            return cb
+
+        cb.models = modelList
+        warmUp = Loader.WarmUp(gsg, geomNodes, cb)
+        warmUp.geomNodes.reverse()
+        cb.requests.add(warmUp)
+        self.__warmUps.append(warmUp)
+        if not taskMgr.hasTaskNamed(self.warmUpTaskName):
+            taskMgr.add(self.__warmUpTask, self.warmUpTaskName)
+        return cb
+
+    def __warmUpTask(self, task):
+        """ Prepares queued GeomNodes until this frame's budget is
+        used up. """
+
+        clock = ClockObject.getGlobalClock()
+        endTime = clock.getRealTime() + self.warmUpMsPerFrame * 0.001
+        bytesLeft = self.warmUpBytesPerFrame
+        self.__stats['warmUpFrames'] += 1
+        while self.__warmUps:
+            warmUp = self.__warmUps[0]
+            if warmUp.geomNodes:
+                geomNode = warmUp.geomNodes.pop()
+                numBytes = self.__estimateWarmUpBytes(warmUp, geomNode)
+                geomNode.prepareScene(warmUp.gsg)
+                self.__stats['warmUpBytes'] += numBytes
+                bytesLeft -= numBytes
+
+            if not warmUp.geomNodes:
+                del self.__warmUps[0]
+                cb = warmUp.cb
+                cb.requests.discard(warmUp)
+                for i in range(len(cb.models)):
+                    cb.gotObject(i, cb.models[i])
+
+            if bytesLeft <= 0 or clock.getRealTime() >= endTime:
+                break
+
+        if self.__warmUps:
+            return Task.cont
+        return Task.done
+
+    def __estimateWarmUpBytes(self, warmUp, geomNode):
+        """ Returns roughly how many bytes preparing the indicated
+        GeomNode will upload: its vertex and index data, and any of
+        its textures that are not already prepared. """
+
+        numBytes = 0
+        node = geomNode.node()
+        for i in range(node.getNumGeoms()):
+            geom = node.getGeom(i)
+            vdata = geom.getVertexData()
+            for j in range(vdata.getNumArrays()):
+                numBytes += vdata.getArray(j).getDataSizeBytes()
+            for j in range(geom.getNumPrimitives()):
+                prim = geom.getPrimitive(j)
+                if prim.isIndexed():
+                    numBytes += prim.getDataSizeBytes()
+
+        preparedObjects = warmUp.gsg.getPreparedObjects()
+        for tex in geomNode.findAllTextures():
+            if tex not in warmUp.textures:
+                warmUp.textures.add(tex)
+                if not tex.isPrepared(preparedObjects):
+                    numBytes += tex.estimateTextureMemory()
+        return numBytes
+
     def loadModelOnce(self, modelPath):
         """
         modelPath is a string.
@@ -980,6 +1345,11 @@ class Loader(DirectObject):
         of loaded objects, and call the appropriate callback when it's
         time."""
 
+        entry = self.__prefetchRequests.pop(request, None)
+        if entry is not None:
+            self.__gotPrefetch(entry, request)
+            return
+
         if request not in self.__requests:
             return
 
@@ -1010,6 +1380,10 @@ class Loader(DirectObject):
     load_model = loadModel
     cancel_request = cancelRequest
     is_request_pending = isRequestPending
+    cancel_prefetch_group = cancelPrefetchGroup
+    warm_up = warmUp
+    get_stats = getStats
+    reset_stats = resetStats
     unload_model = unloadModel
     save_model = saveModel
     load_font = loadFont
@@ -5,10 +5,28 @@ __all__ = ['Messenger']
 
 from .PythonUtil import *
 from direct.directnotify import DirectNotifyGlobal
+from panda3d.core import ConfigVariableBool, AsyncTaskManager, Thread
+from functools import partial
 import types
 
 from direct.stdpy.threading import Lock
 
+class _NullLock:
+    """ A stand-in for Lock that does nothing, used by the
+    Messenger while it knows that it is only being accessed from a
+    single thread.  See Messenger.setSingleThreaded(). """
+
+    def acquire(self, blocking = True):
+        return True
+
+    def release(self):
+        pass
+
+    __enter__ = acquire
+
+    def __exit__(self, t, v, tb):
+        pass
+
 class Messenger:
 
     notify = DirectNotifyGlobal.directNotify.newCategory("Messenger")
@@ -43,9 +61,24 @@ class Messenger:
         # across task chains (and therefore across threads).
         self._eventQueuesByTaskChain = {}
 
+        # eventName->tuple of precompiled (objMsgrId, callbackInfo,
+        # callable, persistent) entries, used when compiled dispatch
+        # is enabled.  An entry is discarded whenever the set of
+        # listeners for its event changes, and rebuilt on the next
+        # send.
+        self.__dispatchTables = {}
+        self.__compiledDispatch = ConfigVariableBool(
+            'messenger-compiled-dispatch', False).getValue()
+
         # This protects the data structures within this object from
-        # multithreaded access.
-        self.lock = Lock()
+        # multithreaded access.  While the messenger is in
+        # single-threaded mode, self.lock is a _NullLock instead.
+        self.__realLock = Lock()
+        self.lock = self.__realLock
+        self.__singleThreaded = False
+        if not Thread.isThreadingSupported() or \
+           ConfigVariableBool('messenger-single-threaded', False).getValue():
+            self.setSingleThreaded(True)
 
         if __debug__:
             self.__isWatching=0
@@ -108,6 +141,68 @@ class Messenger:
             if record[0] <= 0:
                 del self._id2object[id]
 
+    def setCompiledDispatch(self, compiledDispatch):
+        """
+        Enables or disables compiled dispatch.  When it is enabled,
+        send() delivers each event from a cached tuple of callables
+        with their extraArgs already bound, which is only rebuilt
+        when accept() or ignore() changes the listeners for that
+        event, and the messenger lock is not released and
+        re-acquired around each individual handler.  This may also be
+        enabled with the config variable messenger-compiled-dispatch.
+        """
+        self.lock.acquire()
+        try:
+            self.__compiledDispatch = bool(compiledDispatch)
+            self.__dispatchTables.clear()
+        finally:
+            self.lock.release()
+
+    def getCompiledDispatch(self):
+        return self.__compiledDispatch
+
+    def setSingleThreaded(self, singleThreaded):
+        """
+        Enables or disables single-threaded mode.  In this mode, the
+        messenger assumes that it is only ever accessed from the main
+        thread, and skips all of its locking.  This may also be
+        enabled with the config variable messenger-single-threaded.
+
+        The request is ignored, with a warning, if any task chain
+        already runs in its own threads.  The TaskManager
+        automatically turns this mode off again as soon as
+        setupTaskChain() is called with numThreads greater than 0.
+        """
+        if singleThreaded == self.__singleThreaded:
+            return
+
+        if singleThreaded and self.__hasThreadedTaskChain():
+            self.notify.warning(
+                "not entering single-threaded mode; task chains are running in threads.")
+            return
+
+        # Hold the real lock while we swap it, so that no other
+        # thread can be in the middle of using it.
+        self.__realLock.acquire()
+        try:
+            self.__singleThreaded = singleThreaded
+            if singleThreaded:
+                self.lock = _NullLock()
+            else:
+                self.lock = self.__realLock
+        finally:
+            self.__realLock.release()
+
+    def isSingleThreaded(self):
+        return self.__singleThreaded
+
+    def __hasThreadedTaskChain(self):
+        mgr = AsyncTaskManager.getGlobalPtr()
+        for i in range(mgr.getNumTaskChains()):
+            if mgr.getTaskChain(i).getNumThreads() > 0:
+                return True
+        return False
+
     def accept(self, event, object, method, extraArgs=[], persistent=1):
         """ accept(self, string, DirectObject, Function, List, Boolean)
 
@@ -156,6 +251,7 @@ class Messenger:
                             (object.__class__.__name__, safeRepr(event), method.__name__, oldMethod.__name__))
 
             acceptorDict[id] = [method, extraArgs, persistent]
+            self.__dispatchTables.pop(event, None)
 
             # Remember that this object is listening for this event
             eventDict = self.__objectEvents.setdefault(id, {})
@@ -183,6 +279,7 @@ class Messenger:
             # If this object is there, delete it from the dictionary
             if acceptorDict and id in acceptorDict:
                 del acceptorDict[id]
+                self.__dispatchTables.pop(event, None)
                 # If this dictionary is now empty, remove the event
                 # entry from the Messenger alltogether
                 if (len(acceptorDict) == 0):
@@ -220,6 +317,7 @@ class Messenger:
                     # If this object is there, delete it from the dictionary
                     if acceptorDict and id in acceptorDict:
                         del acceptorDict[id]
+                        self.__dispatchTables.pop(event, None)
                         # If this dictionary is now empty, remove the event
                         # entry from the Messenger alltogether
                         if (len(acceptorDict) == 0):
@@ -296,37 +394,103 @@ class Messenger:
 
         self.lock.acquire()
         try:
-            foundWatch=0
-            if __debug__:
-                if self.__isWatching:
-                    for i in self.__watching.keys():
-                        if str(event).find(i) >= 0:
-                            foundWatch=1
-                            break
-            acceptorDict = self.__callbacks.get(event)
-            if not acceptorDict:
-                if __debug__:
-                    if foundWatch:
-                        print("Messenger: \"%s\" was sent, but no function in Python listened."%(event,))
-                return
-
-            if taskChain:
-                # Queue the event onto the indicated task chain.
-                from direct.task.TaskManagerGlobal import taskMgr
-                queue = self._eventQueuesByTaskChain.setdefault(taskChain, [])
-                queue.append((acceptorDict, event, sentArgs, foundWatch))
-                if len(queue) == 1:
-                    # If this is the first (only) item on the queue,
-                    # spawn the task to empty it.
-                    taskMgr.add(self.__taskChainDispatch, name = 'Messenger-%s' % (taskChain),
-                                extraArgs = [taskChain], taskChain = taskChain,
-                                appendTask = True)
-            else:
-                # Handle the event immediately.
-                self.__dispatch(acceptorDict, event, sentArgs, foundWatch)
+            pending = self.__prepareSend(event, sentArgs, taskChain)
+        finally:
+            self.lock.release()
+
+        if pending:
+            # Compiled dispatch happens outside of the lock.
+            self.__dispatchCompiled(*pending)
+
+    def sendMany(self, events, taskChain = None):
+        """
+        Sends a batch of events.  events is a sequence of (event,
+        sentArgs) pairs, which are delivered in order exactly as if
+        send() had been called on each one, except that the messenger
+        lock is acquired only once for the whole batch.
+
+        When compiled dispatch is enabled, the listeners for every
+        event in the batch are looked up before any handler is
+        called, so a hook added by a handler will not receive the
+        later events of the same batch.
+        """
+        if Messenger.notify.getDebug():
+            for event, sentArgs in events:
+                if not self.quieting.get(event):
+                    assert Messenger.notify.debug(
+                        'sent event: %s sentArgs = %s, taskChain = %s' % (
+                        event, sentArgs, taskChain))
+
+        pendingList = []
+        self.lock.acquire()
+        try:
+            for event, sentArgs in events:
+                pending = self.__prepareSend(event, sentArgs, taskChain)
+                if pending:
+                    pendingList.append(pending)
         finally:
             self.lock.release()
 
+        for pending in pendingList:
+            self.__dispatchCompiled(*pending)
+
+    def __prepareSend(self, event, sentArgs, taskChain):
+        """ Does the work of send() that must be done with the lock
+        held.  The event is queued onto the task chain, or dispatched
+        immediately in the normal mode; in the compiled dispatch mode
+        the dispatch table is returned instead, along with the
+        arguments to pass to __dispatchCompiled() once the lock has
+        been released.  Assumes lock is held. """
+        foundWatch=0
+        if __debug__:
+            if self.__isWatching:
+                for i in self.__watching.keys():
+                    if str(event).find(i) >= 0:
+                        foundWatch=1
+                        break
+        acceptorDict = self.__callbacks.get(event)
+        if not acceptorDict:
+            if __debug__:
+                if foundWatch:
+                    print("Messenger: \"%s\" was sent, but no function in Python listened."%(event,))
+            return None
+
+        if taskChain:
+            # Queue the event onto the indicated task chain.
+            from direct.task.TaskManagerGlobal import taskMgr
+            queue = self._eventQueuesByTaskChain.setdefault(taskChain, [])
+            queue.append((acceptorDict, event, sentArgs, foundWatch))
+            if len(queue) == 1:
+                # If this is the first (only) item on the queue,
+                # spawn the task to empty it.
+                taskMgr.add(self.__taskChainDispatch, name = 'Messenger-%s' % (taskChain),
+                            extraArgs = [taskChain], taskChain = taskChain,
+                            appendTask = True)
+        elif self.__compiledDispatch:
+            table = self.__dispatchTables.get(event)
+            if table is None:
+                table = self.__compileDispatchTable(event, acceptorDict)
+            return (table, acceptorDict, event, sentArgs, foundWatch)
+        else:
+            # Handle the event immediately.
+            self.__dispatch(acceptorDict, event, sentArgs, foundWatch)
+        return None
+
+    def __compileDispatchTable(self, event, acceptorDict):
+        """ Builds and caches the dispatch table for the indicated
+        event.  Assumes lock is held. """
+        entries = []
+        for id, callInfo in acceptorDict.items():
+            method, extraArgs, persistent = callInfo
+            if extraArgs:
+                callback = partial(method, *extraArgs)
+            else:
+                callback = method
+            entries.append((id, callInfo, callback, persistent))
+        table = tuple(entries)
+        self.__dispatchTables[event] = table
+        return table
+
     def __taskChainDispatch(self, taskChain, task):
         """ This task is spawned each time an event is sent across
         task chains.  Its job is to empty the task events on the queue
@@ -372,20 +536,7 @@ class Messenger:
                 # If this object was only accepting this event once,
                 # remove it from the dictionary
                 if not persistent:
-                    # This object is no longer listening for this event
-                    eventDict = self.__objectEvents.get(id)
-                    if eventDict and event in eventDict:
-                        del eventDict[event]
-                        if (len(eventDict) == 0):
-                            del self.__objectEvents[id]
-                        self._releaseObject(self._getObject(id))
-
-                    del acceptorDict[id]
-                    # If the dictionary at this event is now empty, remove
-                    # the event entry from the Messenger altogether
-                    if (event in self.__callbacks \
-                            and (len(self.__callbacks[event]) == 0)):
-                        del self.__callbacks[event]
+                    self.__removeOnceHook(acceptorDict, event, id)
 
                 if __debug__:
                     if foundWatch:
@@ -412,6 +563,57 @@ class Messenger:
                 finally:
                     self.lock.acquire()
 
+    def __dispatchCompiled(self, table, acceptorDict, event, sentArgs, foundWatch):
+        """ Calls each of the handlers in the precompiled dispatch
+        table.  Unlike __dispatch(), this is called without the lock
+        held; it is only taken to remove a hook that was accepting
+        the event only once. """
+        for id, callInfo, callback, persistent in table:
+            # A previous handler may have removed or replaced this
+            # hook, in which case it should no longer be called.
+            if acceptorDict.get(id) is not callInfo:
+                continue
+
+            if not persistent:
+                self.lock.acquire()
+                try:
+                    # Check again now that we hold the lock, in case
+                    # another thread got to it first.
+                    if acceptorDict.get(id) is not callInfo:
+                        continue
+                    self.__removeOnceHook(acceptorDict, event, id)
+                finally:
+                    self.lock.release()
+
+            if __debug__:
+                if foundWatch:
+                    print("Messenger: \"%s\" --> %s%s"%(
+                        event,
+                        self.__methodRepr(callInfo[0]),
+                        tuple(callInfo[1]) + tuple(sentArgs)))
+
+            callback(*sentArgs)
+
+    def __removeOnceHook(self, acceptorDict, event, id):
+        """ Removes the hook of an object that was only accepting
+        this event once, just before it is called.  Assumes lock is
+        held. """
+        # This object is no longer listening for this event
+        eventDict = self.__objectEvents.get(id)
+        if eventDict and event in eventDict:
+            del eventDict[event]
+            if (len(eventDict) == 0):
+                del self.__objectEvents[id]
+            self._releaseObject(self._getObject(id))
+
+        del acceptorDict[id]
+        self.__dispatchTables.pop(event, None)
+        # If the dictionary at this event is now empty, remove
+        # the event entry from the Messenger altogether
+        if (event in self.__callbacks \
+                and (len(self.__callbacks[event]) == 0)):
+            del self.__callbacks[event]
+
     def clear(self):
         """
         Start fresh with a clear dict
@@ -420,6 +622,7 @@ class Messenger:
         try:
             self.__callbacks.clear()
             self.__objectEvents.clear()
+            self.__dispatchTables.clear()
             self._id2object.clear()
         finally:
             self.lock.release()
@@ -453,6 +656,7 @@ class Messenger:
                     newMethod = types.MethodType(
                         newFunction, method.__self__, method.__self__.__class__)
                     params[0] = newMethod
+                    self.__dispatchTables.pop(event, None)
                     # Found it retrun true
                     retFlag += 1
         # didn't find that method, return false
@@ -1,12 +1,19 @@
 __all__ = ['register', 'sharedPackages',
-           'reloadSharedPackage', 'reloadSharedPackages']
+           'reloadSharedPackage', 'reloadSharedPackages',
+           'invalidateCaches', 'importMaps', 'loadImportMap',
+           'markImportTiming', 'writeImportReport']
 
-from panda3d.core import Filename, VirtualFileSystem, VirtualFileMountSystem, OFileStream, copyStream
+from panda3d.core import Filename, VirtualFileSystem, VirtualFileMountSystem, OFileStream, copyStream, ConfigVariableBool, ConfigVariableFilename, ConfigVariableInt
 from direct.stdpy.file import open
+from timeit import default_timer
 import sys
+import os
+import io
 import marshal
 import imp
 import types
+import atexit
+import hashlib
 
 # The sharedPackages dictionary lists all of the "shared packages",
 # special Python packages that automatically span multiple directories
@@ -23,6 +30,24 @@ import types
 
 sharedPackages = {}
 
+# The importMaps dictionary maps the full path of a directory within
+# a mounted multifile to a dictionary of the modules that are found
+# in that directory, mapping the full name of each module to the
+# Filename it is stored in.  It is filled in by loadImportMap() from
+# the tables that the packager writes into each multifile, and lets
+# the VFSMapImporter find those modules without searching each
+# directory.  _importMapDirs maps the directory each multifile is
+# mounted on to the list of directories in importMaps that came from
+# it.
+
+importMaps = {}
+_importMapDirs = {}
+
+# This is the name of that table within a multifile.  Each line of it
+# gives a module name and, after a space, the subfile that contains
+# the module.
+importMapFilename = 'p3d_import_map.txt'
+
 vfs = VirtualFileSystem.getGlobalPtr()
 
 compiledExtensions = [ 'pyc', 'pyo' ]
@@ -31,6 +56,194 @@ if not __debug__:
     # We implement that by reversing the extension names.
     compiledExtensions = [ 'pyo', 'pyc' ]
 
+# Rather than asking the VFS about each possible filename for a module
+# in turn, the VFSImporter normally reads each directory once, and
+# then answers its lookups from this dictionary, which maps the full
+# path of a directory to (timestamp, files); files maps each basename
+# in the directory to its VirtualFile.  A directory that has been
+# changed on disk is read again, but a directory with a multifile
+# mounted on it has no timestamp to check; if you add a file to such a
+# directory yourself, you must call invalidateCaches().  The whole
+# cache is emptied automatically whenever something is mounted or
+# unmounted.
+useDirectoryCache = ConfigVariableBool('vfs-importer-cache', True,
+    'Set this false to make the VFSImporter look up each possible '
+    'filename for a module in the VFS, instead of reading each '
+    'directory once and remembering its contents.').getValue()
+
+_dirListings = {}
+_mountSignature = None
+_mountPoints = []
+
+# When a .py file is compiled, the VFSLoader tries to write the .pyc
+# file next to it.  If it can't (for instance, because the .py file
+# is in a read-only multifile), the compiled code is kept in this
+# directory instead.  Each file there is named for a hash of the
+# source text and its filename, so it never needs to be checked
+# against a timestamp, and one directory serves every package.  The
+# least recently used files are removed when the directory grows past
+# its size limit.
+codeCacheDir = ConfigVariableFilename('python-cache-dir', '',
+    'The directory in which to keep compiled Python code for source '
+    'files that can\'t have a .pyc file written beside them.  Leave '
+    'this empty to compile such files every time they are imported.').getValue()
+codeCacheMaxSize = ConfigVariableInt('python-cache-max-kbytes', 102400,
+    'The maximum size of the python-cache-dir, in kilobytes.').getValue() * 1024
+
+# The total size of the files in codeCacheDir, once we have looked.
+_codeCacheSize = None
+
+def invalidateCaches():
+    """ Forgets the directory contents remembered by the
+    VFSImporter, so that files added since a directory was first
+    searched can be found. """
+
+    global _mountSignature
+    _dirListings.clear()
+    _mountSignature = None
+
+def _checkMounts():
+    """ Empties the directory cache if anything has been mounted or
+    unmounted since it was filled. """
+
+    global _mountSignature, _mountPoints
+    mounts = vfs.getMounts()
+    signature = tuple([(mount.this, mount.getMountPoint().getFullpath())
+                       for mount in mounts])
+    if signature != _mountSignature:
+        _dirListings.clear()
+        _mountSignature = signature
+        _mountPoints = [mountPoint for this, mountPoint in signature]
+
+def _getDirectoryListing(dirname):
+    """ Returns a dictionary of the files and subdirectories in the
+    indicated directory, mapping each basename to its VirtualFile, or
+    to None for a directory that exists only because something is
+    mounted below it.  The dictionary is empty if the directory does
+    not exist. """
+
+    dirname = Filename(dirname)
+    dirname.makeAbsolute(vfs.getCwd())
+    key = dirname.getFullpath()
+
+    # Only a real directory's timestamp tells us anything; the others
+    # change only when something is mounted or unmounted.
+    timestamp = None
+    dirFile = vfs.getFile(dirname, True)
+    if hasattr(dirFile, 'getMount') and \
+       isinstance(dirFile.getMount(), VirtualFileMountSystem):
+        timestamp = dirFile.getTimestamp()
+    elif dirFile:
+        timestamp = 0
+
+    entry = _dirListings.get(key, None)
+    if entry is not None and entry[0] == timestamp:
+        return entry[1]
+
+    files = {}
+    fileList = vfs.scanDirectory(dirname)
+    if fileList:
+        for i in range(fileList.getNumFiles()):
+            vfile = fileList.getFile(i)
+            files[vfile.getFilename().getBasename()] = vfile
+
+    # scanDirectory() doesn't report the directories that lead down to
+    # a mount point, but the VFS will find files within them.
+    prefix = key.strip('/')
+    if prefix:
+        prefix += '/'
+    for mountPoint in _mountPoints:
+        if len(mountPoint) > len(prefix) and mountPoint.startswith(prefix):
+            files.setdefault(mountPoint[len(prefix):].split('/')[0], None)
+
+    _dirListings[key] = (timestamp, files)
+    return files
+
+class ImportTimer:
+    """ This class records the time spent finding, loading and
+    running each module imported through the VFSImporter, when
+    import-timing-report is set.  The time a module spends running
+    includes the time to import the modules it imports in turn; that
+    is subtracted out again to give the module's own share. """
+
+    class ModuleTiming:
+        def __init__(self, fullname, first):
+            self.fullname = fullname
+            self.first = first
+            self.find = 0
+            self.load = 0
+            self.exec_ = 0
+            self.nested = 0
+
+        def getOwnTime(self):
+            return self.find + self.load + self.exec_ - self.nested
+
+    def __init__(self):
+        self.startTime = default_timer()
+        self.modules = {}
+        self.marks = []
+
+        # The modules that are running now, innermost last.
+        self.stack = []
+
+    def time(self, fullname, phase, func, *args):
+        """ Calls func(*args), and adds the time it takes to the
+        indicated phase ('find', 'load' or 'exec') of the named
+        module. """
+
+        timing = self.modules.get(fullname, None)
+        if timing is None:
+            timing = self.ModuleTiming(fullname, default_timer() - self.startTime)
+            self.modules[fullname] = timing
+
+        if phase == 'exec':
+            self.stack.append(timing)
+        start = default_timer()
+        try:
+            return func(*args)
+        finally:
+            elapsed = default_timer() - start
+            if phase == 'exec':
+                self.stack.pop()
+                timing.exec_ += elapsed
+            else:
+                setattr(timing, phase, getattr(timing, phase) + elapsed)
+            if self.stack:
+                self.stack[-1].nested += elapsed
+
+    def mark(self, label):
+        self.marks.append((default_timer() - self.startTime, label))
+
+    def writeReport(self, filename):
+        """ Writes the timings collected so far to the indicated
+        file, most expensive module first. """
+
+        modules = sorted(self.modules.values(),
+                         key = lambda timing: -timing.getOwnTime())
+        total = sum([timing.getOwnTime() for timing in modules])
+
+        out = open(filename.toOsSpecific(), 'w')
+        out.write('%s modules imported in %.1f ms, after %.3f s\n\n' % (
+            len(modules), total * 1000.0, default_timer() - self.startTime))
+        out.write('%8s  %8s  %8s  %8s  %8s  %s\n' % (
+            'first s', 'find ms', 'load ms', 'exec ms', 'own ms', 'module'))
+        for timing in modules:
+            out.write('%8.3f  %8.1f  %8.1f  %8.1f  %8.1f  %s\n' % (
+                timing.first, timing.find * 1000.0, timing.load * 1000.0,
+                timing.exec_ * 1000.0, timing.getOwnTime() * 1000.0,
+                timing.fullname))
+
+        if self.marks:
+            out.write('\n%8s  %s\n' % ('time s', 'event'))
+            for t, label in self.marks:
+                out.write('%8.3f  %s\n' % (t, label))
+        out.close()
+
+# This is set to an ImportTimer when the import-timing-report
+# variable names a file.  The report is written there when the
+# program exits.
+importTimer = None
+
 class VFSImporter:
     """ This class serves as a Python importer to support loading
     Python .py and .pyc/.pyo files from Panda's Virtual File System,
@@ -44,6 +257,11 @@ class VFSImporter:
             self.dir_path = Filename.fromOsSpecific(path)
 
     def find_module(self, fullname, path = None):
+        if importTimer:
+            return importTimer.time(fullname, 'find', self._find_module, fullname, path)
+        return self._find_module(fullname, path)
+
+    def _find_module(self, fullname, path = None):
         if path is None:
             dir_path = self.dir_path
         else:
@@ -52,10 +270,17 @@ class VFSImporter:
         basename = fullname.split('.')[-1]
         path = Filename(dir_path, basename)
 
+        if useDirectoryCache:
+            _checkMounts()
+            files = _getDirectoryListing(dir_path)
+            getFile = lambda filename: files.get(filename.getBasename(), None)
+        else:
+            getFile = lambda filename: vfs.getFile(filename, True)
+
         # First, look for Python files.
         filename = Filename(path)
         filename.setExtension('py')
-        vfile = vfs.getFile(filename, True)
+        vfile = getFile(filename)
         if vfile:
             return VFSLoader(dir_path, vfile, filename,
                              desc=('.py', 'U', imp.PY_SOURCE))
@@ -65,7 +290,7 @@ class VFSImporter:
         for ext in compiledExtensions:
             filename = Filename(path)
             filename.setExtension(ext)
-            vfile = vfs.getFile(filename, True)
+            vfile = getFile(filename)
             if vfile:
                 return VFSLoader(dir_path, vfile, filename,
                                  desc=('.'+ext, 'rb', imp.PY_COMPILED))
@@ -76,20 +301,26 @@ class VFSImporter:
                 continue
 
             filename = Filename(path + desc[0])
-            vfile = vfs.getFile(filename, True)
+            vfile = getFile(filename)
             if vfile:
                 return VFSLoader(dir_path, vfile, filename, desc=desc)
 
         # Finally, consider a package, i.e. a directory containing
         # __init__.py.
+        if useDirectoryCache:
+            if basename not in files:
+                return None
+            packageFiles = _getDirectoryListing(path)
+            getFile = lambda filename: packageFiles.get(filename.getBasename(), None)
+
         filename = Filename(path, '__init__.py')
-        vfile = vfs.getFile(filename, True)
+        vfile = getFile(filename)
         if vfile:
             return VFSLoader(dir_path, vfile, filename, packagePath=path,
                              desc=('.py', 'U', imp.PY_SOURCE))
         for ext in compiledExtensions:
             filename = Filename(path, '__init__.' + ext)
-            vfile = vfs.getFile(filename, True)
+            vfile = getFile(filename)
             if vfile:
                 return VFSLoader(dir_path, vfile, filename, packagePath=path,
                                  desc=('.'+ext, 'rb', imp.PY_COMPILED))
@@ -97,6 +328,10 @@ class VFSImporter:
         #print >>sys.stderr, "not found."
         return None
 
+    def invalidate_caches(self):
+        """ Called by importlib.invalidate_caches(). """
+        invalidateCaches()
+
 class VFSLoader:
     """ The second part of VFSImporter, this is created for a
     particular .py file or directory. """
@@ -113,9 +348,9 @@ class VFSLoader:
     def load_module(self, fullname, loadingShared = False):
         #print >>sys.stderr, "load_module(%s), dir_path = %s, filename = %s" % (fullname, self.dir_path, self.filename)
         if self.desc[2] == imp.PY_FROZEN:
-            return self._import_frozen_module(fullname)
+            return self._timed(fullname, 'exec', self._import_frozen_module, fullname)
         if self.desc[2] == imp.C_EXTENSION:
-            return self._import_extension_module(fullname)
+            return self._timed(fullname, 'exec', self._import_extension_module, fullname)
 
         # Check if this is a child of a shared package.
         if not loadingShared and self.packagePath and '.' in fullname:
@@ -130,7 +365,7 @@ class VFSLoader:
                 assert loader
                 return loader.load_module(fullname)
 
-        code = self._read_code()
+        code = self._timed(fullname, 'load', self._read_code)
         if not code:
             raise ImportError('No Python code in %s' % (fullname))
 
@@ -141,9 +376,16 @@ class VFSLoader:
             mod.__path__ = [self.packagePath.toOsSpecific()]
             #print >> sys.stderr, "loaded %s, path = %s" % (fullname, mod.__path__)
 
-        exec(code, mod.__dict__)
+        self._timed(fullname, 'exec', _exec, code, mod.__dict__)
         return sys.modules[fullname]
 
+    def _timed(self, fullname, phase, func, *args):
+        """ Calls func(*args), recording the time it takes if
+        import-timing-report is set. """
+        if importTimer:
+            return importTimer.time(fullname, phase, func, *args)
+        return func(*args)
+
     def getdata(self, path):
         path = Filename(self.dir_path, Filename.fromOsSpecific(path))
         vfile = vfs.getFile(path)
@@ -268,7 +510,9 @@ class VFSLoader:
             source = self._read_source()
             filename = Filename(self.filename)
             filename.setExtension('py')
-            code = self._compile(filename, source)
+            code = _readCachedCode(filename, source)
+            if not code:
+                code = self._compile(filename, source)
 
         return code
 
@@ -310,7 +554,8 @@ class VFSLoader:
         try:
             f = open(pycFilename.toOsSpecific(), 'wb')
         except IOError:
-            pass
+            # We can't put it there; put it in the cache directory.
+            _writeCachedCode(filename, source, code)
         else:
             f.write(imp.get_magic())
             if sys.version_info >= (3, 0):
@@ -326,6 +571,119 @@ class VFSLoader:
 
         return code
 
+def _exec(code, dict):
+    exec(code, dict)
+
+def _getCachedCodePathname(filename, source):
+    """ Returns the os-specific pathname in codeCacheDir of the
+    compiled code for the indicated source file, or None if there is
+    no codeCacheDir. """
+
+    if codeCacheDir.empty():
+        return None
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    hash = hashlib.md5(imp.get_magic())
+    if not __debug__:
+        hash.update(b'O')
+    hash.update(filename.toOsSpecific().encode('utf-8') + b'\0')
+    hash.update(source)
+    return os.path.join(codeCacheDir.toOsSpecific(), hash.hexdigest() + '.pyc')
+
+def _readCachedCode(filename, source):
+    """ Returns the compiled code for the indicated source file from
+    codeCacheDir, or None if it isn't there. """
+
+    pathname = _getCachedCodePathname(filename, source)
+    if not pathname:
+        return None
+    try:
+        f = io.open(pathname, 'rb')
+        data = f.read()
+        f.close()
+    except IOError:
+        return None
+
+    magic = imp.get_magic()
+    if data[:len(magic)] != magic:
+        return None
+    try:
+        code = marshal.loads(data[len(magic):])
+    except (ValueError, EOFError, TypeError):
+        return None
+
+    # Touch the file, so it counts as recently used.
+    try:
+        os.utime(pathname, None)
+    except OSError:
+        pass
+    return code
+
+def _writeCachedCode(filename, source, code):
+    """ Stores the compiled code for the indicated source file in
+    codeCacheDir.  The file is written under a temporary name and then
+    renamed, so another process never sees half of it. """
+
+    pathname = _getCachedCodePathname(filename, source)
+    if not pathname:
+        return
+
+    data = imp.get_magic() + marshal.dumps(code)
+    tempPathname = '%s.%s.tmp' % (pathname, os.getpid())
+    try:
+        if not os.path.isdir(codeCacheDir.toOsSpecific()):
+            os.makedirs(codeCacheDir.toOsSpecific())
+        f = io.open(tempPathname, 'wb')
+        f.write(data)
+        f.close()
+        getattr(os, 'replace', os.rename)(tempPathname, pathname)
+    except (IOError, OSError):
+        # Perhaps another process got there first.
+        try:
+            os.unlink(tempPathname)
+        except OSError:
+            pass
+        return
+
+    _trimCodeCache(len(data))
+
+def _trimCodeCache(added):
+    """ Removes the least recently used files from codeCacheDir
+    until it is comfortably under codeCacheMaxSize, if the indicated
+    number of bytes just added put it over. """
+
+    global _codeCacheSize
+    dirname = codeCacheDir.toOsSpecific()
+    if _codeCacheSize is not None:
+        _codeCacheSize += added
+        if _codeCacheSize <= codeCacheMaxSize:
+            return
+
+    files = []
+    for basename in os.listdir(dirname):
+        if basename.endswith('.pyc'):
+            pathname = os.path.join(dirname, basename)
+            try:
+                st = os.stat(pathname)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, pathname))
+
+    _codeCacheSize = sum([size for mtime, size, pathname in files])
+    if _codeCacheSize <= codeCacheMaxSize:
+        return
+
+    files.sort()
+    target = codeCacheMaxSize * 3 // 4
+    for mtime, size, pathname in files:
+        if _codeCacheSize <= target:
+            break
+        try:
+            os.unlink(pathname)
+        except OSError:
+            continue
+        _codeCacheSize -= size
+
 class VFSSharedImporter:
     """ This is a special importer that is added onto the meta_path
     list, so that it is called before sys.path is traversed.  It uses
@@ -470,6 +828,68 @@ class VFSSharedLoader:
 
         return mod
 
+class VFSMapImporter:
+    """ This is another importer that is added onto the meta_path
+    list.  It finds the modules within a package that are listed in
+    importMaps without searching the package's directories, as long
+    as each directory of the package ahead of the module's own is one
+    whose contents are listed in importMaps too; otherwise, it leaves
+    the module to be searched for as usual, so that an earlier
+    directory may still override it.
+
+    Top-level modules are always left to the usual search along
+    sys.path, since the directories the runtime puts on sys.path
+    ahead of the mounted multifiles aren't mapped.  Shared packages
+    are left to the VFSSharedImporter, and a module whose multifile
+    has since been unmounted is also searched for as usual. """
+
+    def find_module(self, fullname, path = None):
+        if path is None or not importMaps or fullname in sharedPackages:
+            return None
+
+        filename = None
+        for dir in path:
+            key = _importMapKeys.get(dir)
+            if key is None:
+                key = Filename.fromOsSpecific(str(dir)).getFullpath()
+                _importMapKeys[dir] = key
+            modules = importMaps.get(key)
+            if modules is None:
+                # We don't know what's in this directory.
+                return None
+            filename = modules.get(fullname)
+            if filename is not None:
+                break
+        if filename is None:
+            return None
+        if importTimer:
+            return importTimer.time(fullname, 'find', self._find_module, fullname, filename)
+        return self._find_module(fullname, filename)
+
+    def _find_module(self, fullname, filename):
+        vfile = vfs.getFile(filename, True)
+        if not vfile:
+            return None
+
+        ext = filename.getExtension()
+        if ext == 'py':
+            desc = ('.py', 'U', imp.PY_SOURCE)
+        else:
+            desc = ('.' + ext, 'rb', imp.PY_COMPILED)
+
+        dir_path = Filename(filename.getDirname())
+        packagePath = None
+        if filename.getBasenameWoExtension() == '__init__':
+            packagePath = dir_path
+            dir_path = Filename(dir_path.getDirname())
+
+        return VFSLoader(dir_path, vfile, filename, desc=desc,
+                         packagePath=packagePath)
+
+# A cache of the key into importMaps for each directory named on a
+# search path.
+_importMapKeys = {}
+
 _registered = False
 def register():
     """ Register the VFSImporter on the path_hooks, if it has not
@@ -482,6 +902,7 @@ def register():
         _registered = True
         sys.path_hooks.insert(0, VFSImporter)
         sys.meta_path.insert(0, VFSSharedImporter())
+        sys.meta_path.insert(1, VFSMapImporter())
 
         # Blow away the importer cache, so we'll come back through the
         # VFSImporter for every folder in the future, even those
@@ -531,3 +952,71 @@ def reloadSharedPackages():
 
         reloadSharedPackage(mod)
 
+def loadImportMap(dirname):
+    """ Reads the table of modules that the packager stores in a
+    multifile, if the multifile mounted on the indicated directory has
+    one, and adds its modules to importMaps, so that they can be
+    imported from there without searching the directory.  Any table
+    loaded earlier for the same directory is replaced.  Returns true
+    if a table was found. """
+
+    dirname = Filename(dirname)
+    root = dirname.getFullpath()
+    for key in _importMapDirs.pop(root, []):
+        importMaps.pop(key, None)
+
+    vfile = vfs.getFile(Filename(dirname, importMapFilename), False)
+    if not vfile:
+        return False
+
+    data = vfile.readFile(True)
+    if not isinstance(data, str):
+        data = data.decode('utf-8')
+
+    dirs = [root]
+    importMaps[root] = {}
+    for line in data.splitlines():
+        if ' ' in line:
+            moduleName, subfileName = line.split(' ', 1)
+            filename = Filename(dirname, subfileName)
+
+            # The module is found by searching the directory that
+            # contains it, or for a package, the one containing the
+            # package directory.
+            searchDir = Filename(filename.getDirname())
+            if filename.getBasenameWoExtension() == '__init__':
+                searchDir = Filename(searchDir.getDirname())
+            key = searchDir.getFullpath()
+            modules = importMaps.get(key)
+            if modules is None:
+                modules = {}
+                importMaps[key] = modules
+                dirs.append(key)
+            modules[moduleName] = filename
+
+    _importMapDirs[root] = dirs
+    return True
+
+def markImportTiming(label):
+    """ Records that the indicated event happened now, to be listed
+    in the import-timing-report.  Does nothing if the report has not
+    been requested. """
+
+    if importTimer:
+        importTimer.mark(label)
+
+def writeImportReport(filename = None):
+    """ Writes the import timings collected so far to the indicated
+    file, or to the file named by import-timing-report.  This happens
+    automatically when the program exits. """
+
+    if importTimer:
+        importTimer.writeReport(Filename(filename or importTimingReport))
+
+importTimingReport = ConfigVariableFilename('import-timing-report', '',
+    'Set this to a filename to record the time spent importing each '
+    'Python module through the VFSImporter, and write a report to that '
+    'file when the program exits.').getValue()
+if not importTimingReport.empty():
+    importTimer = ImportTimer()
+    atexit.register(writeImportReport)
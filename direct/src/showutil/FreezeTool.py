@@ -691,6 +691,11 @@ class Freezer:
         # modules.
         self.extras = []
 
+        # This dictionary will be filled in by addToMultifile().  It
+        # maps each module added to the Multifile to the name of the
+        # subfile that contains it; see addImportMap().
+        self.multifileModules = {}
+
         # Set this to true if extension modules should be linked in to
         # the resulting executable.
         self.linkExtensionModules = False
@@ -1197,6 +1202,7 @@ class Freezer:
                 if multifile.findSubfile(filename) < 0:
                     multifile.addSubfile(filename, stream, 0)
                     multifile.flush()
+                    self.multifileModules[moduleName] = filename
             else:
                 if __debug__:
                     filename += '.pyc'
@@ -1205,6 +1211,7 @@ class Freezer:
                 if multifile.findSubfile(filename) < 0:
                     code = compile('', moduleName, 'exec')
                     self.__addPyc(multifile, filename, code, compressionLevel)
+                    self.multifileModules[moduleName] = filename
 
             moduleDirs[str] = True
             self.__addPythonDirs(multifile, moduleDirs, dirnames[:-1], compressionLevel)
@@ -1252,6 +1259,7 @@ class Freezer:
             if sourceFilename and sourceFilename.exists():
                 filename += '.py'
                 multifile.addSubfile(filename, sourceFilename, compressionLevel)
+                self.multifileModules['.'.join(dirnames)] = filename
                 return
 
         # If we can't find the source file, add the compiled pyc instead.
@@ -1286,18 +1294,37 @@ class Freezer:
                 code = compile(source, str(sourceFilename), 'exec')
 
         self.__addPyc(multifile, filename, code, compressionLevel)
+        if code:
+            self.multifileModules['.'.join(dirnames)] = filename
 
     def addToMultifile(self, multifile, compressionLevel = 0):
         """ After a call to done(), this stores all of the accumulated
         python code into the indicated Multifile.  Additional
         extension modules are listed in self.extras.  """
 
+        self.multifileModules = {}
         moduleDirs = {}
         for moduleName, mdef in self.getModuleDefs():
             if not mdef.exclude:
                 self.__addPythonFile(multifile, moduleDirs, moduleName, mdef,
                                      compressionLevel)
 
+    def addImportMap(self, multifile, filename, compressionLevel = 0):
+        """ After a call to addToMultifile(), this stores a table of
+        the modules it added into the indicated Multifile, as a text
+        subfile with the indicated name.  Each line gives a module
+        name and the name of the subfile that contains it, separated
+        by a space.  The VFSImporter can read this table to find the
+        modules without searching sys.path; see
+        VFSImporter.loadImportMap(). """
+
+        lines = ['%s %s\n' % (moduleName, subfileName)
+                 for moduleName, subfileName in sorted(self.multifileModules.items())]
+        stream = StringStream(''.join(lines).encode('utf-8'))
+        multifile.removeSubfile(filename)
+        multifile.addSubfile(filename, stream, compressionLevel)
+        multifile.flush()
+
     def writeMultifile(self, mfname):
         """ After a call to done(), this stores all of the accumulated
         python code into a Multifile with the indicated filename,
@@ -7,13 +7,15 @@ for I/O to complete. """
 __all__ = [
     'open', 'listdir', 'walk', 'join',
     'isfile', 'isdir', 'exists', 'lexists', 'getmtime', 'getsize',
-    'execfile',
+    'execfile', 'readFileMapped', 'DirEntry', 'scandir', 'walkEntries',
     ]
 
 from panda3d import core
 import sys
 import os
 import io
+import mmap
+import stat
 import encodings
 from posixpath import join
 
@@ -142,7 +144,12 @@ def open(file, mode='r', buffering=-1, encoding=None, errors=None, newline=None,
         else:
             raise ValueError("Must have exactly one of create/read/write/append mode and at most one plus")
 
-        raw = StreamIOWrapper(stream, needsVfsClose=True)
+        size = None
+        if reading and not updating:
+            # Knowing the size lets read() fetch the whole file at once.
+            size = vfile.getFileSize()
+
+        raw = StreamIOWrapper(stream, needsVfsClose=True, size=size)
         raw.mode = mode
         raw.name = vfile.getFilename().toOsSpecific()
 
@@ -176,11 +183,18 @@ class StreamIOWrapper(io.IOBase):
     """ This is a file-like object that wraps around a C++ istream and/or
     ostream object.  It only deals with binary data; to work with text I/O,
     create an io.TextIOWrapper object around this, or use the open()
-    function that is also provided with this module. """
+    function that is also provided with this module.
+
+    If the size of the stream is given, read() uses it to read all of
+    the rest of the stream in one piece.  It need not be exact. """
 
-    def __init__(self, stream, needsVfsClose=False):
+    # read() reads a stream of unknown size in chunks of this size.
+    readChunkSize = 65536
+
+    def __init__(self, stream, needsVfsClose=False, size=None):
         self.__stream = stream
         self.__needsVfsClose = needsVfsClose
+        self.__size = size
         self.__reader = None
         self.__writer = None
         self.__lastWrite = False
@@ -246,16 +260,42 @@ class StreamIOWrapper(io.IOBase):
         self.__stream.clear()  # clear eof flag
         self.__lastWrite = False
         if size is not None and size >= 0:
-            result = self.__reader.extractBytes(size)
-        else:
-            # Read to end-of-file.
-            result = b''
-            while not self.__stream.eof():
-                result += self.__reader.extractBytes(512)
-        return result
+            return self.__reader.extractBytes(size)
+
+        # Read to end-of-file.  If we know how much is left, this
+        # gets it all in the first chunk.
+        chunkSize = self.readChunkSize
+        if self.__size is not None:
+            pos = self.__stream.tellg()
+            if pos >= 0 and self.__size > pos:
+                chunkSize = self.__size - pos
+
+        chunks = []
+        while not self.__stream.eof():
+            chunk = self.__reader.extractBytes(chunkSize)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            chunkSize = self.readChunkSize
+        return b''.join(chunks)
 
     read1 = read
 
+    def readall(self):
+        return self.read(-1)
+
+    def readinto(self, b):
+        """ Reads up to len(b) bytes into b, which may be a bytearray,
+        a memoryview, or any other writable buffer, and returns the
+        number of bytes read. """
+
+        view = memoryview(b)
+        if sys.version_info >= (3, 0) and (view.ndim != 1 or view.itemsize != 1):
+            view = view.cast('B')
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
     def readline(self, size=-1):
         if not self.__reader:
             if not self.__writer:
@@ -328,30 +368,232 @@ def listdir(path):
 def walk(top, topdown = True, onerror = None, followlinks = True):
     """ Implements os.walk over vfs.
 
-    Note: we don't support onerror or followlinks; errors are ignored
-    and links are always followed. """
+    Note: we don't support followlinks; links are always followed.
+    Unlike os.walk, if onerror is None, a directory that can't be read
+    (including top itself) is still yielded, as empty. """
+
+    for dirpath, dirEntries, fileEntries in _walkEntries(top, topdown, onerror, 0, onerror is None):
+        dirnames = [entry.name for entry in dirEntries]
+        filenames = [entry.name for entry in fileEntries]
+        yield (dirpath, dirnames, filenames)
+
+        if topdown:
+            # The caller may have removed some of the dirnames, to
+            # avoid visiting them.
+            entries = dict([(entry.name, entry) for entry in dirEntries])
+            dirEntries[:] = [entries[name] for name in dirnames if name in entries]
+
+class DirEntry:
+    """ This describes one file or directory found by scandir() or
+    walkEntries().  Like os.DirEntry, it has name and path attributes,
+    and is_dir(), is_file() and stat() methods; the file's size and
+    modification time are also stored directly, as size and mtime.
+    All of these were read along with the directory, so none of them
+    go back to the disk. """
+
+    __slots__ = ('name', 'path', 'isDirectory', 'size', 'mtime', 'physicalPath')
+
+    def __init__(self, name, path, isDirectory, size, mtime, physicalPath = None):
+        self.name = name
+        self.path = path
+        self.isDirectory = isDirectory
+        self.size = size
+        self.mtime = mtime
+
+        # For a directory that is simply a directory on disk, this is
+        # its os-specific name there.
+        self.physicalPath = physicalPath
 
-    dirnames = []
-    filenames = []
+    def __repr__(self):
+        return '<DirEntry %r>' % (self.name)
+
+    def __fspath__(self):
+        return self.path
+
+    def is_dir(self, follow_symlinks = True):
+        return self.isDirectory
+
+    def is_file(self, follow_symlinks = True):
+        return not self.isDirectory
 
-    dirlist = _vfs.scanDirectory(top)
-    if dirlist:
-        for file in dirlist:
-            if file.isDirectory():
-                dirnames.append(file.getFilename().getBasename())
+    def is_symlink(self):
+        return False
+
+    def stat(self, follow_symlinks = True):
+        if self.isDirectory:
+            mode = stat.S_IFDIR | 0o755
+        else:
+            mode = stat.S_IFREG | 0o644
+        return os.stat_result((mode, 0, 0, 0, 0, 0, self.size,
+                               self.mtime, self.mtime, self.mtime))
+
+def scandir(path = '.'):
+    """ Implements os.scandir over vfs.  Returns a list of DirEntry
+    objects, sorted by name. """
+
+    mountDirs = _getMountDirs()
+    dirs, files = _scanDirectory(path, mountDirs, _getPhysicalDirectory(path, mountDirs))
+    return sorted(dirs + files, key = lambda entry: entry.name)
+
+def walkEntries(top, topdown = True, onerror = None, numThreads = 0):
+    """ This is like walk(), but it yields (dirpath, dirEntries,
+    fileEntries), where the lists contain a DirEntry for each
+    subdirectory and file, so that their sizes and modification times
+    are available without asking for them again.  It works through
+    the tree iteratively, so that there is no limit on its depth.  As
+    with walk(), when topdown is true, the caller may remove entries
+    from dirEntries to avoid visiting those directories.
+
+    A directory that is simply a directory on disk, with nothing
+    mounted within it, is read directly, rather than through the vfs.
+    If numThreads is more than 1, such directories are read by a pool
+    of that many threads, ahead of the caller. """
+
+    return _walkEntries(top, topdown, onerror, numThreads, False)
+
+def _walkEntries(top, topdown, onerror, numThreads, emptyOnError):
+    # This implements walkEntries().  If emptyOnError is true, a
+    # directory that can't be read is yielded with no entries, rather
+    # than skipped.
+    mountDirs = _getMountDirs()
+    pool = None
+    if numThreads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(numThreads)
+
+    def startScan(path, physicalPath):
+        # Returns a function that returns the contents of the
+        # directory, which a thread may be reading meanwhile.
+        if pool and physicalPath:
+            return pool.apply_async(_scanPhysicalDirectory,
+                                    (path, physicalPath, mountDirs)).get
+        return lambda: _scanDirectory(path, mountDirs, physicalPath)
+
+    try:
+        # Each entry on the stack is a directory still to be read, or,
+        # when walking bottom-up, one to be yielded after its
+        # subdirectories.
+        stack = [(top, startScan(top, _getPhysicalDirectory(top, mountDirs)))]
+        while stack:
+            path, scan = stack.pop()
+            if scan is None:
+                yield path
+                continue
+
+            try:
+                dirEntries, fileEntries = scan()
+            except OSError as err:
+                if onerror is not None:
+                    onerror(err)
+                if not emptyOnError:
+                    continue
+                dirEntries, fileEntries = [], []
+
+            if topdown:
+                yield (path, dirEntries, fileEntries)
             else:
-                filenames.append(file.getFilename().getBasename())
+                stack.append(((path, dirEntries, fileEntries), None))
+
+            for entry in reversed(dirEntries):
+                stack.append((entry.path, startScan(entry.path, entry.physicalPath)))
+    finally:
+        if pool:
+            pool.terminate()
+
+def _getMountDirs():
+    """ Returns the set of vfs directories at or above which something
+    is mounted (other than at the root).  These can't be read directly
+    from disk, even if they are there. """
+
+    mountDirs = set()
+    for mount in _vfs.getMounts():
+        mountPoint = mount.getMountPoint().getFullpath()
+        if mountPoint:
+            components = mountPoint.split('/')
+            for i in range(len(components) + 1):
+                mountDirs.add('/' + '/'.join(components[:i]))
+    return mountDirs
+
+def _getVfsPath(path):
+    filename = core.Filename.fromOsSpecific(path)
+    filename.makeAbsolute(_vfs.getCwd())
+    return filename.getFullpath()
+
+def _getPhysicalDirectory(path, mountDirs, vfile = None):
+    """ Returns the os-specific name on disk of the indicated vfs
+    directory, if it is simply a directory on disk, with nothing else
+    mounted within it; otherwise, returns None. """
+
+    if _getVfsPath(path) in mountDirs:
+        return None
+    if vfile is None:
+        vfile = _vfs.getFile(core.Filename.fromOsSpecific(path), True)
+    if not hasattr(vfile, 'getMount') or not vfile.isDirectory():
+        return None
+    mount = vfile.getMount()
+    if not isinstance(mount, core.VirtualFileMountSystem):
+        return None
+    return core.Filename(mount.getPhysicalFilename(), _getLocalName(vfile)).toOsSpecific()
+
+def _scanDirectory(path, mountDirs, physicalPath = None):
+    """ Returns (dirEntries, fileEntries) for the indicated
+    directory, or raises OSError if there is no such directory. """
+
+    if physicalPath:
+        return _scanPhysicalDirectory(path, physicalPath, mountDirs)
+
+    dirlist = _vfs.scanDirectory(core.Filename.fromOsSpecific(path))
+    if dirlist is None:
+        raise OSError("No such file or directory: '%s'" % (path))
 
-    if topdown:
-        yield (top, dirnames, filenames)
+    dirEntries = []
+    fileEntries = []
+    for vfile in dirlist:
+        name = vfile.getFilename().getBasename()
+        childPath = join(path, name)
+        if vfile.isDirectory():
+            dirEntries.append(DirEntry(name, childPath, True, 0, vfile.getTimestamp(),
+                                       _getPhysicalDirectory(childPath, mountDirs, vfile)))
+        else:
+            fileEntries.append(DirEntry(name, childPath, False, vfile.getFileSize(),
+                                        vfile.getTimestamp()))
+    return dirEntries, fileEntries
 
-    for dir in dirnames:
-        next = join(top, dir)
-        for tuple in walk(next, topdown = topdown):
-            yield tuple
+def _scanPhysicalDirectory(path, physicalPath, mountDirs):
+    """ Returns (dirEntries, fileEntries) for the indicated
+    directory, which is the directory physicalPath on disk.  This only
+    uses the os module, so it may run on another thread. """
 
-    if not topdown:
-        yield (top, dirnames, filenames)
+    if hasattr(os, 'scandir'):
+        children = [(entry.name, entry.path) for entry in os.scandir(physicalPath)]
+    else:
+        children = [(name, os.path.join(physicalPath, name)) for name in os.listdir(physicalPath)]
+    children.sort()
+
+    vfsPath = None
+    dirEntries = []
+    fileEntries = []
+    for name, childPhysicalPath in children:
+        try:
+            st = os.stat(childPhysicalPath)
+        except OSError:
+            # Perhaps a broken link.
+            continue
+
+        childPath = join(path, name)
+        if stat.S_ISDIR(st.st_mode):
+            # It may have something mounted within it.
+            if mountDirs:
+                if vfsPath is None:
+                    vfsPath = _getVfsPath(path).rstrip('/')
+                if vfsPath + '/' + name in mountDirs:
+                    childPhysicalPath = None
+            dirEntries.append(DirEntry(name, childPath, True, 0, int(st.st_mtime),
+                                       childPhysicalPath))
+        else:
+            fileEntries.append(DirEntry(name, childPath, False, st.st_size,
+                                        int(st.st_mtime)))
+    return dirEntries, fileEntries
 
 def isfile(path):
     return _vfs.isRegularFile(core.Filename.fromOsSpecific(path))
@@ -377,6 +619,105 @@ def getsize(path):
         raise os.error
     return file.getFileSize()
 
+def readFileMapped(path):
+    """ Returns the binary contents of the indicated file as a
+    read-only buffer (a memoryview, or a buffer in Python 2).  If the
+    file is a real file on disk, or an uncompressed and unencrypted
+    subfile of a Multifile that is itself stored in such a file, the
+    buffer refers directly to the file, mapped into memory: the data is
+    not copied, and is read from disk only as it is used.  Otherwise,
+    the file is simply read into memory. """
+
+    if isinstance(path, core.VirtualFile):
+        vfile = path
+    else:
+        if isinstance(path, unicodeType):
+            filename = core.Filename.fromOsSpecificW(path)
+        elif isinstance(path, strType):
+            filename = core.Filename.fromOsSpecific(path)
+        else:
+            filename = core.Filename(path)
+        filename.setBinary()
+        vfile = _vfs.getFile(filename)
+        if not vfile:
+            raise IOError("No such file or directory: '%s'" % (filename))
+
+    if vfile.isDirectory():
+        raise IOError("Is a directory: '%s'" % (vfile.getFilename()))
+
+    location = _getFileLocation(vfile)
+    if location and location[2] > 0:
+        pathname, start, length = location
+
+        # The mapping must begin on a multiple of the allocation
+        # granularity.
+        offset = start % mmap.ALLOCATIONGRANULARITY
+        f = io.open(pathname, 'rb')
+        try:
+            mapping = mmap.mmap(f.fileno(), offset + length,
+                                access = mmap.ACCESS_READ,
+                                offset = start - offset)
+        finally:
+            f.close()
+    else:
+        mapping = vfile.readFile(True)
+        offset = 0
+        length = len(mapping)
+
+    if sys.version_info >= (3, 0):
+        return memoryview(mapping)[offset : offset + length]
+    else:
+        return buffer(mapping, offset, length)
+
+def _getFileLocation(vfile):
+    """ Returns (pathname, start, length), giving the range of bytes
+    of a real file on disk that holds the contents of the indicated
+    VirtualFile, or None if its contents aren't stored as-is in any
+    real file. """
+
+    if not hasattr(vfile, 'getMount'):
+        return None
+    mount = vfile.getMount()
+    localName = _getLocalName(vfile)
+
+    if isinstance(mount, core.VirtualFileMountSystem):
+        pathname = core.Filename(mount.getPhysicalFilename(), localName)
+        return (pathname.toOsSpecific(), 0, vfile.getFileSize())
+
+    if isinstance(mount, core.VirtualFileMountMultifile):
+        mf = mount.getMultifile()
+        if mf.isWriteValid() or mf.getMultifileName().empty():
+            return None
+        if not hasattr(mf, 'getOffset'):
+            # Without this, we can't tell where the Multifile begins
+            # within its file.
+            return None
+        index = mf.findSubfile(localName)
+        if index < 0 or mf.isSubfileCompressed(index) or \
+           mf.isSubfileEncrypted(index):
+            return None
+
+        # The Multifile may itself be a subfile of another Multifile.
+        mfFile = _vfs.getFile(mf.getMultifileName())
+        location = mfFile and _getFileLocation(mfFile)
+        if not location:
+            return None
+        start = mf.getOffset() + mf.getSubfileInternalStart(index)
+        return (location[0], location[1] + start,
+                mf.getSubfileInternalLength(index))
+
+    return None
+
+def _getLocalName(vfile):
+    """ Returns the name of the indicated VirtualFile within its
+    mount. """
+
+    localName = vfile.getFilename().getFullpath().lstrip('/')
+    mountPoint = vfile.getMount().getMountPoint().getFullpath()
+    if mountPoint:
+        localName = localName[len(mountPoint) + 1:]
+    return localName
+
 def execfile(path, globals=None, locals=None):
     file = _vfs.getFile(core.Filename.fromOsSpecific(path), True)
     if not file:
@@ -2,7 +2,7 @@
 AsyncTaskManager interface.  It replaces the old full-Python
 implementation of the Task system. """
 
-__all__ = ['Task', 'TaskManager',
+__all__ = ['Task', 'TaskManager', 'TimerWheel', 'TaskTimingRecorder',
            'cont', 'done', 'again', 'pickup', 'exit',
            'sequence', 'loop', 'pause']
 
@@ -99,6 +99,409 @@ def loop(*taskList):
     return seq
 Task.DtoolClassDict['loop'] = staticmethod(loop)
 
+class TimerWheelEntry:
+    """ A single pending callback in a TimerWheel, as returned by
+    TaskManager.addTimer().  Pass it to TaskManager.removeTimer() to
+    cancel it. """
+
+    __slots__ = ('name', 'tick', 'callback', 'extraArgs', 'slot')
+
+    def __init__(self, name, tick, callback, extraArgs):
+        self.name = name
+        self.tick = tick
+        self.callback = callback
+        self.extraArgs = extraArgs
+        # The dictionary this entry is currently stored in, or None
+        # once it has fired or been cancelled.
+        self.slot = None
+
+    def isPending(self):
+        return self.slot is not None
+
+    def __repr__(self):
+        return 'TimerWheelEntry(%s, tick %s)' % (self.name, self.tick)
+
+class TimerWheel:
+    """ A hierarchical timer wheel, for keeping very large numbers of
+    pending timeouts without creating a Task for each one.  Time is
+    divided into ticks of a fixed resolution; each level of the wheel
+    has numSlots slots, each covering numSlots times as many ticks as
+    a slot on the level below.  Entries are stored in the slot for
+    their expiry tick, and are moved down a level each time the wheel
+    turns past their slot, so that inserting and cancelling an entry
+    are both O(1).
+
+    Normally you don't create one of these directly; use
+    TaskManager.addTimer() instead, which services a single wheel from
+    one task each frame. """
+
+    def __init__(self, resolution, startTime = 0.0, slotBits = 8, numLevels = 4):
+        self.resolution = resolution
+        self.startTime = startTime
+        self.__slotBits = slotBits
+        self.__slotMask = (1 << slotBits) - 1
+        self.__numLevels = numLevels
+        self.__maxDelta = (1 << (slotBits * numLevels)) - 1
+        self.__levels = [[{} for i in range(1 << slotBits)]
+                         for level in range(numLevels)]
+        # The last tick that has been fully processed.
+        self.__currentTick = 0
+        # name->{entry: None}, for removing timers by name.
+        self.__entriesByName = {}
+        self.__numEntries = 0
+
+    def getNumEntries(self):
+        return self.__numEntries
+
+    def getCurrentTick(self):
+        return self.__currentTick
+
+    def timeToTick(self, time):
+        """ Returns the tick number in which the indicated time
+        falls. """
+        return int((time - self.startTime) / self.resolution)
+
+    def add(self, time, callback, name, extraArgs = [], now = None):
+        """ Schedules callback(*extraArgs) to be called by advance()
+        once the indicated time has been reached, and returns the new
+        TimerWheelEntry.  If the current time is given as now, and the
+        wheel is empty, it is first skipped ahead to that time, so that
+        the next advance() need not walk through all of the ticks that
+        have passed while it was idle. """
+        if now is not None and self.__numEntries == 0:
+            self.__currentTick = max(self.__currentTick, self.timeToTick(now))
+
+        # Round up, so the callback is never called early.
+        tick = -int(-(time - self.startTime) // self.resolution)
+        entry = TimerWheelEntry(name, tick, callback, extraArgs)
+        self.__insert(entry, self.__currentTick + 1)
+        self.__entriesByName.setdefault(name, {})[entry] = None
+        self.__numEntries += 1
+        return entry
+
+    def remove(self, entry):
+        """ Cancels a pending entry.  Returns true if it was removed,
+        or false if it had already fired or been cancelled. """
+        if entry.slot is None:
+            return False
+        del entry.slot[entry]
+        entry.slot = None
+        self.__forget(entry)
+        return True
+
+    def removeNamed(self, name):
+        """ Cancels all pending entries with the indicated name.
+        Returns the number of entries removed. """
+        entries = self.__entriesByName.get(name)
+        if not entries:
+            return 0
+        count = 0
+        for entry in list(entries.keys()):
+            count += self.remove(entry)
+        return count
+
+    def removeWithPrefix(self, prefix):
+        """ Cancels all pending entries whose name begins with the
+        indicated prefix.  Returns the number of entries removed. """
+        count = 0
+        for name in [name for name in self.__entriesByName
+                     if name.startswith(prefix)]:
+            count += self.removeNamed(name)
+        return count
+
+    def hasNamed(self, name):
+        return name in self.__entriesByName
+
+    def clear(self):
+        for level in self.__levels:
+            for slot in level:
+                for entry in slot:
+                    entry.slot = None
+                slot.clear()
+        self.__entriesByName.clear()
+        self.__numEntries = 0
+
+    def advance(self, time):
+        """ Turns the wheel forward to the indicated time, calling
+        the callback of every entry that has come due, in order of
+        expiry tick.  Returns the number of callbacks called. """
+        targetTick = self.timeToTick(time)
+        if self.__numEntries == 0:
+            # Nothing to do; skip straight ahead.
+            self.__currentTick = max(self.__currentTick, targetTick)
+            return 0
+
+        slotMask = self.__slotMask
+        level0 = self.__levels[0]
+        count = 0
+        while self.__currentTick < targetTick and self.__numEntries:
+            tick = self.__currentTick + 1
+            self.__currentTick = tick
+            if tick & slotMask == 0:
+                self.__cascade(tick)
+
+            slot = level0[tick & slotMask]
+            if not slot:
+                continue
+            for entry in list(slot.keys()):
+                # An earlier callback may have cancelled this one.
+                if entry.slot is not slot:
+                    continue
+                del slot[entry]
+                entry.slot = None
+                self.__forget(entry)
+                entry.callback(*entry.extraArgs)
+                count += 1
+
+        if not self.__numEntries:
+            self.__currentTick = max(self.__currentTick, targetTick)
+        return count
+
+    def __cascade(self, tick):
+        # The wheel has just turned past a boundary of one or more of
+        # the upper levels; redistribute the entries of each upper
+        # slot that is now current onto the levels below, starting
+        # from the highest.
+        slotBits = self.__slotBits
+        slotMask = self.__slotMask
+        level = 1
+        while level < self.__numLevels - 1 and \
+              (tick >> (slotBits * level)) & slotMask == 0:
+            level += 1
+        while level >= 1:
+            slot = self.__levels[level][(tick >> (slotBits * level)) & slotMask]
+            if slot:
+                entries = list(slot.keys())
+                slot.clear()
+                for entry in entries:
+                    self.__insert(entry, tick)
+            level -= 1
+
+    def __insert(self, entry, minTick):
+        # Stores the entry in the appropriate slot for its expiry
+        # tick, relative to the current tick.  It is not allowed to
+        # fire before minTick.
+        tick = max(entry.tick, minTick)
+        delta = tick - self.__currentTick
+        if delta > self.__maxDelta:
+            # Too far in the future; park it in the farthest slot,
+            # and it will be moved again when that slot comes around.
+            tick = self.__currentTick + self.__maxDelta
+            delta = self.__maxDelta
+        level = 0
+        while delta >> (self.__slotBits * (level + 1)):
+            level += 1
+        slot = self.__levels[level][(tick >> (self.__slotBits * level)) & self.__slotMask]
+        slot[entry] = None
+        entry.slot = slot
+
+    def __forget(self, entry):
+        # Removes a fired or cancelled entry from the name index.
+        self.__numEntries -= 1
+        entries = self.__entriesByName[entry.name]
+        del entries[entry]
+        if not entries:
+            del self.__entriesByName[entry.name]
+
+class TaskTimingRecorder:
+    """ Keeps a rolling record of how much wall time each task, and
+    each task chain, spent in each of the last numFrames frames.
+
+    This does no timing of its own; the C++ task manager already
+    measures every run of every task (see AsyncTask.getTotalDt()), and
+    sample() simply collects those numbers once at the end of each
+    frame, by comparing each active task's total against the total it
+    had at the previous sample.  A task that has left the active list
+    since the previous sample, because it went to sleep or finished,
+    is compared once more, so that its final runs are counted too;
+    tasks added through the TaskManager are also looked at once after
+    they are added, in case they finish within their first frame.
+    Sleeping tasks are otherwise not looked at, so the cost of each
+    sample depends only on the number of active tasks.  The samples
+    are kept in fixed-size ring buffers, and the report can be
+    generated at any point with getReport(). """
+
+    def __init__(self, numFrames = 300, frameBudget = 1.0 / 60.0):
+        self.numFrames = numFrames
+        self.frameBudget = frameBudget
+        self.__frame = 0
+        # name->[samples, nextIndex, lastFrame] for each task name,
+        # task chain name, and the frame as a whole.
+        self.__tasks = {}
+        self.__chains = {}
+        self.__frameTimes = [[], 0, 0]
+        # Each of these maps taskId->(task, totalDt, name, chainName):
+        # the tasks that were active at the last sample, the tasks
+        # added since then, and the tasks that were active once but
+        # were asleep at a later sample.
+        self.__activeTasks = {}
+        self.__newTasks = {}
+        self.__sleepingTasks = {}
+
+    def reset(self):
+        self.__tasks.clear()
+        self.__chains.clear()
+        self.__frameTimes = [[], 0, 0]
+
+    def addTask(self, task):
+        """ Informs the recorder of a task that has just been added
+        to the task manager, so that its time is recorded even if it
+        finishes in the same frame. """
+        self.__newTasks[task.getTaskId()] = (
+            task, task.getTotalDt(), task.getName(), task.getTaskChain())
+
+    def sample(self, mgr, frameTime):
+        """ Records the time spent since the last call by each of the
+        tasks on the indicated AsyncTaskManager, and the total time of
+        this frame.  This should be called once at the end of each
+        frame. """
+        self.__frame += 1
+        frame = self.__frame
+
+        # Several tasks may share a name; they're counted together.
+        taskTotals = {}
+        chainTotals = {}
+
+        lastActive = self.__activeTasks
+        newTasks = self.__newTasks
+        sleeping = self.__sleepingTasks
+        self.__newTasks = {}
+        active = {}
+
+        tasks = mgr.getActiveTasks()
+        for i in range(tasks.getNumTasks()):
+            task = tasks.getTask(i)
+            taskId = task.getTaskId()
+            total = task.getTotalDt()
+            last = lastActive.pop(taskId, None) or newTasks.pop(taskId, None) or \
+                   sleeping.pop(taskId, None)
+            if last is None:
+                name = task.getName()
+                chainName = task.getTaskChain()
+            else:
+                lastTotal, name, chainName = last[1:]
+                if total > lastTotal:
+                    dt = total - lastTotal
+                    taskTotals[name] = taskTotals.get(name, 0.0) + dt
+                    chainTotals[chainName] = chainTotals.get(chainName, 0.0) + dt
+            active[taskId] = (task, total, name, chainName)
+
+        # Whatever is left has gone to sleep or finished since the
+        # last sample, or was added asleep; count its final runs.
+        for taskDict in (lastActive, newTasks):
+            for taskId, (task, lastTotal, name, chainName) in taskDict.items():
+                total = task.getTotalDt()
+                if total > lastTotal:
+                    dt = total - lastTotal
+                    taskTotals[name] = taskTotals.get(name, 0.0) + dt
+                    chainTotals[chainName] = chainTotals.get(chainName, 0.0) + dt
+                if task.isAlive():
+                    sleeping[taskId] = (task, total, name, chainName)
+        self.__activeTasks = active
+
+        if frame % self.numFrames == 0:
+            # Now and then, forget the sleeping tasks that have since
+            # been removed.
+            for taskId in [taskId for taskId, record in sleeping.items()
+                           if not record[0].isAlive()]:
+                del sleeping[taskId]
+
+        for name, dt in taskTotals.items():
+            self.__addSample(self.__tasks, name, dt, frame)
+        for chainName, dt in chainTotals.items():
+            self.__addSample(self.__chains, chainName, dt, frame)
+        self.__addSample(None, None, frameTime, frame)
+
+    def __addSample(self, table, name, dt, frame):
+        if table is None:
+            record = self.__frameTimes
+        else:
+            record = table.get(name)
+            if record is None:
+                record = [[], 0, frame]
+                table[name] = record
+        samples = record[0]
+        if len(samples) < self.numFrames:
+            samples.append(dt)
+        else:
+            samples[record[1]] = dt
+            record[1] = (record[1] + 1) % self.numFrames
+        record[2] = frame
+
+    def __prune(self, table):
+        # Forget about tasks that haven't run in the last numFrames
+        # frames.
+        oldest = self.__frame - self.numFrames
+        for name in [name for name, record in table.items()
+                     if record[2] <= oldest]:
+            del table[name]
+
+    def __getStats(self, samples, percentiles):
+        ordered = sorted(samples)
+        n = len(ordered)
+        stats = [n, sum(ordered) / n]
+        for p in percentiles:
+            stats.append(ordered[min(n - 1, int(n * p / 100.0))])
+        stats.append(ordered[-1])
+        return stats
+
+    def getTimings(self, percentiles = (50, 90, 99)):
+        """ Returns a dictionary mapping each recently-run task name
+        to a list of [numSamples, mean, percentile..., max], in
+        seconds. """
+        self.__prune(self.__tasks)
+        timings = {}
+        for name, record in self.__tasks.items():
+            timings[name] = self.__getStats(record[0], percentiles)
+        return timings
+
+    def getChainTimings(self, percentiles = (50, 90, 99)):
+        """ As getTimings(), but for the total of each task chain. """
+        self.__prune(self.__chains)
+        timings = {}
+        for name, record in self.__chains.items():
+            timings[name] = self.__getStats(record[0], percentiles)
+        return timings
+
+    def getReport(self, percentiles = (50, 90, 99), maxTasks = None):
+        """ Returns a human-readable table of the task timings, with
+        the most expensive tasks (by highest percentile) first. """
+        frameSamples = self.__frameTimes[0]
+        if not frameSamples:
+            return 'No task timings recorded.'
+
+        header = '%-40s %6s %8s' % ('name', 'frames', 'mean') + \
+                 ''.join([' %8s' % ('p%s' % (p)) for p in percentiles]) + \
+                 ' %8s' % ('max')
+
+        def formatRow(name, stats):
+            return '%-40s %6s' % (name[:40], stats[0]) + \
+                   ''.join([' %8.2f' % (t * 1000.0) for t in stats[1:]])
+
+        frameStats = self.__getStats(frameSamples, percentiles)
+        overBudget = len([t for t in frameSamples if t > self.frameBudget])
+        lines = ['Task timings in ms over the last %s frames; '
+                 '%s frames over the %.1f ms budget.' % (
+            len(frameSamples), overBudget, self.frameBudget * 1000.0),
+                 header,
+                 formatRow('(frame)', frameStats)]
+
+        lines.append('-- task chains --')
+        chainTimings = sorted(self.getChainTimings(percentiles).items(),
+                              key = lambda item: -item[1][-2])
+        for name, stats in chainTimings:
+            lines.append(formatRow(name, stats))
+
+        lines.append('-- tasks --')
+        taskTimings = sorted(self.getTimings(percentiles).items(),
+                             key = lambda item: -item[1][-2])
+        if maxTasks is not None:
+            taskTimings = taskTimings[:maxTasks]
+        for name, stats in taskTimings:
+            lines.append(formatRow(name, stats))
+
+        return '\n'.join(lines)
+
 class TaskManager:
     notify = directNotify.newCategory("TaskManager")
 
@@ -129,6 +532,13 @@ class TaskManager:
             session = None,
             )
 
+        # This is created when the first timer is added; see addTimer().
+        self._timerWheel = None
+        self._timerWheelTask = None
+
+        self._taskTimer = None
+        self.setTaskTiming(ConfigVariableBool('task-timing', False).getValue())
+
     def finalInit(self):
         # This function should be called once during startup, after
         # most things are imported.
@@ -144,6 +554,8 @@ class TaskManager:
         self.notify.info("TaskManager.destroy()")
         self.destroyed = True
         self._frameProfileQueue.clear()
+        if self._timerWheel:
+            self._timerWheel.clear()
         self.mgr.cleanup()
 
     def setClock(self, clockObject):
@@ -239,6 +651,11 @@ class TaskManager:
         See AsyncTaskManager.setTimeslicePriority() for more.
         """
 
+        if numThreads:
+            # Tasks on this chain may now send and accept events from
+            # other threads, so the messenger must lock properly.
+            messenger.setSingleThreaded(False)
+
         chain = self.mgr.makeTaskChain(chainName)
         if numThreads is not None:
             chain.setNumThreads(numThreads)
@@ -312,10 +729,78 @@ class TaskManager:
         task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath)
         task.setDelay(delayTime)
         self.mgr.add(task)
+        if self._taskTimer:
+            self._taskTimer.addTask(task)
         return task
 
     do_method_later = doMethodLater
 
+    def addTimer(self, delayTime, callback, name, extraArgs = []):
+        """Arranges for callback(*extraArgs) to be called once, after
+        at least delayTime seconds have elapsed.  This is a
+        lightweight alternative to doMethodLater() for code that keeps
+        very many pending timeouts: no Task object is created, and all
+        of the timers that come due are fired together from a single
+        task each frame.  Adding and removing a timer are O(1).
+
+        The timers have a granularity set by the config variable
+        timer-wheel-resolution, in seconds, and they are always called
+        from the default task chain.
+
+        Returns a TimerWheelEntry, which may be passed to
+        removeTimer().
+        """
+
+        if delayTime < 0:
+            assert self.notify.warning('addTimer: added timer: %s with negative delay: %s' % (name, delayTime))
+
+        if self._timerWheel is None:
+            resolution = ConfigVariableDouble('timer-wheel-resolution', 0.01).getValue()
+            self._timerWheel = TimerWheel(resolution, self.globalClock.getFrameTime())
+
+        now = self.globalClock.getFrameTime()
+        entry = self._timerWheel.add(now + delayTime, callback, name,
+                                     extraArgs, now = now)
+
+        if self._timerWheelTask is None or not self._timerWheelTask.isAlive():
+            self._timerWheelTask = self.add(self.__serviceTimerWheel,
+                                            'TaskManager-timerWheel')
+        return entry
+
+    def removeTimer(self, entryOrName):
+        """Cancels a timer previously added with addTimer().  You may
+        specify either the TimerWheelEntry, or the name of the timer,
+        in which case all timers with that name are removed.  Returns
+        the number of timers removed. """
+        if self._timerWheel is None:
+            return 0
+        if isinstance(entryOrName, TimerWheelEntry):
+            return int(self._timerWheel.remove(entryOrName))
+        return self._timerWheel.removeNamed(entryOrName)
+
+    def removeTimersWithPrefix(self, prefix):
+        """Cancels all timers whose names begin with the indicated
+        prefix.  Returns the number of timers removed. """
+        if self._timerWheel is None:
+            return 0
+        return self._timerWheel.removeWithPrefix(prefix)
+
+    def hasTimerNamed(self, name):
+        return bool(self._timerWheel and self._timerWheel.hasNamed(name))
+
+    def getNumTimers(self):
+        if self._timerWheel is None:
+            return 0
+        return self._timerWheel.getNumEntries()
+
+    def __serviceTimerWheel(self, task):
+        self._timerWheel.advance(self.globalClock.getFrameTime())
+        if not self._timerWheel.getNumEntries():
+            # Stop running until the next timer is added.
+            self._timerWheelTask = None
+            return task.done
+        return task.cont
+
     def add(self, funcOrTask, name = None, sort = None, extraArgs = None,
             priority = None, uponDeath = None, appendTask = False,
             taskChain = None, owner = None):
@@ -375,6 +860,8 @@ class TaskManager:
 
         task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath)
         self.mgr.add(task)
+        if self._taskTimer:
+            self._taskTimer.addTask(task)
         return task
 
     def __setupTask(self, funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath):
@@ -467,6 +954,9 @@ class TaskManager:
 
         self.mgr.poll()
 
+        if self._taskTimer:
+            self._taskTimer.sample(self.mgr, self.globalClock.getRealTime() - startFrameTime)
+
         # This is the spot for an internal yield function
         nextTaskTime = self.mgr.getNextWakeTime()
         self.doYield(startFrameTime, nextTaskTime)
@@ -650,6 +1140,53 @@ class TaskManager:
         if self._taskProfiler:
             self._taskProfiler.flush(name)
 
+    def setTaskTiming(self, taskTiming):
+        """Enables or disables the recording of per-task run times.
+        When enabled, the time spent in each task and each task chain
+        is recorded every frame over a rolling window of recent
+        frames, with low enough overhead to leave it on all the time;
+        see getTaskTimingReport().  It may also be enabled with the
+        config variable task-timing.  The window size and the frame
+        budget are controlled by task-timing-frames and
+        task-timing-budget; if task-timing-report-interval is set,
+        the report is also written to the log every that many
+        seconds. """
+        if taskTiming and not self._taskTimer:
+            self._taskTimer = TaskTimingRecorder(
+                ConfigVariableInt('task-timing-frames', 300).getValue(),
+                ConfigVariableDouble('task-timing-budget', 1.0 / 60.0).getValue())
+            interval = ConfigVariableDouble('task-timing-report-interval', 0.0).getValue()
+            if interval > 0:
+                self.doMethodLater(interval, self.__logTaskTimingReport,
+                                   'TaskManager-taskTimingReport')
+        elif not taskTiming and self._taskTimer:
+            self._taskTimer = None
+            self.remove('TaskManager-taskTimingReport')
+
+    def getTaskTiming(self):
+        return self._taskTimer is not None
+
+    def getTaskTimingReport(self, percentiles = (50, 90, 99), maxTasks = None):
+        """Returns a table of the time, in milliseconds, spent by
+        each task and task chain over the recent frames, with the
+        indicated percentiles; see setTaskTiming(). """
+        if not self._taskTimer:
+            return 'Task timing is not enabled.'
+        return self._taskTimer.getReport(percentiles, maxTasks)
+
+    def getTaskTimings(self, percentiles = (50, 90, 99)):
+        """Returns the same information as getTaskTimingReport(), as
+        a dictionary of task name to [numSamples, mean, percentile...,
+        max], in seconds. """
+        if not self._taskTimer:
+            return {}
+        return self._taskTimer.getTimings(percentiles)
+
+    def __logTaskTimingReport(self, task):
+        if self._taskTimer:
+            self.notify.info('\n' + self._taskTimer.getReport())
+        return task.again
+
     def _setProfileTask(self, task):
         if self._taskProfileInfo.session:
             self._taskProfileInfo.session.release()
@@ -6360,6 +6360,7 @@ if not PkgSkip("DIRECT") and not PkgSkip("DEPLOYTOOLS") and not RUNTIME and not
     TargetAdd('pmerge.p3d', opts=OPTS, input='panda3d.pdef')
     TargetAdd('ppackage.p3d', opts=OPTS, input='panda3d.pdef')
     TargetAdd('ppatcher.p3d', opts=OPTS, input='panda3d.pdef')
+    TargetAdd('pchunk.p3d', opts=OPTS, input='panda3d.pdef')
 
 ##########################################################################################
 #
@@ -95,6 +95,7 @@ PUBLISHED:
   INLINE double get_dt() const;
   INLINE double get_max_dt() const;
   INLINE double get_average_dt() const;
+  INLINE double get_total_dt() const;
 
   virtual void output(ostream &out) const;
 
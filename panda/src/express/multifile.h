@@ -55,6 +55,7 @@ PUBLISHED:
   INLINE bool needs_repack() const;
 
   INLINE time_t get_timestamp() const;
+  INLINE streampos get_offset() const;
 
   INLINE void set_record_timestamp(bool record_timestamp);
   INLINE bool get_record_timestamp() const;